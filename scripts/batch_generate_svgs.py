@@ -1,63 +1,302 @@
 """
 Batch generate sitelen ilo pona SVGs for all toki pona Wikipedia titles.
 
-Reads wikidata_tok_labels.csv (qid, label, tok_title) and runs
-generate_sitelen_kalama_pona.generate() for each one.
+Reads the items in the pipeline database (seeded from wikidata_tok_labels.csv
+if it has fewer items than the CSV) and runs generate_sitelen_kalama_pona.generate() once per
+distinct label. Each render's filename, content hash and glyph-set version
+is recorded in the database, and data/output_index.json is rewritten from
+it.
+
+With --changed-only, only labels that have never been rendered or were
+rendered with a different glyph set are generated.
+
+With --shard i/N (1 <= i <= N) only the items whose QID hashes to shard i
+are rendered, so N machines can split the work. A shard writes no
+output_index.json; instead it writes data/shards/shard-i-of-N.json (its
+renders and their QIDs) and data/shards/shard-i-of-N.tar.gz (that index
+plus its SVGs and sidecars). The partition depends only on the QID, so a
+failed shard can be rerun on its own and replaces its previous results.
+--merge unpacks the bundles into output/, refuses to continue if two shards
+produced different files under the same name, and writes the combined
+output_index.json.
+
+--memory-profile reports per-stage memory and the top allocation sites
+(see memory_profile.py); --memory-budget MIB fails the run once peak
+memory goes over the budget.
 
 Usage:
-    python batch_generate_svgs.py
+    python batch_generate_svgs.py [--changed-only] [--memory-profile] [--memory-budget 512]
+    python batch_generate_svgs.py --shard 2/4
+    python batch_generate_svgs.py --merge data/shards/shard-*-of-4.tar.gz
 """
 
+import argparse
 import csv
+import hashlib
+import io
 import json
+import os
 import sys
+import tarfile
 from pathlib import Path
 
 from generate_sitelen_kalama_pona import generate
+from memory_profile import (MemoryBudgetExceeded, add_memory_arguments, memory_from_args,
+                            stage)
+import pipeline_db
+from tracing import add_trace_arguments, span, trace_from_args, traced
 
 SCRIPT_DIR = Path(__file__).parent
 ROOT_DIR = SCRIPT_DIR.parent
+OUTPUT_DIR = ROOT_DIR / 'output'
+CSV_FILE = ROOT_DIR / 'data' / 'wikidata_tok_labels.csv'
+INDEX_FILE = ROOT_DIR / 'data' / 'output_index.json'
+SHARDS_DIR = ROOT_DIR / 'data' / 'shards'
 
+# Renders are committed to the database in groups of this many
+COMMIT_EVERY = 200
 
-def main():
-    csv_file = ROOT_DIR / 'data' / 'wikidata_tok_labels.csv'
-    if not csv_file.exists():
-        print(f'Missing {csv_file} - run fetch_wikidata_sparql.py first',
-              file=sys.stderr)
-        sys.exit(1)
 
-    rows = []
+def seed_items(conn, csv_file):
+    """Fill the items table from wikidata_tok_labels.csv."""
     with open(csv_file, encoding='utf-8', newline='') as f:
-        for row in csv.DictReader(f):
-            rows.append({
-                'qid': row['qid'],
-                'label': row['label'],
-                'tok_title': row.get('tok_title', ''),
-            })
+        pipeline_db.replace_items(conn, csv.DictReader(f))
+
+
+def csv_row_count(csv_file):
+    with open(csv_file, encoding='utf-8', newline='') as f:
+        return sum(1 for _ in csv.DictReader(f))
+
+
+def parse_shard(value):
+    """'i/N' -> (i, N), with 1 <= i <= N."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected i/N, got {value!r}')
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f'shard {index} is not in 1..{count}')
+    return index, count
 
-    print(f'Generating SVGs for {len(rows)} titles...\n')
 
+def shard_of(qid, count):
+    """Stable 1-based shard number of a QID among count shards."""
+    return int(hashlib.sha256(qid.encode('utf-8')).hexdigest()[:8], 16) % count + 1
+
+
+def shard_name(index, count):
+    return f'shard-{index}-of-{count}'
+
+
+@traced()
+def write_index(index):
+    with open(INDEX_FILE, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=None)
+    print(f'Wrote {INDEX_FILE} ({len(index)} entries)')
+
+
+def render(conn, labels, glyph_version, keep_renders=True, memory=None, total=None):
+    """Generate each label of an iterable, recording renders as they finish.
+
+    Returns (successes, [(label, error)], [(label, filename, content_hash)]).
+    Without keep_renders the last list stays empty, so memory does not grow
+    with the number of labels. memory (a MemoryProfiler) is checked against
+    its budget after every database commit. total is only shown in progress
+    lines (default len(labels), if labels has one).
+    """
+    if total is None and hasattr(labels, '__len__'):
+        total = len(labels)
+    of_total = f'/{total}' if total is not None else ''
     success = 0
     failed = []
-    index = {}  # filename -> {qid, tok_title}
+    done = []
+    pending = []  # renders awaiting a database commit
 
-    for i, row in enumerate(rows, 1):
-        label, qid, tok_title = row['label'], row['qid'], row['tok_title']
-        print(f'[{i}/{len(rows)}] {label}')
+    for i, label in enumerate(labels, 1):
+        print(f'[{i}{of_total}] {label}')
         try:
             output_path = generate(label)
             if output_path:
-                index[output_path.name] = {'qid': qid, 'tok_title': tok_title}
+                with span('hash_output'):
+                    content_hash = hashlib.sha256(output_path.read_bytes()).hexdigest()
+                pending.append((label, output_path.name, content_hash))
             success += 1
         except Exception as exc:
             print(f'  ERROR: {exc}')
             failed.append((label, str(exc)))
+        if len(pending) >= COMMIT_EVERY:
+            with span('record_renders'):
+                pipeline_db.record_renders(conn, pending, glyph_version)
+            if keep_renders:
+                done.extend(pending)
+            pending = []
+            if memory:
+                memory.check(f'render ({i}{of_total})')
         print()
+    with span('record_renders'):
+        pipeline_db.record_renders(conn, pending, glyph_version)
+    if keep_renders:
+        done.extend(pending)
+    return success, failed, done
 
-    index_path = ROOT_DIR / 'data' / 'output_index.json'
-    with open(index_path, 'w', encoding='utf-8') as f:
-        json.dump(index, f, ensure_ascii=False, indent=None)
-    print(f'Wrote {index_path} ({len(index)} entries)')
+
+@traced()
+def write_shard(name, items, renders, glyph_version):
+    """Write the shard's index and its bundle of SVGs; returns the bundle path."""
+    qids = {}
+    for item in items:
+        qids.setdefault(item['label'], []).append(
+            {'qid': item['qid'], 'tok_title': item['tok_title']})
+    shard_index = {
+        'shard': name,
+        'glyph_version': glyph_version,
+        'renders': [
+            {'label': label, 'filename': filename, 'content_hash': content_hash,
+             'items': qids.get(label, [])}
+            for label, filename, content_hash in renders
+        ],
+    }
+    data = json.dumps(shard_index, ensure_ascii=False, indent=None).encode('utf-8')
+
+    SHARDS_DIR.mkdir(parents=True, exist_ok=True)
+    index_path = SHARDS_DIR / f'{name}.json'
+    index_path.write_bytes(data)
+
+    bundle_path = SHARDS_DIR / f'{name}.tar.gz'
+    tmp = bundle_path.with_name(bundle_path.name + '.tmp')
+    with tarfile.open(tmp, 'w:gz') as tar:
+        info = tarfile.TarInfo('index.json')
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+        for _, filename, _ in renders:
+            for path in (OUTPUT_DIR / filename, OUTPUT_DIR / f'{filename}.wiki.txt'):
+                if path.exists():
+                    tar.add(path, arcname=f'output/{path.name}')
+    os.replace(tmp, bundle_path)
+    print(f'Wrote {index_path}')
+    print(f'Wrote {bundle_path}')
+    return bundle_path
+
+
+def read_bundle_index(bundle):
+    with tarfile.open(bundle, 'r:gz') as tar:
+        return json.load(tar.extractfile('index.json'))
+
+
+@traced()
+def merge(conn, bundles):
+    """Unpack shard bundles into output/ and record their renders.
+
+    Exits without changing anything if two shards disagree about a filename.
+    """
+    owners = {}      # filename -> (shard, label, content_hash)
+    collisions = []
+    indexes = [read_bundle_index(bundle) for bundle in bundles]
+    for shard_index in indexes:
+        for entry in shard_index['renders']:
+            key = entry['filename']
+            mine = (shard_index['shard'], entry['label'], entry['content_hash'])
+            if key in owners and owners[key][2] != mine[2]:
+                collisions.append((key, owners[key], mine))
+            owners.setdefault(key, mine)
+    if collisions:
+        print(f'{len(collisions)} filename collision(s) between shards:', file=sys.stderr)
+        for filename, (shard_a, label_a, _), (shard_b, label_b, _) in collisions:
+            print(f'  {filename}: {label_a!r} ({shard_a}) vs {label_b!r} ({shard_b})',
+                  file=sys.stderr)
+        sys.exit(1)
+
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    for bundle, shard_index in zip(bundles, indexes):
+        with tarfile.open(bundle, 'r:gz') as tar:
+            for member in tar.getmembers():
+                path = Path(member.name)
+                if not member.isfile() or path.parent.name != 'output' or len(path.parts) != 2:
+                    continue
+                (OUTPUT_DIR / path.name).write_bytes(tar.extractfile(member).read())
+        pipeline_db.record_renders(
+            conn,
+            [(e['label'], e['filename'], e['content_hash']) for e in shard_index['renders']],
+            shard_index['glyph_version'])
+        print(f'Merged {bundle} ({len(shard_index["renders"])} renders)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate SVGs for every Wikidata tok label.')
+    parser.add_argument('--changed-only', action='store_true',
+                        help='only render labels that are new or use an older glyph set')
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help='render only shard i of N (by QID hash) and bundle the results')
+    parser.add_argument('--merge', nargs='+', type=Path, metavar='BUNDLE',
+                        help='combine shard bundles into output/ and output_index.json')
+    add_trace_arguments(parser)
+    add_memory_arguments(parser)
+    args = parser.parse_args()
+    trace_from_args(args)
+    if args.merge and (args.shard or args.changed_only):
+        parser.error('--merge cannot be combined with --shard or --changed-only')
+
+    memory = memory_from_args(args)
+    try:
+        run(args, memory)
+    except MemoryBudgetExceeded as exc:
+        memory.report()
+        print(f'\nMemory budget exceeded: {exc}', file=sys.stderr)
+        sys.exit(1)
+    if memory:
+        memory.report()
+
+
+def run(args, memory):
+    conn = pipeline_db.connect()
+    count = pipeline_db.item_count(conn)
+    if not count and not CSV_FILE.exists():
+        print(f'Missing {CSV_FILE} - run fetch_wikidata_sparql.py first',
+              file=sys.stderr)
+        sys.exit(1)
+    if CSV_FILE.exists() and count < csv_row_count(CSV_FILE):
+        # Empty, or filled by an incremental fetch into a fresh database
+        print(f'Seeding items from {CSV_FILE.name} ({count} in the database)')
+        seed_items(conn, CSV_FILE)
+
+    if args.merge:
+        with stage(memory, 'merge'):
+            merge(conn, args.merge)
+            write_index(pipeline_db.output_index(conn))
+        conn.close()
+        return
+
+    # Labels are streamed from the database rather than loaded up front, so
+    # memory stays flat however many items there are
+    with stage(memory, 'select labels'):
+        glyph_version = pipeline_db.glyph_set_version()
+        in_shard = None
+        if args.shard:
+            shard_index, shard_count = args.shard
+            print(f'Shard {shard_index}/{shard_count}')
+
+            def in_shard(qid):
+                return shard_of(qid, shard_count) == shard_index
+        needs_version = glyph_version if args.changed_only else None
+        total = pipeline_db.label_count(conn, needs_version, in_shard)
+        labels = pipeline_db.iter_labels(conn, needs_version, in_shard)
+
+    print(f'Generating SVGs for {total} titles (glyph set {glyph_version})...\n')
+    with stage(memory, 'render'):
+        success, failed, renders = render(conn, labels, glyph_version,
+                                          keep_renders=bool(args.shard), memory=memory,
+                                          total=total)
+
+    if args.shard:
+        with stage(memory, 'write shard'):
+            items = (item for item in pipeline_db.iter_items(conn) if in_shard(item['qid']))
+            write_shard(shard_name(*args.shard), items, renders, glyph_version)
+    else:
+        with stage(memory, 'write index'):
+            with span('output_index'):
+                index = pipeline_db.output_index(conn)
+            write_index(index)
+    conn.close()
 
     print(f'\nDone! {success} succeeded, {len(failed)} failed.')
     if failed:
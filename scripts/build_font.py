@@ -1,25 +1,77 @@
 """
-Build a downloadable .otf font from the sitelen kalama pona glyph files.
+Build downloadable fonts from the sitelen kalama pona glyph files.
 
 Reads FontForge .glyph files from ..sfdir/ and produces
-sitelen-kalama-pona.otf using fontTools.
+fonts/sitelen-kalama-pona.{otf,woff,woff2,ttf} using fontTools. Parsed
+outlines are cached by file content (see splineset.py), so only edited
+glyphs are parsed again. Outlines are simplified within --tolerance font
+units first (outline_simplify.py).
 
 Each syllable is mapped to a Unicode PUA codepoint starting at U+E100.
 
+Charstrings are specialized and repeated contours moved into global
+subroutines (see cff_optimize.py); the build checks that every outline
+still draws exactly as the plain charstrings do and reports the size saved.
+
+The font is compiled once per charstring variant and the formats are
+exported concurrently in worker processes (see font_export.py). A format
+whose output is byte-identical to the existing file is not rewritten; the
+font timestamp is fixed (FONT_EPOCH, or SOURCE_DATE_EPOCH) so that this
+holds across builds and fresh checkouts.
+
+For the web pages, one WOFF2 subset per onset row (fonts/subsets/) is
+written too, with generated @font-face rules using unicode-range in
+fonts/sitelen-kalama-pona-subsets.css and in the marked block of
+docs/index.html, so browsers download only the rows a page displays.
+
 Usage:
-    python build_font.py
+    python build_font.py [--no-optimize] [--tolerance 1.0 | --no-simplify]
+    python build_font.py --formats otf,woff2 [--no-subsets]
 """
 
-import re
+import argparse
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from fontTools.fontBuilder import FontBuilder
 from fontTools.misc.psCharStrings import T2CharString
+from fontTools.misc.timeTools import epoch_diff
+
+import cff_optimize
+import font_export
+from outline_simplify import add_simplify_arguments, node_count, tolerance_from_args
+from splineset import GlyphCache
 
 SCRIPT_DIR = Path(__file__).parent
 ROOT_DIR = SCRIPT_DIR.parent
 SFDIR = ROOT_DIR / '..sfdir'
+FONTS_DIR = ROOT_DIR / 'fonts'
+FONT_STEM = 'sitelen-kalama-pona'
+FONT_FAMILY = 'Sitelen Kalama Pona'
+SUBSETS_DIR = FONTS_DIR / 'subsets'
+SUBSETS_CSS = FONTS_DIR / f'{FONT_STEM}-subsets.css'
+DOCS_PAGE = ROOT_DIR / 'docs' / 'index.html'
+
+# head.created/modified of every build (Unix time), unless SOURCE_DATE_EPOCH is set:
+# 2026-02-08 07:24:15 UTC, the date of the first released font
+FONT_EPOCH = 1770535455
+
+# docs/index.html lines between these markers are rewritten with the subset rules
+CSS_BEGIN = '/* BEGIN font subsets (generated by scripts/build_font.py) */'
+CSS_END = '/* END font subsets */'
+
+# Output format -> compiled variant it is made from. The OTF gets
+# subroutines; the compressed formats are smaller without them, since the
+# compressor already removes the repetition that subroutines would share.
+EXPORT_SOURCES = {
+    'otf': 'subroutinized',
+    'woff': 'specialized',
+    'woff2': 'specialized',
+    'ttf': 'specialized',
+}
 
 ASCENT = 800
 DESCENT = 200
@@ -37,37 +89,6 @@ for c in CONSONANTS:
 PUA_BASE = 0xE100
 
 
-def parse_splineset(lines):
-    """Parse FontForge SplineSet into a list of contours.
-
-    Each contour is a list of (op, *coords) in absolute coordinates.
-    """
-    contours = []
-    current = []
-    for line in lines:
-        line = line.strip()
-        if not line or line == 'EndSplineSet':
-            break
-        tokens = line.split()
-
-        if len(tokens) >= 3 and tokens[-2] == 'm':
-            if current:
-                contours.append(current)
-                current = []
-            current.append(('m', float(tokens[0]), float(tokens[1])))
-        elif len(tokens) >= 3 and tokens[-2] == 'l':
-            current.append(('l', float(tokens[0]), float(tokens[1])))
-        elif len(tokens) >= 7 and tokens[-2] == 'c':
-            current.append(('c',
-                            float(tokens[0]), float(tokens[1]),
-                            float(tokens[2]), float(tokens[3]),
-                            float(tokens[4]), float(tokens[5])))
-
-    if current:
-        contours.append(current)
-    return contours
-
-
 def contours_to_charstring(contours, width):
     """Convert contours to a T2CharString program (relative coordinates)."""
     program = []
@@ -104,26 +125,23 @@ def contours_to_charstring(contours, width):
     return cs
 
 
-def load_glyph(syllable):
-    """Load a glyph file and return (width, contours) or None."""
-    glyph_name = syllable if syllable and syllable[0] in 'mnptkwjls' else syllable
-    glyph_file = SFDIR / f'{glyph_name}.sitelen_kalama_pona.glyph'
+def load_glyph(syllable, cache, tolerance=None):
+    """Load a glyph file and return (width, contours, nodes before, nodes after) or None.
 
-    if not glyph_file.exists():
-        return None
-
-    content = glyph_file.read_text(encoding='utf-8')
-
-    width_match = re.search(r'Width:\s+(\d+)', content)
-    width = int(width_match.group(1)) if width_match else 1000
+    With a tolerance the outline is simplified first (see outline_simplify.py).
+    """
+    glyph_file = SFDIR / f'{syllable}.sitelen_kalama_pona.glyph'
 
-    spline_match = re.search(r'SplineSet\n(.*?)EndSplineSet', content, re.DOTALL)
-    if not spline_match:
+    if not glyph_file.exists():
         return None
 
-    spline_lines = spline_match.group(1).strip().split('\n')
-    contours = parse_splineset(spline_lines)
-    return width, contours
+    if tolerance is None:
+        result = cache.load(glyph_file)
+        if result is None:
+            return None
+        nodes = node_count(result[1])
+        return result[0], result[1], nodes, nodes
+    return cache.load_simplified(glyph_file, tolerance)
 
 
 def make_notdef_charstring():
@@ -140,43 +158,32 @@ def make_notdef_charstring():
     return cs
 
 
-def main():
-    print('Building sitelen kalama pona font...')
-
-    glyph_data = {}
-    cmap = {}
-
-    for i, syllable in enumerate(SYLLABLES):
-        glyph_name = f'skp.{syllable}'
-        result = load_glyph(syllable)
-        if result is None:
-            print(f'  Skipping {syllable} (no glyph file)')
-            continue
-        glyph_data[glyph_name] = result
-        cmap[PUA_BASE + i] = glyph_name
-        print(f'  Loaded {syllable} -> U+{PUA_BASE + i:04X}')
-
-    if not glyph_data:
-        print('No glyphs loaded!', file=sys.stderr)
-        sys.exit(1)
-
+def make_font(glyph_data, cmap, programs, global_subrs=(), timestamp=None):
+    """Assemble the font from charstring programs (and any global subroutines)."""
     glyph_order = ['.notdef'] + sorted(glyph_data.keys())
 
     fb = FontBuilder(UPM, isTTF=False)
+    if timestamp is not None:
+        fb.font['head'].created = fb.font['head'].modified = timestamp
+        fb.font.recalcTimestamp = False
     fb.setupGlyphOrder(glyph_order)
     fb.setupCharacterMap(cmap)
 
-    # Build charstrings
-    charstrings = {'.notdef': make_notdef_charstring()}
-    for glyph_name, (width, contours) in glyph_data.items():
-        charstrings[glyph_name] = contours_to_charstring(contours, width)
-
+    charstrings = {name: T2CharString(program=program) for name, program in programs.items()}
     fb.setupCFF(
         'SitelenKalamaPona-Regular',
         {'FullName': 'Sitelen Kalama Pona', 'FamilyName': 'Sitelen Kalama Pona'},
         charstrings,
         {},
     )
+    if global_subrs:
+        cff = fb.font['CFF '].cff
+        gsubrs = cff.GlobalSubrs
+        for program in global_subrs:
+            gsubrs.append(T2CharString(program=program, globalSubrs=gsubrs))
+        top = cff.topDictIndex[0]
+        for name in top.CharStrings.keys():
+            top.CharStrings[name].globalSubrs = gsubrs
 
     metrics = {'.notdef': (500, 0)}
     for glyph_name, (width, _) in glyph_data.items():
@@ -199,19 +206,195 @@ def main():
         'styleName': 'Regular',
     })
     fb.setupPost()
+    return fb.font
+
+
+def report_optimization(plain_bytes, compiled, subr_count):
+    """Check optimized outlines against the plain font and print OTF sizes."""
+    sizes = {'plain': len(plain_bytes)}
+    for label, data in compiled.items():
+        mismatches = cff_optimize.outline_mismatches(plain_bytes, data)
+        if mismatches:
+            print(f'{label} outlines differ for: {", ".join(mismatches)}', file=sys.stderr)
+            sys.exit(1)
+        sizes[label] = len(data)
+
+    print(f'\nCharstring optimization ({subr_count} shared subroutines, outlines unchanged):')
+    for label, size in sizes.items():
+        print(f'  {label:14} {size:8,} bytes')
 
-    otf_path = ROOT_DIR / 'fonts' / 'sitelen-kalama-pona.otf'
-    fb.font.save(str(otf_path))
-    print(f'\nWrote {otf_path}')
-
-    # Also save as woff2
-    try:
-        fb.font.flavor = 'woff2'
-        woff2_path = ROOT_DIR / 'fonts' / 'sitelen-kalama-pona.woff2'
-        fb.font.save(str(woff2_path))
-        print(f'Wrote {woff2_path}')
-    except Exception as exc:
-        print(f'WOFF2 export skipped: {exc}')
+
+def source_timestamp():
+    """Font timestamp for the build: SOURCE_DATE_EPOCH, else FONT_EPOCH.
+
+    File mtimes are not used: a fresh checkout resets them, and the build
+    must give the committed bytes wherever it runs.
+    """
+    seconds = int(os.environ.get('SOURCE_DATE_EPOCH') or FONT_EPOCH)
+    return seconds - epoch_diff
+
+
+def subset_rows(cmap):
+    """[(name, unicodes)]: one subset per onset row of the syllable block."""
+    rows = []
+    for row, consonant in enumerate(CONSONANTS):
+        start = PUA_BASE + row * len(VOWELS)
+        unicodes = [cp for cp in range(start, start + len(VOWELS)) if cp in cmap]
+        if unicodes:
+            rows.append((consonant or 'vowel', unicodes))
+    return rows
+
+
+def write_if_changed(path, data):
+    """Atomically write bytes to path unless it already holds them; returns a status."""
+    if path.exists() and path.read_bytes() == data:
+        return 'unchanged'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return f'wrote {path.relative_to(ROOT_DIR)}'
+
+
+def export_fonts(jobs):
+    """Run export jobs concurrently and write their outputs.
+
+    jobs is a list of (label, path, worker, args), where worker(*args)
+    returns (bytes, seconds). Files whose bytes would not change are left
+    alone. Returns {label: size} for the jobs that succeeded, or None if
+    any failed.
+    """
+    sizes = {}
+    failed = False
+    start = time.perf_counter()
+    print('\nExporting:')
+    with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+        futures = [(label, path, pool.submit(worker, *args)) for label, path, worker, args in jobs]
+        for label, path, future in futures:
+            try:
+                data, seconds = future.result()
+            except Exception as exc:
+                print(f'  {label:14} FAILED: {exc}', file=sys.stderr)
+                failed = True
+                continue
+            status = write_if_changed(path, data)
+            sizes[label] = len(data)
+            print(f'  {label:14} {len(data):8,} bytes {seconds * 1000:7.0f} ms  {status}')
+    print(f'  total {(time.perf_counter() - start) * 1000:.0f} ms wall time')
+    return None if failed else sizes
+
+
+def write_subset_css(rows):
+    """Write the subsets' @font-face rules to SUBSETS_CSS and docs/index.html."""
+    css = font_export.font_face_css(
+        FONT_FAMILY, [(f'subsets/{FONT_STEM}-{name}.woff2', u) for name, u in rows])
+    print(f'  {SUBSETS_CSS.name}: {write_if_changed(SUBSETS_CSS, css.encode("utf-8"))}')
+
+    html = DOCS_PAGE.read_text(encoding='utf-8')
+    begin, end = html.find(CSS_BEGIN), html.find(CSS_END)
+    if begin < 0 or end < begin:
+        print(f'{DOCS_PAGE} has no {CSS_BEGIN!r} block; not updated', file=sys.stderr)
+        return
+    line_start = html.rfind('\n', 0, begin) + 1
+    indent = html[line_start:begin]
+    css = font_export.font_face_css(
+        FONT_FAMILY, [(f'../fonts/subsets/{FONT_STEM}-{name}.woff2', u) for name, u in rows],
+        indent)
+    html = html[:begin] + CSS_BEGIN + '\n' + css + indent + html[end:]
+    print(f'  {DOCS_PAGE.name}: {write_if_changed(DOCS_PAGE, html.encode("utf-8"))}')
+
+
+def report_subsets(rows, sizes):
+    """Print each subset's size against the full WOFF2."""
+    full = sizes.get('woff2')
+    total = sum(sizes[f'subset {name}'] for name, _ in rows)
+    print(f'\nWOFF2 subsets ({len(rows)} onset rows, {total:,} bytes in all):')
+    for name, unicodes in rows:
+        size = sizes[f'subset {name}']
+        share = f' ({size / full:.0%} of the full font)' if full else ''
+        print(f'  {name:6} {font_export.unicode_range(unicodes):16} {size:7,} bytes{share}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the sitelen kalama pona font.')
+    parser.add_argument('--no-optimize', action='store_true',
+                        help='write plain rmoveto/rlineto/rrcurveto charstrings')
+    parser.add_argument('--formats', default=','.join(EXPORT_SOURCES),
+                        help=f'comma-separated formats to write (default {",".join(EXPORT_SOURCES)})')
+    parser.add_argument('--no-subsets', action='store_true',
+                        help='skip the per-row WOFF2 subsets and their @font-face rules')
+    add_simplify_arguments(parser)
+    args = parser.parse_args()
+    tolerance = tolerance_from_args(args)
+
+    print('Building sitelen kalama pona font...')
+
+    glyph_data = {}
+    cmap = {}
+    cache = GlyphCache()
+    start = time.perf_counter()
+    total_before = total_after = 0
+
+    for i, syllable in enumerate(SYLLABLES):
+        glyph_name = f'skp.{syllable}'
+        result = load_glyph(syllable, cache, tolerance)
+        if result is None:
+            print(f'  Skipping {syllable} (no glyph file)')
+            continue
+        width, contours, before, after = result
+        glyph_data[glyph_name] = (width, contours)
+        cmap[PUA_BASE + i] = glyph_name
+        total_before += before
+        total_after += after
+        print(f'  Loaded {syllable} -> U+{PUA_BASE + i:04X} ({before} -> {after} nodes)')
+
+    cache.save()
+    print(f'Loaded {len(glyph_data)} glyphs in {(time.perf_counter() - start) * 1000:.0f} ms '
+          f'({cache.report()})')
+    if tolerance is not None:
+        print(f'Simplified outlines within {tolerance:g} units: '
+              f'{total_before} -> {total_after} nodes')
+
+    if not glyph_data:
+        print('No glyphs loaded!', file=sys.stderr)
+        sys.exit(1)
+
+    # Build charstrings
+    programs = {'.notdef': make_notdef_charstring().program}
+    for glyph_name, (width, contours) in glyph_data.items():
+        programs[glyph_name] = contours_to_charstring(contours, width).program
+
+    timestamp = source_timestamp()
+    plain = make_font(glyph_data, cmap, programs, timestamp=timestamp)
+    if args.no_optimize:
+        compiled = dict.fromkeys(('specialized', 'subroutinized'), cff_optimize.font_bytes(plain))
+    else:
+        specialized = {name: cff_optimize.specialize(p) for name, p in programs.items()}
+        subroutinized, subrs = cff_optimize.subroutinize(specialized)
+        compiled = {
+            'specialized': cff_optimize.font_bytes(
+                make_font(glyph_data, cmap, specialized, timestamp=timestamp)),
+            'subroutinized': cff_optimize.font_bytes(
+                make_font(glyph_data, cmap, subroutinized, subrs, timestamp=timestamp)),
+        }
+        report_optimization(cff_optimize.font_bytes(plain), compiled, len(subrs))
+
+    formats = [fmt for fmt in args.formats.split(',') if fmt]
+    unknown = [fmt for fmt in formats if fmt not in EXPORT_SOURCES]
+    if unknown:
+        parser.error(f'unknown format(s): {", ".join(unknown)}')
+    jobs = [(fmt, FONTS_DIR / f'{FONT_STEM}.{fmt}', font_export.export_format,
+             (fmt, compiled[EXPORT_SOURCES[fmt]])) for fmt in formats]
+    rows = [] if args.no_subsets else subset_rows(cmap)
+    for name, unicodes in rows:
+        jobs.append((f'subset {name}', SUBSETS_DIR / f'{FONT_STEM}-{name}.woff2',
+                     font_export.export_subset, (compiled['specialized'], unicodes)))
+    sizes = export_fonts(jobs)
+    if sizes is None:
+        sys.exit(1)
+    if rows:
+        write_subset_css(rows)
+        report_subsets(rows, sizes)
 
     print(f'\nCodepoint mapping ({len(glyph_data)} syllables):')
     for i, syllable in enumerate(SYLLABLES):
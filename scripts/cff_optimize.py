@@ -0,0 +1,140 @@
+"""
+Charstring optimization for build_font.py.
+
+contours_to_charstring() writes every segment as a plain rmoveto, rlineto
+or rrcurveto. Two lossless passes shrink the CFF table:
+
+  specialize()     rewrites each program with fontTools' specializer, which
+                   picks the short operator forms (hlineto/vlineto,
+                   hvcurveto/vhcurveto, ...) and merges runs of them.
+  subroutinize()   moves every contour body (everything after its moveto)
+                   that appears in more than one glyph into a global
+                   subroutine. Many syllables reuse the same onset or vowel
+                   strokes, so whole contours repeat verbatim.
+
+outline_mismatches() draws every glyph of two compiled fonts and lists the
+ones whose outlines differ, so the build can prove nothing moved.
+"""
+
+import io
+from collections import Counter
+
+from fontTools.cffLib.specializer import (commandsToProgram, programToCommands,
+                                          specializeCommands)
+from fontTools.misc.psCharStrings import T2CharString
+from fontTools.pens.recordingPen import DecomposingRecordingPen
+from fontTools.ttLib import TTFont
+
+MOVETO_OPS = ('rmoveto', 'hmoveto', 'vmoveto')
+
+# Bytes for a callgsubr with a one-byte index, and for a subr's return
+CALL_COST = 2
+RETURN_COST = 1
+
+
+def specialize(program):
+    """Return program rewritten with the shortest equivalent operators.
+
+    preserveTopology keeps degenerate curves as curves, so every point the
+    plain program draws is still drawn.
+    """
+    commands = specializeCommands(programToCommands(program), preserveTopology=True)
+    return commandsToProgram(commands)
+
+
+def split_contours(program):
+    """Split a program into (head, [(moveto, body)], tail) command lists.
+
+    head holds the width (if any), each moveto command is followed by the
+    drawing commands of its contour, and tail is the endchar.
+    """
+    head, contours, tail = [], [], []
+    for command in programToCommands(program):
+        op = command[0]
+        if op in MOVETO_OPS:
+            contours.append((command, []))
+        elif op == 'endchar':
+            tail.append(command)
+        elif contours:
+            contours[-1][1].append(command)
+        else:
+            head.append(command)
+    return head, contours, tail
+
+
+def _encoded_size(program):
+    cs = T2CharString(program=program)
+    cs.compile()
+    return len(cs.bytecode)
+
+
+def _subr_bias(count):
+    if count < 1240:
+        return 107
+    if count < 33900:
+        return 1131
+    return 32768
+
+
+def subroutinize(programs):
+    """Share repeated contour bodies between programs.
+
+    programs maps glyph name -> program. Returns (programs, subrs): the
+    rewritten programs and the global subroutine programs they call, most
+    used first so the common ones get one-byte indices.
+    """
+    split = {name: split_contours(program) for name, program in programs.items()}
+    uses = Counter()
+    for _, contours, _ in split.values():
+        for _, body in contours:
+            if body:
+                uses[tuple(commandsToProgram(body))] += 1
+
+    chosen = []
+    for body, count in uses.most_common():
+        if count < 2:
+            break
+        size = _encoded_size(list(body))
+        if (count - 1) * size > count * CALL_COST + RETURN_COST:
+            chosen.append(body)
+    bias = _subr_bias(len(chosen))
+    index = {body: n - bias for n, body in enumerate(chosen)}
+
+    result = {}
+    for name, (head, contours, tail) in split.items():
+        program = commandsToProgram(head)
+        for moveto, body in contours:
+            program += commandsToProgram([moveto])
+            key = tuple(commandsToProgram(body))
+            if key in index:
+                program += [index[key], 'callgsubr']
+            else:
+                program += list(key)
+        program += commandsToProgram(tail)
+        result[name] = program
+
+    subrs = [list(body) + ['return'] for body in chosen]
+    return result, subrs
+
+
+def font_bytes(font):
+    buf = io.BytesIO()
+    font.save(buf)
+    return buf.getvalue()
+
+
+def outline_mismatches(data_a, data_b):
+    """Names of glyphs whose drawn outlines differ between two compiled fonts."""
+    font_a = TTFont(io.BytesIO(data_a))
+    font_b = TTFont(io.BytesIO(data_b))
+    glyphs_a = font_a.getGlyphSet()
+    glyphs_b = font_b.getGlyphSet()
+    mismatches = []
+    for name in font_a.getGlyphOrder():
+        pen_a = DecomposingRecordingPen(glyphs_a)
+        pen_b = DecomposingRecordingPen(glyphs_b)
+        glyphs_a[name].draw(pen_a)
+        glyphs_b[name].draw(pen_b)
+        if pen_a.value != pen_b.value or glyphs_a[name].width != glyphs_b[name].width:
+            mismatches.append(name)
+    return mismatches
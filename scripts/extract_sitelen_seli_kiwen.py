@@ -1,11 +1,28 @@
 """Extract all glyphs from sitelen-seli-kiwen.woff2 into individual SVG files.
 
-Uses uharfbuzz to discover compound word glyphs via ZWJ shaping.
+Compound word glyphs are found by reading the ligature and single
+substitutions of the font's GSUB table: every ligature is traced back to the
+word and ZWJ characters it is built from, which gives the candidate 2- to
+4-word compounds directly. Each candidate is then confirmed by shaping its
+ZWJ sequence with uharfbuzz. The result is cached in .cache/compounds.json,
+keyed by the SHA-256 of the font file.
+
+The WOFF2 is decompressed once in memory; fontTools, HarfBuzz and the
+worker processes that draw and write the SVGs all read those same bytes.
+Files whose content would not change are left untouched.
+
 Outputs files named to match Wikimedia Commons conventions:
   - Individual: 'Sitelen seli kiwen - jan.svg'
   - Compound:   'Sitelen seli kiwen - jan-sewi.svg'
+
+Usage:
+    python extract_sitelen_seli_kiwen.py [--refresh] [--jobs N]
 """
-import sys, io, os, tempfile
+import argparse
+import hashlib
+import json
+import sys, io, os, time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from fontTools.ttLib import TTFont
 from fontTools.pens.svgPathPen import SVGPathPen
@@ -17,6 +34,13 @@ SCRIPT_DIR = Path(__file__).parent
 ROOT_DIR = SCRIPT_DIR.parent
 FONT_PATH = ROOT_DIR / 'fonts' / 'sitelen-seli-kiwen.woff2'
 OUTPUT_DIR = ROOT_DIR / 'sitelen_seli_kiwen_svgs'
+CACHE_FILE = ROOT_DIR / '.cache' / 'compounds.json'
+
+# Bump when discovery changes, so cached results are recomputed
+DISCOVERY_VERSION = 1
+
+# Longest compound the generator's match_compounds() looks for
+MAX_COMPOUND_WORDS = 4
 
 # Word -> F19xx codepoint
 WORDS = {
@@ -60,6 +84,12 @@ WORDS = {
 
 ZWJ = 0x200D
 
+# SVGs each worker task draws and writes
+CHUNK_SIZE = 32
+
+# Set in each worker process by _init_worker(): (TTFont, glyph set)
+_worker_font = None
+
 
 def extract_glyph_svg_by_name(font, glyph_set, glyph_name):
     """Extract a glyph by its internal name as SVG."""
@@ -84,86 +114,242 @@ def extract_glyph_svg_by_name(font, glyph_set, glyph_name):
     return svg
 
 
-def find_compounds_via_harfbuzz(font_path, ttfont):
-    """Use harfbuzz to find all 2-word ZWJ compounds."""
-    # Save as TTF for harfbuzz (it can't read WOFF2 cmap properly)
-    tmp = tempfile.NamedTemporaryFile(suffix='.ttf', delete=False)
-    tmp_path = tmp.name
-    tmp.close()
-    ttfont_copy = TTFont(str(font_path))
-    ttfont_copy.flavor = None
-    ttfont_copy.save(tmp_path)
-    ttfont_copy.close()
-
-    with open(tmp_path, 'rb') as f:
-        font_data = f.read()
-    os.unlink(tmp_path)
-
-    blob = hb.Blob(font_data)
-    face = hb.Face(blob)
-    hb_font = hb.Font(face)
+def decompress_font(font_path):
+    """The font as uncompressed sfnt bytes, decoded from WOFF2 in memory."""
+    # harfbuzz can't read the WOFF2 cmap properly, so give it plain sfnt data
+    font = TTFont(str(font_path))
+    font.flavor = None
+    buf = io.BytesIO()
+    font.save(buf)
+    font.close()
+    return buf.getvalue()
+
+
+def harfbuzz_font(font_data):
+    """An hb.Font over the decompressed font bytes."""
+    return hb.Font(hb.Face(hb.Blob(font_data)))
+
+
+def gsub_substitutions(ttfont):
+    """Return (ligatures, singles) from every GSUB lookup.
+
+    ligatures maps a ligature glyph to the component sequences that form it,
+    singles maps a substituted glyph to the glyphs it replaces. Lookups only
+    reached through contextual rules are included, since every lookup in the
+    list is read.
+    """
+    ligatures = {}
+    singles = {}
+    if 'GSUB' not in ttfont:
+        return ligatures, singles
+    for lookup in ttfont['GSUB'].table.LookupList.Lookup:
+        for subtable in lookup.SubTable:
+            if subtable.LookupType == 7:
+                subtable = subtable.ExtSubTable
+            if subtable.LookupType == 1:
+                for source, target in subtable.mapping.items():
+                    singles.setdefault(target, set()).add(source)
+            elif subtable.LookupType == 4:
+                for first, ligs in subtable.ligatures.items():
+                    for lig in ligs:
+                        ligatures.setdefault(lig.LigGlyph, []).append(
+                            (first, *lig.Component))
+    return ligatures, singles
+
+
+def gsub_compound_candidates(ttfont):
+    """Word sequences of 2..MAX_COMPOUND_WORDS words that some GSUB ligature forms.
+
+    Ligature components are expanded back through other ligatures and single
+    substitutions until they reach glyphs mapped from a word or ZWJ, so
+    compounds built in several steps are found too.
+    """
+    cmap = ttfont.getBestCmap()
+    base = {cmap[cp]: word for word, cp in WORDS.items() if cp in cmap}
+    if ZWJ in cmap:
+        base[cmap[ZWJ]] = None
+    ligatures, singles = gsub_substitutions(ttfont)
+    max_tokens = 2 * MAX_COMPOUND_WORDS - 1  # words with ZWJ between them
+    memo = {}
+
+    def expand(glyph, seen):
+        """Token sequences (word or None for ZWJ) that end up as glyph."""
+        if glyph in base:
+            return {(base[glyph],)}
+        if glyph in memo:
+            return memo[glyph]
+        if glyph in seen:
+            return set()
+        seen = seen | {glyph}
+        sequences = set()
+        for source in singles.get(glyph, ()):
+            sequences |= expand(source, seen)
+        for components in ligatures.get(glyph, ()):
+            partial = {()}
+            for component in components:
+                options = expand(component, seen)
+                partial = {p + o for p in partial for o in options
+                           if len(p) + len(o) <= max_tokens}
+                if not partial:
+                    break
+            sequences |= partial
+        memo[glyph] = sequences
+        return sequences
+
+    candidates = set()
+    for glyph in ligatures:
+        for tokens in expand(glyph, frozenset()):
+            words = tuple(t for t in tokens if t is not None)
+            if 2 <= len(words) <= MAX_COMPOUND_WORDS:
+                candidates.add(words)
+    return sorted(candidates)
+
+
+def shape_compound(hb_font, buf, words):
+    """Glyph id of the single glyph a ZWJ-joined word sequence shapes to, else None.
+
+    buf is reused between calls.
+    """
+    codepoints = [WORDS[words[0]]]
+    for word in words[1:]:
+        codepoints += [ZWJ, WORDS[word]]
+    buf.clear_contents()
+    buf.add_codepoints(codepoints)
+    buf.guess_segment_properties()
+    hb.shape(hb_font, buf, {'calt': True, 'liga': True, 'rlig': True})
+    infos = buf.glyph_infos
+    return infos[0].codepoint if len(infos) == 1 else None
+
+
+def find_compounds_via_harfbuzz(font_data, ttfont):
+    """Find the ZWJ compounds of up to MAX_COMPOUND_WORDS words.
+
+    Candidates come from the GSUB table and are confirmed by shaping.
+    """
+    hb_font = harfbuzz_font(font_data)
+    buf = hb.Buffer()
     glyph_order = ttfont.getGlyphOrder()
-    word_list = sorted(WORDS.keys())
 
+    candidates = gsub_compound_candidates(ttfont)
     compounds = {}
-    for w1 in word_list:
-        for w2 in word_list:
-            buf = hb.Buffer()
-            buf.add_codepoints([WORDS[w1], ZWJ, WORDS[w2]])
-            buf.guess_segment_properties()
-            hb.shape(hb_font, buf, {'calt': True, 'liga': True, 'rlig': True})
-            infos = buf.glyph_infos
-            if len(infos) == 1:
-                gid = infos[0].codepoint
-                gname = glyph_order[gid]
-                compounds[f'{w1}-{w2}'] = gname
+    for words in candidates:
+        gid = shape_compound(hb_font, buf, words)
+        if gid is not None:
+            compounds['-'.join(words)] = glyph_order[gid]
+    print(f'  {len(candidates)} GSUB candidates, {len(compounds)} confirmed by shaping')
+    return compounds
 
+
+def load_compounds(font_path, font_data, ttfont, refresh=False):
+    """find_compounds_via_harfbuzz(), cached by the font file's hash."""
+    font_hash = hashlib.sha256(Path(font_path).read_bytes()).hexdigest()
+    if not refresh and CACHE_FILE.exists():
+        try:
+            with open(CACHE_FILE, encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('version') == DISCOVERY_VERSION and cached.get('font') == font_hash:
+                print(f'  Using cached compounds ({CACHE_FILE.name})')
+                return cached['compounds']
+        except (OSError, ValueError):
+            pass
+
+    compounds = find_compounds_via_harfbuzz(font_data, ttfont)
+    CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE_FILE.with_name(CACHE_FILE.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': DISCOVERY_VERSION, 'font': font_hash, 'compounds': compounds},
+                  f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, CACHE_FILE)
     return compounds
 
 
+def _init_worker(font_data):
+    global _worker_font
+    font = TTFont(io.BytesIO(font_data))
+    _worker_font = (font, font.getGlyphSet())
+
+
+def _write_svgs(jobs):
+    """Worker: draw [(filename, glyph name)] and write the files that changed.
+
+    Returns [(filename, status)] with status 'written', 'unchanged' or 'empty'.
+    """
+    font, glyph_set = _worker_font
+    results = []
+    for filename, glyph_name in jobs:
+        svg = extract_glyph_svg_by_name(font, glyph_set, glyph_name)
+        if not svg:
+            results.append((filename, 'empty'))
+            continue
+        path = OUTPUT_DIR / filename
+        if path.exists() and path.read_text(encoding='utf-8') == svg:
+            results.append((filename, 'unchanged'))
+            continue
+        path.write_text(svg, encoding='utf-8')
+        results.append((filename, 'written'))
+    return results
+
+
+def write_svgs(font_data, jobs, workers):
+    """Draw and write SVGs for [(filename, glyph name)] in a process pool.
+
+    Returns {filename: status}.
+    """
+    chunks = [jobs[i:i + CHUNK_SIZE] for i in range(0, len(jobs), CHUNK_SIZE)]
+    statuses = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(font_data,)) as pool:
+        for results in pool.map(_write_svgs, chunks):
+            statuses.update(results)
+    return statuses
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Extract Sitelen Seli Kiwen glyphs as SVGs.')
+    parser.add_argument('--refresh', action='store_true',
+                        help='rediscover compounds even if the font is unchanged')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='worker processes for drawing and writing SVGs (default: CPU count)')
+    args = parser.parse_args()
+
     OUTPUT_DIR.mkdir(exist_ok=True)
+    start = time.perf_counter()
 
-    font = TTFont(str(FONT_PATH))
-    glyph_set = font.getGlyphSet()
+    font_data = decompress_font(FONT_PATH)
+    font = TTFont(io.BytesIO(font_data))
     cmap = font.getBestCmap()
 
-    # 1. Extract individual words
-    count = 0
+    # 1. Individual words
+    word_jobs = []
     for word, cp in sorted(WORDS.items()):
         if cp not in cmap:
             print(f'  SKIP: {word} (not in cmap)')
             continue
-        glyph_name = cmap[cp]
-        svg = extract_glyph_svg_by_name(font, glyph_set, glyph_name)
-        if svg:
-            filename = f'Sitelen seli kiwen - {word}.svg'
-            (OUTPUT_DIR / filename).write_text(svg, encoding='utf-8')
-            count += 1
-            print(f'  {word}')
-        else:
-            print(f'  SKIP: {word} (no path data)')
-
-    print(f'\nExtracted {count} individual word SVGs')
-
-    # 2. Find and extract compound glyphs via harfbuzz ZWJ shaping
-    print('\nDiscovering compound glyphs via harfbuzz...')
-    compounds = find_compounds_via_harfbuzz(FONT_PATH, font)
-    print(f'Found {len(compounds)} compounds')
-
-    compound_count = 0
-    for name, glyph_name in sorted(compounds.items()):
-        svg = extract_glyph_svg_by_name(font, glyph_set, glyph_name)
-        if svg:
-            filename = f'Sitelen seli kiwen - {name}.svg'
-            (OUTPUT_DIR / filename).write_text(svg, encoding='utf-8')
-            compound_count += 1
-            print(f'  {name}')
-
-    print(f'\nExtracted {compound_count} compound SVGs')
-    print(f'Total: {count + compound_count} SVGs saved to: {OUTPUT_DIR}')
+        word_jobs.append((f'Sitelen seli kiwen - {word}.svg', cmap[cp]))
+
+    # 2. Compound glyphs, found via GSUB and harfbuzz ZWJ shaping
+    print('Discovering compound glyphs via GSUB and harfbuzz...')
+    compounds = load_compounds(FONT_PATH, font_data, font, refresh=args.refresh)
+    print(f'Found {len(compounds)} compounds in {time.perf_counter() - start:.1f}s')
+    compound_jobs = [(f'Sitelen seli kiwen - {name}.svg', glyph_name)
+                     for name, glyph_name in sorted(compounds.items())]
     font.close()
 
+    statuses = write_svgs(font_data, word_jobs + compound_jobs, max(1, args.jobs))
+    for filename, status in statuses.items():
+        if status == 'written':
+            print(f'  wrote {filename}')
+        elif status == 'empty':
+            print(f'  SKIP: {filename} (no path data)')
+
+    count = sum(statuses[f] != 'empty' for f, _ in word_jobs)
+    compound_count = sum(statuses[f] != 'empty' for f, _ in compound_jobs)
+    written = sum(status == 'written' for status in statuses.values())
+    print(f'\nExtracted {count} individual word SVGs and {compound_count} compound SVGs')
+    print(f'Total: {count + compound_count} SVGs in {OUTPUT_DIR} '
+          f'({written} written, {count + compound_count - written} unchanged) '
+          f'in {time.perf_counter() - start:.1f}s')
+
 
 if __name__ == '__main__':
     main()
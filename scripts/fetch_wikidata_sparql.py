@@ -4,127 +4,539 @@ Fetch all Wikidata items that have a Toki Pona (tok) label via SPARQL.
 Outputs data/wikidata_tok_labels.csv with columns: qid, label, tok_title
   tok_title is the tok.wikipedia.org article title (empty if none).
 
+Labels and sitelinks are fetched with wbgetentities in batches of 50, with up
+to --workers batches in flight at once over pooled, gzip-compressed,
+rate-limited connections (see mediawiki_client.py). Rows are streamed into
+the CSV as batches complete, in enumeration order. API responses are cached
+on disk (see http_cache.py), so repeated runs mostly skip the network.
+
+The same wbgetentities calls return each item's claims, so existing P18
+(image) claims are snapshotted into data/wikidata_p18_claims.csv (qid, image)
+without a separate query; generate_quickstatements.py skips the items listed
+there.
+
+The search API stops paging at sroffset 10,000, so enumeration is split into
+disjoint shards: one per haswbstatement filter in SHARD_FILTERS (each
+excluding the filters before it) plus a remainder shard excluding them all.
+Shards are enumerated in parallel, merged with deduplication, and a coverage
+report shows per-shard counts and flags any shard still over the ceiling.
+
+Every run records each item's last revision ID and the run time in
+data/wikidata_tok_revisions.json, and the items table of the pipeline
+database (pipeline_db.py) is brought in line with the CSV. With
+--incremental, the next run only refetches items whose revision changed
+(checked cheaply with prop=info) or that were edited since the last run
+(haslabel:tok search sorted by last edit), merges them and their P18 claims
+into the existing CSVs, and writes the new or relabelled labels to
+data/wikidata_tok_changed.txt for downstream regeneration. Only the changed
+items are written to the database, unless its items table does not match
+the merged CSV (a fresh database, as in CI); then it is reloaded whole. If
+more items were edited than the search can page through (its offset
+ceiling), the run falls back to a full refresh instead.
+
 Usage:
-    python scripts/fetch_wikidata_sparql.py
+    python scripts/fetch_wikidata_sparql.py [--workers 4] [--rate 5]
+    python scripts/fetch_wikidata_sparql.py --incremental
+    python scripts/fetch_wikidata_sparql.py --api-url http://localhost:8000/w/api.php
 """
 
+import argparse
 import csv
 import json
 import sys
-import time
-import urllib.parse
-import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+from http_cache import add_cache_arguments, cache_from_args
+from mediawiki_client import MediaWikiClient
+import pipeline_db
+from tracing import add_trace_arguments, trace_from_args, traced
+
 ROOT_DIR = Path(__file__).parent.parent
 DATA_DIR = ROOT_DIR / 'data'
 
 API_URL = 'https://www.wikidata.org/w/api.php'
-USER_AGENT = 'SitelenBot/1.0 (https://github.com/Emma-Leonhart/Sitelen)'
 
+LABELS_FILE = DATA_DIR / 'wikidata_tok_labels.csv'
+NAMES_FILE = DATA_DIR / 'wikidata_toki_pona_names.txt'
+STATE_FILE = DATA_DIR / 'wikidata_tok_revisions.json'
+CHANGED_FILE = DATA_DIR / 'wikidata_tok_changed.txt'
+CLAIMS_FILE = DATA_DIR / 'wikidata_p18_claims.csv'
+
+ENTITY_BATCH = 50
+SEARCH_OFFSET_LIMIT = 10000
 
-def fetch_wikidata_search(limit=500, continue_token=None):
-    """Fetch items with Toki Pona labels using the Wikidata Search API."""
+# Enumeration shards: common P31 values among tok-labelled items. Any
+# filters give a complete, disjoint partition; add one when the coverage
+# report shows a shard at the offset ceiling.
+SHARD_FILTERS = [
+    'P31=Q5',           # human
+    'P31=Q16521',       # taxon
+    'P31=Q4167836',     # Wikimedia category
+    'P31=Q6256',        # country
+    'P31=Q515',         # city
+]
+# Overlap between incremental windows, to absorb clock skew and search lag
+SINCE_MARGIN = timedelta(hours=1)
+
+
+def fetch_wikidata_search(client, query='haslabel:tok', limit=500, continue_token=None):
+    """Fetch items matching a CirrusSearch query using the Wikidata Search API."""
     params = {
         'action': 'query',
         'list': 'search',
-        'srsearch': 'haslabel:tok',
+        'srsearch': query,
         'srlimit': str(limit),
+        'srinfo': 'totalhits',
+        'srprop': '',
         'format': 'json',
     }
     if continue_token:
         params['sroffset'] = str(continue_token)
+    return client.get(params)
 
-    url = API_URL + '?' + urllib.parse.urlencode(params)
-    req = urllib.request.Request(url, headers={
-        'User-Agent': USER_AGENT,
-    })
-
-    retries = 4
-    delay = 2
-    for attempt in range(retries):
-        try:
-            with urllib.request.urlopen(req, timeout=60) as resp:
-                return json.loads(resp.read().decode('utf-8'))
-        except Exception as exc:
-            if attempt == retries - 1:
-                raise
-            print(f'  Attempt {attempt + 1} failed: {exc}. Retrying in {delay}s...',
-                  file=sys.stderr)
-            time.sleep(delay)
-            delay *= 2
 
+def enumerate_qids(client, query='haslabel:tok', verbose=True):
+    """Return (qids, totalhits) for every item matching query, in search order.
 
-def main():
-    DATA_DIR.mkdir(exist_ok=True)
-    out_path = DATA_DIR / 'wikidata_tok_labels.csv'
-
-    print('Fetching Wikidata items with Toki Pona labels via Search API...')
-
-    rows = []
+    Paging stops at the search API's offset ceiling, so len(qids) can be
+    less than totalhits for queries that match more than 10,000 items.
+    """
+    qids = []
     offset = 0
+    totalhits = 0
 
     while True:
-        data = fetch_wikidata_search(continue_token=offset)
+        data = fetch_wikidata_search(client, query, continue_token=offset)
         if 'query' not in data or 'search' not in data['query']:
             break
 
-        results = data['query']['search']
-        for item in results:
-            qid = item['title']
-            rows.append({'qid': qid, 'label': qid})
+        totalhits = data['query'].get('searchinfo', {}).get('totalhits', totalhits)
+        for item in data['query']['search']:
+            qids.append(item['title'])
 
-        print(f'  ...found {len(rows)} items')
+        if verbose:
+            print(f'  ...found {len(qids)} items')
 
-        if 'continue' in data:
+        if 'continue' in data and data['continue']['sroffset'] < SEARCH_OFFSET_LIMIT:
             offset = data['continue']['sroffset']
         else:
             break
 
-    print(f'Fetching actual "tok" labels and sitelinks for {len(rows)} QIDs...')
-    final_rows = []
+    return qids, totalhits
+
+
+def shard_queries(filters):
+    """Disjoint haslabel:tok queries that together cover every tok-labelled item."""
+    queries = []
+    for i, flt in enumerate(filters):
+        excluded = [f'-haswbstatement:{f}' for f in filters[:i]]
+        queries.append(' '.join(['haslabel:tok', f'haswbstatement:{flt}'] + excluded))
+    queries.append(' '.join(['haslabel:tok'] + [f'-haswbstatement:{f}' for f in filters]))
+    return queries
+
+
+def enumerate_sharded(client, filters, workers=4):
+    """Enumerate all shards concurrently. Returns (deduplicated qids, report).
 
-    for i in range(0, len(rows), 50):
-        batch = rows[i:i+50]
-        qids = '|'.join(r['qid'] for r in batch)
+    report is a list of {'query', 'found', 'totalhits'} in shard order.
+    """
+    queries = shard_queries(filters)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            lambda q: enumerate_qids(client, q, verbose=False), queries))
 
+    merged = {}
+    report = []
+    for query, (qids, totalhits) in zip(queries, results):
+        report.append({'query': query, 'found': len(qids), 'totalhits': totalhits})
+        merged.update(dict.fromkeys(qids))
+    return list(merged), report
+
+
+def print_coverage(report, total):
+    """Print per-shard counts and warn about shards cut off by the offset ceiling."""
+    print('  Shard coverage:')
+    for n, shard in enumerate(report, 1):
+        flag = ''
+        if shard['found'] < shard['totalhits']:
+            flag = f'  <-- TRUNCATED, {shard["totalhits"] - shard["found"]} missing'
+        print(f'    [{n}] {shard["found"]:>6} / {shard["totalhits"]:<6} {shard["query"]}{flag}')
+    found = sum(shard['found'] for shard in report)
+    print(f'  {found} results across {len(report)} shards, {total} unique items')
+    if any(shard['found'] < shard['totalhits'] for shard in report):
+        print('  Warning: some shards hit the search offset ceiling; '
+              'add filters to SHARD_FILTERS', file=sys.stderr)
+
+
+class SearchCeilingReached(Exception):
+    """Raised when the edited-since search stops paging before it reaches since."""
+
+
+def search_edited_since(client, since, limit=500):
+    """Return QIDs with a tok label whose last edit is at or after since (ISO 8601).
+
+    Raises SearchCeilingReached if the search stops returning results (at the
+    offset ceiling) before reaching an item edited before since, rather than
+    returning a list that silently misses the rest.
+    """
+    qids = []
+    offset = 0
+    while True:
         params = {
-            'action': 'wbgetentities',
-            'ids': qids,
-            'props': 'labels|sitelinks',
-            'languages': 'tok',
-            'sitefilter': 'tokwiki',
+            'action': 'query',
+            'list': 'search',
+            'srsearch': 'haslabel:tok',
+            'srsort': 'last_edit_desc',
+            'srprop': 'timestamp',
+            'srinfo': 'totalhits',
+            'srlimit': str(limit),
             'format': 'json',
         }
-        url = API_URL + '?' + urllib.parse.urlencode(params)
-        req = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+        if offset:
+            params['sroffset'] = str(offset)
+        data = client.get(params)
+        results = data.get('query', {}).get('search', [])
+        for item in results:
+            if item['timestamp'] < since:
+                return qids
+            qids.append(item['title'])
+        if 'continue' in data and data['continue']['sroffset'] < SEARCH_OFFSET_LIMIT:
+            offset = data['continue']['sroffset']
+            continue
+        totalhits = data.get('query', {}).get('searchinfo', {}).get('totalhits', 0)
+        if offset + len(results) < totalhits:
+            raise SearchCeilingReached(
+                f'more than {len(qids)} tok-labelled items were edited since {since}; '
+                f'the search stopped at offset {offset + len(results)} of {totalhits}')
+        return qids
 
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            data = json.loads(resp.read().decode('utf-8'))
 
-        entities = data.get('entities', {})
-        for qid, entity in entities.items():
-            label_obj = entity.get('labels', {}).get('tok', {})
-            label = label_obj.get('value')
-            if label:
-                tok_title = entity.get('sitelinks', {}).get('tokwiki', {}).get('title', '')
-                final_rows.append({'qid': qid, 'label': label, 'tok_title': tok_title})
+def fetch_lastrevids(client, qids):
+    """Return {qid: lastrevid} for the existing items among qids."""
+    data = client.get({
+        'action': 'query',
+        'prop': 'info',
+        'titles': '|'.join(qids),
+        'format': 'json',
+    })
+    revids = {}
+    for page in data.get('query', {}).get('pages', {}).values():
+        if 'missing' not in page:
+            revids[page['title']] = page['lastrevid']
+    return revids
+
+
+def p18_image(entity):
+    """The Commons filename of an entity's first non-deprecated P18 claim, or ''."""
+    for claim in entity.get('claims', {}).get('P18', []):
+        value = claim.get('mainsnak', {}).get('datavalue', {}).get('value')
+        if value and claim.get('rank') != 'deprecated':
+            return value
+    return ''
 
-        if (i // 50) % 5 == 0:
-            print(f'  Progress: {len(final_rows)} labels fetched')
 
-    with open(out_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=['qid', 'label', 'tok_title'])
+def fetch_entity_batch(client, qids, claims=True):
+    """Return [{'qid', 'label', 'tok_title', 'revision', 'image'}] for the tok-labelled items in qids.
+
+    image is the item's P18 filename ('' if none); without claims it is not
+    requested and always ''.
+    """
+    # lastrevid is only returned with info
+    props = 'info|labels|sitelinks|claims' if claims else 'info|labels|sitelinks'
+    data = client.get({
+        'action': 'wbgetentities',
+        'ids': '|'.join(qids),
+        'props': props,
+        'languages': 'tok',
+        'sitefilter': 'tokwiki',
+        'format': 'json',
+    })
+
+    rows = []
+    entities = data.get('entities', {})
+    for qid in qids:
+        entity = entities.get(qid, {})
+        label = entity.get('labels', {}).get('tok', {}).get('value')
+        if label:
+            tok_title = entity.get('sitelinks', {}).get('tokwiki', {}).get('title', '')
+            rows.append({'qid': qid, 'label': label, 'tok_title': tok_title,
+                         'revision': entity.get('lastrevid'), 'image': p18_image(entity)})
+    return rows
+
+
+def iter_batched(fetch, client, qids, workers=4):
+    """Run fetch(client, batch) over 50-QID batches concurrently, yielding in order.
+
+    At most 2 * workers batches are queued at a time, so memory stays bounded
+    however many QIDs there are.
+    """
+    batches = (qids[i:i + ENTITY_BATCH] for i in range(0, len(qids), ENTITY_BATCH))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(fetch, client, batch))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_entity_rows(client, qids, workers=4, claims=True):
+    """Fetch entity batches concurrently, yielding row lists in batch order."""
+    return iter_batched(partial(fetch_entity_batch, claims=claims), client, qids, workers)
+
+
+def check_revisions(revisions):
+    """Warn about items fetched without a revision ID.
+
+    The next incremental run would refetch them all as changed.
+    """
+    missing = [qid for qid, revision in revisions.items() if revision is None]
+    if missing:
+        print(f'  Warning: no lastrevid for {len(missing)} items (e.g. {missing[0]}); '
+              'they will be refetched on the next incremental run', file=sys.stderr)
+
+
+def load_state():
+    """Return (last_run, {qid: revision}) from the revision state file."""
+    if not STATE_FILE.exists():
+        return None, {}
+    with open(STATE_FILE, encoding='utf-8') as f:
+        state = json.load(f)
+    return state.get('last_run'), state.get('revisions', {})
+
+
+def save_state(started, revisions):
+    with open(STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'last_run': started, 'revisions': revisions}, f, indent=None)
+
+
+def read_label_rows():
+    """Return the current wikidata_tok_labels.csv rows, in file order."""
+    with open(LABELS_FILE, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def read_p18_claims(claims_path=None):
+    """Return {qid: image} from the P18 claims snapshot, or {} if there is none."""
+    claims_path = claims_path or CLAIMS_FILE
+    if not claims_path.exists():
+        return {}
+    with open(claims_path, encoding='utf-8', newline='') as f:
+        return {row['qid']: row['image'] for row in csv.DictReader(f)}
+
+
+def write_p18_claims(images, claims_path=None):
+    """Write {qid: image} as the P18 claims snapshot."""
+    claims_path = claims_path or CLAIMS_FILE
+    tmp = claims_path.with_suffix('.csv.tmp')
+    with open(tmp, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['qid', 'image'])
+        writer.writerows(images.items())
+    tmp.replace(claims_path)
+    print(f'Wrote {claims_path} ({len(images)} items with P18)')
+
+
+@traced()
+def write_label_files(rows, labels_path=None, names_path=None):
+    """Stream rows into the labels CSV and names file. Returns the row count.
+
+    Writes go to temp files first so a failed run leaves the previous
+    outputs intact.
+    """
+    labels_path = labels_path or LABELS_FILE
+    names_path = names_path or NAMES_FILE
+    out_tmp = labels_path.with_suffix('.csv.tmp')
+    names_tmp = names_path.with_suffix('.txt.tmp')
+    total = 0
+    with open(out_tmp, 'w', newline='', encoding='utf-8') as f, \
+            open(names_tmp, 'w', encoding='utf-8') as names:
+        writer = csv.DictWriter(f, fieldnames=['qid', 'label', 'tok_title'],
+                                extrasaction='ignore')
         writer.writeheader()
-        writer.writerows(final_rows)
+        for row in rows:
+            writer.writerow(row)
+            names.write(row['label'] + '\n')
+            total += 1
+    out_tmp.replace(labels_path)
+    names_tmp.replace(names_path)
+    return total
 
-    print(f'Total found {len(final_rows)} items with "tok" labels. Wrote {out_path}')
 
-    names_path = DATA_DIR / 'wikidata_toki_pona_names.txt'
-    with open(names_path, 'w', encoding='utf-8') as f:
-        for row in final_rows:
-            f.write(row['label'] + '\n')
-    print(f'Wrote {names_path}')
+@traced()
+def full_refresh(client, conn, workers, filters=SHARD_FILTERS, claims=True):
+    """Enumerate and fetch every tok-labelled item. Returns {qid: revision}.
+
+    With claims, the P18 snapshot is rewritten from the fetched items.
+    """
+    print(f'Fetching Wikidata items with Toki Pona labels via Search API '
+          f'({len(filters) + 1} shards)...')
+    qids, report = enumerate_sharded(client, filters, workers)
+    print_coverage(report, len(qids))
+
+    print(f'Fetching actual "tok" labels and sitelinks for {len(qids)} QIDs '
+          f'({workers} workers)...')
+    revisions = {}
+    images = {}
+
+    def rows():
+        fetched = 0
+        for n, batch in enumerate(iter_entity_rows(client, qids, workers, claims)):
+            for row in batch:
+                revisions[row['qid']] = row['revision']
+                if row['image']:
+                    images[row['qid']] = row['image']
+                yield row
+            fetched += len(batch)
+            if n % 5 == 0:
+                print(f'  Progress: {fetched} labels fetched')
+
+    total = write_label_files(rows())
+    print(f'Total found {total} items with "tok" labels. Wrote {LABELS_FILE}')
+    check_revisions(revisions)
+    pipeline_db.replace_items(conn, (dict(row, revision=revisions.get(row['qid']))
+                                     for row in read_label_rows()))
+    if claims:
+        write_p18_claims(images)
+    return revisions
+
+
+@traced()
+def incremental_refresh(client, conn, workers, last_run, revisions, claims=True):
+    """Refetch only items changed since last_run and merge them into the CSV.
+
+    With claims, their P18 claims are merged into the snapshot too. Returns
+    the updated {qid: revision}.
+    """
+    known = list(revisions)
+    print(f'Checking revisions of {len(known)} known items...')
+    current = {}
+    for batch in iter_batched(fetch_lastrevids, client, known, workers):
+        current.update(batch)
+    changed = {qid for qid in known if current.get(qid) != revisions[qid]}
+    print(f'  {len(changed)} known items changed or deleted')
+
+    since = datetime.fromisoformat(last_run.replace('Z', '+00:00')) - SINCE_MARGIN
+    edited = search_edited_since(client, since.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    new = set(edited) - set(revisions)
+    print(f'  {len(edited)} tok-labelled items edited since {last_run}, {len(new)} new')
+    changed |= new
+
+    fetched = {}
+    for batch in iter_entity_rows(client, sorted(changed), workers, claims):
+        for row in batch:
+            fetched[row['qid']] = row
+
+    merged = []
+    updated = []
+    relabelled = []
+    for row in read_label_rows():
+        qid = row['qid']
+        if qid not in changed:
+            merged.append(row)
+            continue
+        update = fetched.pop(qid, None)
+        if update is None:
+            continue
+        if update['label'] != row['label']:
+            relabelled.append(update['label'])
+        merged.append(update)
+        updated.append(update)
+    # Whatever is left was not in the CSV before
+    for qid in sorted(fetched):
+        merged.append(fetched[qid])
+        updated.append(fetched[qid])
+        relabelled.append(fetched[qid]['label'])
+    for row in updated:
+        revisions[row['qid']] = row['revision']
+    check_revisions({row['qid']: row['revision'] for row in updated})
+    # Deleted items and items whose tok label was removed
+    removed = changed - {row['qid'] for row in merged}
+    for qid in removed:
+        revisions.pop(qid, None)
+
+    total = write_label_files(merged)
+    pipeline_db.upsert_items(conn, updated, removed)
+    if pipeline_db.item_count(conn) != total:
+        # A fresh or stale database (CI starts without one): load the whole merged CSV
+        print(f'  Items table out of step with the CSV; reloading all {total} items')
+        pipeline_db.replace_items(conn, (dict(row, revision=revisions.get(row['qid']))
+                                         for row in merged))
+    if claims:
+        if not CLAIMS_FILE.exists():
+            print(f'No {CLAIMS_FILE.name} yet: it will only list the changed items '
+                  'until the next full refresh', file=sys.stderr)
+        images = read_p18_claims()
+        for qid in changed:
+            images.pop(qid, None)
+        images.update((row['qid'], row['image']) for row in updated if row['image'])
+        write_p18_claims(images)
+    with open(CHANGED_FILE, 'w', encoding='utf-8') as f:
+        for label in relabelled:
+            f.write(label + '\n')
+    print(f'Merged {len(changed)} changed items: {len(relabelled)} new or relabelled, '
+          f'{len(removed)} removed, {total} total. Wrote {LABELS_FILE}')
+    print(f'Wrote {CHANGED_FILE} ({len(relabelled)} labels to regenerate)')
+    return revisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch Wikidata items with tok labels.')
+    parser.add_argument('--api-url', default=API_URL,
+                        help='MediaWiki api.php to query (default: Wikidata)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='concurrent wbgetentities requests (default 4)')
+    parser.add_argument('--rate', type=float, default=5.0,
+                        help='maximum requests per second across all workers (default 5)')
+    parser.add_argument('--skip-p18', action='store_true',
+                        help='do not fetch claims or refresh the P18 claims snapshot')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only refetch items changed since the last run')
+    parser.add_argument('--shard-filter', action='append', metavar='PROP=VALUE',
+                        help='haswbstatement filter defining an enumeration shard '
+                             '(repeatable; replaces SHARD_FILTERS)')
+    add_cache_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    trace_from_args(args)
+
+    DATA_DIR.mkdir(exist_ok=True)
+    started = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    last_run, revisions = load_state()
+    incremental = args.incremental and last_run and LABELS_FILE.exists()
+    if args.incremental and not incremental:
+        print('No previous revision state — falling back to a full refresh')
+
+    # Cached responses could hide new revisions, so incremental runs go direct
+    cache = None if incremental else cache_from_args(args)
+    client = MediaWikiClient(args.api_url, rate=args.rate, burst=args.workers,
+                             cache=cache)
+
+    conn = pipeline_db.connect()
+    if incremental:
+        try:
+            revisions = incremental_refresh(client, conn, args.workers, last_run, revisions,
+                                            claims=not args.skip_p18)
+        except SearchCeilingReached as exc:
+            print(f'Incremental refresh incomplete: {exc}', file=sys.stderr)
+            print('Falling back to a full refresh', file=sys.stderr)
+            incremental = False
+    if not incremental:
+        revisions = full_refresh(client, conn, args.workers,
+                                 args.shard_filter or SHARD_FILTERS, claims=not args.skip_p18)
+    conn.close()
+    client.close()
+    save_state(started, revisions)
+
+    print(f'Wrote {NAMES_FILE}')
+    print(f'Wrote {STATE_FILE}')
+    if client.cache:
+        print(client.cache.report())
 
 
 if __name__ == '__main__':
@@ -1,17 +1,82 @@
+"""
+Fetch all mainspace page titles from toki pona Wikipedia via the allpages API.
+
+Outputs data/wikidata_toki_pona.csv with columns: pageid, title
+
+Rows are appended to the CSV as each 500-page batch arrives. After every
+batch the apcontinue token and the CSV's byte length are saved to a
+checkpoint file next to it, so a rerun after a network error resumes where
+the last one stopped (truncating any rows written after the checkpoint).
+The checkpoint is removed once the crawl completes; --restart ignores it.
+A checkpoint also records the apfrom/apto range it was made for, and one
+for a different range (a rerun with other --split boundaries) is discarded
+and that file crawled again from the start.
+
+With --split the title space is cut into apfrom/apto ranges at the given
+boundaries and the ranges are crawled concurrently, each into its own
+checkpointed part file. The parts are concatenated in range order when
+all of them are done.
+
+Usage:
+    python scripts/fetch_wikidata_toki_pona.py
+    python scripts/fetch_wikidata_toki_pona.py --split "jan,kalama,ma,pona,t" --workers 6
+    python scripts/fetch_wikidata_toki_pona.py --api-url http://localhost:8000/w/api.php
+"""
+
+import argparse
 import csv
 import json
-import sys
-import urllib.parse
-import urllib.request
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from http_cache import add_cache_arguments, cache_from_args
+from mediawiki_client import MediaWikiClient
+from tracing import add_trace_arguments, span, trace_from_args, traced
+
 API_URL = "https://tok.wikipedia.org/w/api.php"
 USER_AGENT = "SitelenBot/1.0 (https://github.com/immanuelle-leonhart/Sitelen)"
 
+DATA_DIR = Path(__file__).parent.parent / "data"
+OUT_PATH = DATA_DIR / "wikidata_toki_pona.csv"
+
+
+def checkpoint_path(csv_path):
+    return csv_path.with_name(csv_path.name + ".checkpoint.json")
+
+
+def load_checkpoint(csv_path):
+    path = checkpoint_path(csv_path)
+    if not path.exists() or not csv_path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(csv_path, state):
+    path = checkpoint_path(csv_path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
 
-def fetch_all_pages():
-    """Fetch all mainspace pages from toki pona Wikipedia via allpages API."""
-    pages = []
+def normalize_title(title):
+    """Title as MediaWiki stores it: spaces for underscores, first letter capitalized."""
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+@traced()
+def crawl_range(client, csv_path, apfrom=None, apto=None, label="", restart=False):
+    """Crawl allpages from apfrom up to (not including) apto into csv_path.
+
+    Resumes from csv_path's checkpoint unless restart is set. Returns the
+    number of pages in the file.
+    """
+    # The API normalizes apfrom/apto; compare titles against the same form
+    apfrom = normalize_title(apfrom) if apfrom else None
+    apto = normalize_title(apto) if apto else None
     params = {
         "action": "query",
         "list": "allpages",
@@ -19,37 +84,125 @@ def fetch_all_pages():
         "aplimit": "500",
         "format": "json",
     }
-    while True:
-        url = API_URL + "?" + urllib.parse.urlencode(params)
-        req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
+    if apfrom:
+        params["apfrom"] = apfrom
+    if apto:
+        # apto is inclusive; titles equal to the bound are dropped below
+        params["apto"] = apto
+
+    state = None if restart else load_checkpoint(csv_path)
+    if state and (state.get("apfrom"), state.get("apto")) != (apfrom, apto):
+        print(f"  {label}checkpoint is for a different range; starting over")
+        state = None
+    if state and state.get("done"):
+        print(f"  {label}already complete ({state['pages']} pages)")
+        return state["pages"]
+
+    if state:
+        params["apcontinue"] = state["apcontinue"]
+        f = open(csv_path, "r+", newline="", encoding="utf-8")
+        f.truncate(state["offset"])
+        f.seek(state["offset"])
+        pages = state["pages"]
+        print(f"  {label}resuming after {pages} pages")
+    else:
+        f = open(csv_path, "w", newline="", encoding="utf-8")
+        csv.writer(f).writerow(["pageid", "title"])
+        pages = 0
+
+    with f:
+        writer = csv.writer(f)
+        while True:
+            data = client.get(params)
 
-        for p in data["query"]["allpages"]:
-            pages.append({"pageid": p["pageid"], "title": p["title"]})
+            for p in data["query"]["allpages"]:
+                if apto and p["title"] >= apto:
+                    continue
+                writer.writerow([p["pageid"], p["title"]])
+                pages += 1
+            with span("write_csv"):
+                f.flush()
 
-        if "continue" in data:
+            if "continue" not in data:
+                break
             params["apcontinue"] = data["continue"]["apcontinue"]
-            print(f"  ...{len(pages)} pages so far")
-        else:
-            break
+            save_checkpoint(csv_path, {
+                "apfrom": apfrom,
+                "apto": apto,
+                "apcontinue": params["apcontinue"],
+                "offset": f.tell(),
+                "pages": pages,
+            })
+            print(f"  {label}...{pages} pages so far")
 
+    save_checkpoint(csv_path, {"apfrom": apfrom, "apto": apto, "done": True, "pages": pages})
     return pages
 
 
+def split_ranges(boundaries):
+    """[(apfrom, apto), ...] covering the whole title space, cut at boundaries."""
+    bounds = [None] + sorted({normalize_title(b) for b in boundaries}) + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def concatenate_parts(part_paths, out_path):
+    """Join part CSVs (each with a header) into out_path with a single header."""
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with open(tmp, "w", newline="", encoding="utf-8") as out:
+        for n, part in enumerate(part_paths):
+            with open(part, encoding="utf-8", newline="") as f:
+                header = f.readline()
+                if n == 0:
+                    out.write(header)
+                for line in f:
+                    out.write(line)
+    os.replace(tmp, out_path)
+
+
 def main():
-    out_path = Path(__file__).parent.parent / "data" / "wikidata_toki_pona.csv"
+    parser = argparse.ArgumentParser(description="Fetch all tok.wikipedia mainspace titles.")
+    parser.add_argument("--api-url", default=API_URL,
+                        help="MediaWiki api.php to query (default: tok.wikipedia)")
+    parser.add_argument("--split", default="",
+                        help="comma-separated title boundaries to crawl as concurrent ranges")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="concurrent range crawls when --split is used (default 4)")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore checkpoints and crawl from the beginning")
+    add_cache_arguments(parser)
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    trace_from_args(args)
 
-    print("Fetching all pages from tok.wikipedia.org...")
-    pages = fetch_all_pages()
+    boundaries = [b for b in args.split.split(",") if b]
+    client = MediaWikiClient(args.api_url, user_agent=USER_AGENT,
+                             burst=max(1, args.workers), cache=cache_from_args(args))
 
-    with open(out_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["pageid", "title"])
-        for p in pages:
-            writer.writerow([p["pageid"], p["title"]])
+    print(f"Fetching all pages from {args.api_url}...")
+    if not boundaries:
+        total = crawl_range(client, OUT_PATH, restart=args.restart)
+    else:
+        ranges = split_ranges(boundaries)
+        part_paths = [OUT_PATH.with_name(f"{OUT_PATH.stem}.part-{n:02d}.csv")
+                      for n in range(len(ranges))]
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = [
+                pool.submit(crawl_range, client, part, apfrom, apto,
+                            f"[{apfrom or '^'}..{apto or '$'}) ", args.restart)
+                for part, (apfrom, apto) in zip(part_paths, ranges)
+            ]
+            total = sum(future.result() for future in futures)
+        with span("concatenate_parts"):
+            concatenate_parts(part_paths, OUT_PATH)
+        for part in part_paths:
+            part.unlink()
+            checkpoint_path(part).unlink()
+    client.close()
 
-    print(f"Wrote {len(pages)} pages to {out_path}")
+    checkpoint_path(OUT_PATH).unlink(missing_ok=True)
+    print(f"Wrote {total} pages to {OUT_PATH}")
+    if client.cache:
+        print(client.cache.report())
 
 
 if __name__ == "__main__":
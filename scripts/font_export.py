@@ -0,0 +1,136 @@
+"""
+Font file export for build_font.py.
+
+build_font.py compiles the font once per charstring variant and hands the
+compiled bytes to export_format() in a process pool, one job per output
+format, so the slow WOFF2 Brotli pass runs alongside the others:
+
+  otf    the compiled CFF font as is
+  woff   zlib-compressed WOFF 1.0
+  woff2  Brotli-compressed WOFF 2.0
+  ttf    TrueType with quadratic outlines converted from the cubic CFF
+         ones by cu2qu (within MAX_ERR font units)
+
+otf_to_ttf() follows fontTools' snippets/otf2ttf.py.
+
+export_subset() runs in the same pool and writes a WOFF2 holding only some
+codepoints; font_face_css() writes the matching @font-face rules, whose
+unicode-range lets a browser fetch just the subsets a page displays.
+"""
+
+import io
+import time
+
+from fontTools import subset
+from fontTools.pens.cu2quPen import Cu2QuPen
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont, newTable
+
+from cff_optimize import font_bytes
+
+# cu2qu approximation error in font units
+MAX_ERR = 1.0
+
+# CFF outlines run counter-clockwise, TrueType outlines clockwise
+REVERSE_DIRECTION = True
+
+
+def glyphs_to_quadratic(glyphs, max_err=MAX_ERR, reverse_direction=REVERSE_DIRECTION):
+    """{name: glyf Glyph} with every glyph of a glyph set converted to quadratics."""
+    quad_glyphs = {}
+    for name in glyphs.keys():
+        tt_pen = TTGlyphPen(glyphs)
+        glyphs[name].draw(Cu2QuPen(tt_pen, max_err, reverse_direction=reverse_direction))
+        quad_glyphs[name] = tt_pen.glyph()
+    return quad_glyphs
+
+
+def otf_to_ttf(font, max_err=MAX_ERR):
+    """Replace a CFF font's outlines with quadratic glyf outlines, in place."""
+    glyph_order = font.getGlyphOrder()
+    font['loca'] = newTable('loca')
+    font['glyf'] = glyf = newTable('glyf')
+    glyf.glyphOrder = glyph_order
+    glyf.glyphs = glyphs_to_quadratic(font.getGlyphSet(), max_err)
+    del font['CFF ']
+    glyf.compile(font)
+
+    hmtx = font['hmtx']
+    for name, glyph in glyf.glyphs.items():
+        if hasattr(glyph, 'xMin'):
+            hmtx[name] = (hmtx[name][0], glyph.xMin)
+
+    font['maxp'] = maxp = newTable('maxp')
+    maxp.tableVersion = 0x00010000
+    maxp.maxZones = 1
+    maxp.maxTwilightPoints = 0
+    maxp.maxStorage = 0
+    maxp.maxFunctionDefs = 0
+    maxp.maxInstructionDefs = 0
+    maxp.maxStackElements = 0
+    maxp.maxSizeOfInstructions = 0
+    maxp.maxComponentElements = 0
+    maxp.compile(font)
+
+    post = font['post']
+    post.formatType = 2.0
+    post.extraNames = []
+    post.mapping = {}
+    post.glyphOrder = glyph_order
+    font.sfntVersion = '\000\001\000\000'
+
+
+def export_format(fmt, data):
+    """Worker: convert compiled OTF bytes to fmt. Returns (bytes, seconds)."""
+    start = time.perf_counter()
+    if fmt == 'otf':
+        out = data
+    else:
+        # Keep head.modified as compiled, so unchanged sources give identical files
+        font = TTFont(io.BytesIO(data), recalcTimestamp=False)
+        if fmt == 'ttf':
+            otf_to_ttf(font)
+        else:
+            font.flavor = fmt
+        out = font_bytes(font)
+    return out, time.perf_counter() - start
+
+
+def export_subset(data, unicodes):
+    """Worker: a WOFF2 of the compiled font cut down to unicodes. Returns (bytes, seconds)."""
+    start = time.perf_counter()
+    font = TTFont(io.BytesIO(data), recalcTimestamp=False)
+    options = subset.Options()
+    options.name_IDs = ['*']
+    options.name_languages = ['*']
+    options.notdef_outline = True
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=unicodes)
+    subsetter.subset(font)
+    font.flavor = 'woff2'
+    return font_bytes(font), time.perf_counter() - start
+
+
+def unicode_range(unicodes):
+    """Sorted codepoints -> CSS unicode-range value, e.g. 'U+E100-E109, U+E10C'."""
+    ranges = []
+    for cp in sorted(unicodes):
+        if ranges and cp == ranges[-1][1] + 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    return ', '.join(f'U+{lo:X}' if lo == hi else f'U+{lo:X}-{hi:X}' for lo, hi in ranges)
+
+
+def font_face_css(family, subsets, indent=''):
+    """@font-face rules for [(url, unicodes)], one per subset."""
+    rules = []
+    for url, unicodes in subsets:
+        rules.append(
+            f"{indent}@font-face {{\n"
+            f"{indent}  font-family: '{family}';\n"
+            f"{indent}  src: url('{url}') format('woff2');\n"
+            f"{indent}  unicode-range: {unicode_range(unicodes)};\n"
+            f"{indent}  font-display: swap;\n"
+            f"{indent}}}\n")
+    return ''.join(rules)
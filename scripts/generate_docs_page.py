@@ -0,0 +1,106 @@
+"""
+Prerender the glyph grid and codepoint table of docs/index.html.
+
+The page used to build both in JavaScript on load. This writes them as
+static HTML between marker comments instead, so the glyphs paint without
+running any script. Syllable order and codepoints come from build_font.py
+and the glyph list from the built font's cmap, so the page follows the
+font: run it after build_font.py (run_pipeline.py does).
+
+It also writes <link rel="preload"> hints in <head> for the font files
+that the specimen at the top of the page needs: the WOFF2 subsets of its
+onset rows, or the full WOFF2 when there are no subsets.
+
+Usage:
+    python generate_docs_page.py
+"""
+
+import re
+import sys
+
+from fontTools.ttLib import TTFont
+
+from build_font import (DOCS_PAGE, FONT_STEM, FONTS_DIR, PUA_BASE, SUBSETS_DIR, SYLLABLES,
+                        subset_rows)
+
+FONT_FILE = FONTS_DIR / f'{FONT_STEM}.otf'
+
+# Codepoint table entries per row (row-major: each row is one onset)
+PER_ROW = 10
+
+SPECIMEN_RE = re.compile(r'<div class="specimen-big">(.*?)</div>', re.DOTALL)
+ENTITY_RE = re.compile(r'&#x([0-9A-Fa-f]+);?')
+
+
+def font_syllables():
+    """[(codepoint, syllable)] for every syllable the built font maps."""
+    cmap = TTFont(FONT_FILE, lazy=True).getBestCmap()
+    return [(PUA_BASE + i, syllable) for i, syllable in enumerate(SYLLABLES)
+            if PUA_BASE + i in cmap]
+
+
+def glyph_grid(syllables):
+    return [f'<div class="glyph-cell"><span class="glyph">&#x{cp:X};</span>'
+            f'<span class="label">{syllable}</span></div>' for cp, syllable in syllables]
+
+
+def codepoint_table(syllables):
+    by_cp = dict(syllables)
+    rows = []
+    for start in range(0, len(SYLLABLES), PER_ROW):
+        cells = []
+        for cp in range(PUA_BASE + start, PUA_BASE + start + PER_ROW):
+            if cp in by_cp:
+                cells.append(f'<td class="cp">U+{cp:X}</td><td class="syl">{by_cp[cp]}</td>'
+                             f'<td class="glyph-preview">&#x{cp:X};</td>')
+            else:
+                cells.append('<td></td><td></td><td></td>')
+        rows.append(f'<tr>{"".join(cells)}</tr>')
+    return rows
+
+
+def preload_links(html, syllables):
+    """Preload the font files the specimen block uses."""
+    match = SPECIMEN_RE.search(html)
+    used = {int(h, 16) for h in ENTITY_RE.findall(match.group(1))} if match else set()
+    files = [SUBSETS_DIR / f'{FONT_STEM}-{name}.woff2'
+             for name, unicodes in subset_rows(dict(syllables)) if used & set(unicodes)]
+    if not files or not all(path.exists() for path in files):
+        files = [FONTS_DIR / f'{FONT_STEM}.woff2']
+    return [f'<link rel="preload" href="../{path.relative_to(FONTS_DIR.parent).as_posix()}" '
+            f'as="font" type="font/woff2" crossorigin>' for path in files]
+
+
+def replace_block(html, name, lines):
+    """Replace the lines between <!-- BEGIN name ... --> and <!-- END name -->."""
+    pattern = re.compile(rf'^([ \t]*)(<!-- BEGIN {re.escape(name)}\b[^\n]*-->\n)'
+                         rf'.*?^[ \t]*(<!-- END {re.escape(name)} -->)', re.DOTALL | re.MULTILINE)
+    match = pattern.search(html)
+    if not match:
+        print(f'{DOCS_PAGE} has no "{name}" block', file=sys.stderr)
+        sys.exit(1)
+    indent = match.group(1)
+    body = ''.join(f'{indent}{line}\n' for line in lines)
+    return (html[:match.start()] + indent + match.group(2) + body + indent + match.group(3)
+            + html[match.end():])
+
+
+def main():
+    if not FONT_FILE.exists():
+        print(f'Missing {FONT_FILE} - run build_font.py first', file=sys.stderr)
+        sys.exit(1)
+    syllables = font_syllables()
+
+    html = DOCS_PAGE.read_text(encoding='utf-8')
+    new = replace_block(html, 'font preload', preload_links(html, syllables))
+    new = replace_block(new, 'glyph grid', glyph_grid(syllables))
+    new = replace_block(new, 'codepoint table', codepoint_table(syllables))
+    if new == html:
+        print(f'{DOCS_PAGE} is up to date ({len(syllables)} glyphs)')
+        return
+    DOCS_PAGE.write_text(new, encoding='utf-8')
+    print(f'Wrote {DOCS_PAGE} ({len(syllables)} glyphs)')
+
+
+if __name__ == '__main__':
+    main()
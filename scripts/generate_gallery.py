@@ -1,13 +1,19 @@
 """
 Generate a gallery HTML page for the Wikidata-generated sitelen ilo pona SVGs.
 
-Produces gallery.html with a searchable grid of all output/ SVGs.
+Produces gallery.html with a searchable grid of all output/ SVGs. QIDs and
+tok.wikipedia titles come from the pipeline database when it has renders,
+otherwise from data/output_index.json.
 """
 
+import argparse
 import json
 from pathlib import Path
 from urllib.parse import quote
 
+import pipeline_db
+from tracing import add_trace_arguments, span, trace_from_args, traced
+
 ROOT_DIR = Path(__file__).parent.parent
 OUTPUT_DIR = ROOT_DIR / 'output'
 OUTPUT_FILE = ROOT_DIR / 'gallery.html'
@@ -23,16 +29,33 @@ def display_label(raw_label):
     return raw_label
 
 
-def main():
-    index = {}
+@traced()
+def load_index():
+    """{filename: {'qid', 'tok_title'}} from the database, else output_index.json."""
+    if pipeline_db.DB_PATH.exists():
+        conn = pipeline_db.connect()
+        index = pipeline_db.output_index(conn)
+        conn.close()
+        if index:
+            return index
     if INDEX_FILE.exists():
         with open(INDEX_FILE, encoding='utf-8') as f:
-            index = json.load(f)
+            return json.load(f)
+    return {}
 
-    svgs = sorted(
-        f for f in OUTPUT_DIR.glob('sitelen ilo pona - *.svg')
-        if not f.name.endswith('.wiki.txt')
-    )
+
+def main():
+    parser = argparse.ArgumentParser(description='Write gallery.html for the generated SVGs.')
+    add_trace_arguments(parser)
+    trace_from_args(parser.parse_args())
+
+    index = load_index()
+
+    with span('scan_output'):
+        svgs = sorted(
+            f for f in OUTPUT_DIR.glob('sitelen ilo pona - *.svg')
+            if not f.name.endswith('.wiki.txt')
+        )
 
     cards = []
     for svg_file in svgs:
@@ -70,7 +93,8 @@ def main():
             f'</div>'
         )
 
-    card_html = '\n'.join(card_html_for(l, p, q, t) for l, p, q, t in cards)
+    with span('build_cards'):
+        card_html = '\n'.join(card_html_for(l, p, q, t) for l, p, q, t in cards)
 
     html = f'''<!DOCTYPE html>
 <html lang="en">
@@ -124,7 +148,8 @@ def main():
 </body>
 </html>'''
 
-    OUTPUT_FILE.write_text(html, encoding='utf-8')
+    with span('write'):
+        OUTPUT_FILE.write_text(html, encoding='utf-8')
     print(f'Wrote gallery ({len(cards)} items) to {OUTPUT_FILE}')
 
 
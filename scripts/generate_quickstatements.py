@@ -1,85 +1,281 @@
 """
 Generate QuickStatements to add P18 (image) claims on Wikidata items.
 
-Reads data/wikidata_tok_labels.csv (qid, label) and output/ SVG files.
-For each QID whose label has a generated SVG in output/, emits a
-QuickStatements line to add the image on Wikimedia Commons as P18.
+Reads data/output_index.json (written by batch_generate_svgs.py) and
+data/wikidata_tok_labels.csv (qid, label). The index is loaded once into a
+set of generated filenames, then the labels CSV is streamed and each row is
+probed against it using the generator's own output_filename(), so no file in
+output/ is ever stat'ed. For each hit a QuickStatements line adding the image
+on Wikimedia Commons as P18 is written straight to disk.
 
-Output: data/quickstatements.txt
+When the pipeline database has renders, the same join is a single indexed
+query over its items and renders tables instead. Items recorded there as
+published are left out; every other rendered item without a P18 in the
+current snapshot is written (again, if an earlier run queued it, since this
+run replaces the shards), and its shard is recorded in the publications
+table with status 'queued'. Items with a P18 are recorded as 'has_p18' on
+each run, so an item whose P18 is later removed is queued again.
+
+After submitting shards to QuickStatements, --mark-published with their
+filenames records their items as 'published' (QIDs read from the
+manifest), so later runs never queue them again.
+
+Items that already have a P18 according to the cached claims snapshot
+(data/wikidata_p18_claims.csv, written by fetch_wikidata_sparql.py) are
+skipped. Lines are also split into shards of at most --shard-size lines so
+several QuickStatements batches can be submitted in parallel; every item
+lands in exactly one shard and manifest.json records which.
+
+Output:
+    data/quickstatements.txt              every line, for a single paste
+    data/quickstatements/shard-NNNN.txt   size-bounded shards
+    data/quickstatements/manifest.json    per-shard line counts and QIDs
 
 Usage:
-    python scripts/generate_quickstatements.py
+    python scripts/generate_quickstatements.py [--shard-size 500]
+    python scripts/generate_quickstatements.py --mark-published shard-0001.txt shard-0002.txt
 """
 
+import argparse
 import csv
-import re
+import json
+import sys
 from pathlib import Path
 
+from generate_sitelen_kalama_pona import output_filename
+import pipeline_db
+
 ROOT_DIR = Path(__file__).parent.parent
 DATA_DIR = ROOT_DIR / 'data'
-OUTPUT_DIR = ROOT_DIR / 'output'
-
-COMMONS_BASE = 'https://commons.wikimedia.org/wiki/File:'
+INDEX_FILE = DATA_DIR / 'output_index.json'
+CLAIMS_FILE = DATA_DIR / 'wikidata_p18_claims.csv'
+SHARDS_DIR = DATA_DIR / 'quickstatements'
 
+DEFAULT_SHARD_SIZE = 500
 
-def safe_filename(text):
-    """Produce a filesystem-safe version of text (mirrors generate_sitelen_kalama_pona.py)."""
-    return re.sub(r'[<>:"/\\|?*]', '_', text)
+COMMONS_BASE = 'https://commons.wikimedia.org/wiki/File:'
 
 
-def commons_filename(label):
-    """The expected Wikimedia Commons filename for a given label."""
-    # SVG files are named 'sitelen ilo pona - {label}.svg'
+def commons_filename(svg_name):
+    """The expected Wikimedia Commons filename for a generated output/ SVG."""
     # Commons convention: capitalise first letter, underscores for spaces
-    name = f'Sitelen ilo pona - {label}.svg'
+    name = svg_name[:1].upper() + svg_name[1:]
     return name.replace(' ', '_')
 
 
-def main():
-    DATA_DIR.mkdir(exist_ok=True)
-    labels_path = DATA_DIR / 'wikidata_tok_labels.csv'
+def load_output_names(index_path=INDEX_FILE):
+    """Return the set of SVG filenames recorded in the generator's output index."""
+    with open(index_path, encoding='utf-8') as f:
+        return set(json.load(f))
+
+
+def load_p18_snapshot(claims_path=CLAIMS_FILE):
+    """Return the set of QIDs that already have a P18 in the cached snapshot."""
+    if not claims_path.exists():
+        return set()
+    with open(claims_path, encoding='utf-8', newline='') as f:
+        return {row['qid'].strip() for row in csv.DictReader(f)}
+
+
+def quickstatement_line(qid, svg_name):
+    """A QuickStatements V1 line adding svg_name as P18 on qid."""
+    cf = commons_filename(svg_name)
+    commons_url = COMMONS_BASE + cf
+    # QID <tab> P18 <tab> "filename" <tab> S854 <tab> "source-url"
+    return f'{qid}\tP18\t"{cf}"\tS854\t"{commons_url}"'
 
-    if not labels_path.exists():
-        print(f'Missing {labels_path} — run fetch_wikidata_sparql.py first')
-        return
 
-    rows = []
+def iter_quickstatements(labels_path, output_names, stats, has_p18=frozenset()):
+    """Yield (qid, line) for each label row whose SVG is in output_names.
+
+    Each QID is yielded at most once. Rows without a generated SVG are
+    counted in stats['skipped'], items already in has_p18 in
+    stats['has_p18'].
+    """
+    stats.setdefault('skipped', 0)
+    stats.setdefault('has_p18', 0)
+    seen = set()
     with open(labels_path, 'r', encoding='utf-8', newline='') as f:
-        rows = list(csv.DictReader(f))
+        for row in csv.DictReader(f):
+            qid = row['qid'].strip()
+            label = row['label'].strip()
+            if not qid or not label or qid in seen:
+                continue
 
-    lines = []
-    skipped = 0
+            if qid in has_p18:
+                stats['has_p18'] += 1
+                continue
 
-    for row in rows:
-        qid = row['qid'].strip()
-        label = row['label'].strip()
-        if not qid or not label:
-            continue
+            svg_name = output_filename(label)
+            if svg_name not in output_names:
+                stats['skipped'] += 1
+                continue
+
+            seen.add(qid)
+            yield qid, quickstatement_line(qid, svg_name)
+
+
+def iter_db_quickstatements(conn, stats, has_p18=frozenset()):
+    """Like iter_quickstatements(), but joined inside the pipeline database.
 
-        # Check if an SVG was generated for this label
-        svg_name = f'sitelen ilo pona - {safe_filename(label)}.svg'
-        svg_path = OUTPUT_DIR / svg_name
-        if not svg_path.exists():
-            skipped += 1
+    QIDs that are skipped for having a P18 are collected in stats['p18_qids'].
+    """
+    stats['skipped'] = pipeline_db.unrendered_count(conn)
+    stats.setdefault('has_p18', 0)
+    stats.setdefault('p18_qids', [])
+    for qid, svg_name in pipeline_db.iter_publishable(conn):
+        if qid in has_p18:
+            stats['has_p18'] += 1
+            stats['p18_qids'].append((qid, svg_name))
             continue
+        yield qid, quickstatement_line(qid, svg_name)
 
-        cf = commons_filename(label)
-        commons_url = COMMONS_BASE + cf.replace(' ', '_')
 
-        # QuickStatements V1 format:
-        # QID <tab> P18 <tab> "filename" <tab> S854 <tab> "source-url"
-        line = f'{qid}\tP18\t"{cf}"\tS854\t"{commons_url}"'
-        lines.append(line)
+def manifest_qids(shard_names, manifest_path=None):
+    """QIDs of the named shards in the manifest, and any names it does not list."""
+    manifest_path = manifest_path or SHARDS_DIR / 'manifest.json'
+    with open(manifest_path, encoding='utf-8') as f:
+        shards = {shard['file']: shard['qids'] for shard in json.load(f)['shards']}
+    qids = []
+    unknown = []
+    for name in shard_names:
+        name = Path(name).name
+        if name in shards:
+            qids.extend(shards[name])
+        else:
+            unknown.append(name)
+    return qids, unknown
+
+
+def mark_published(shard_names):
+    """Record the items of submitted shards as published in the pipeline database."""
+    if not pipeline_db.DB_PATH.exists():
+        print(f'No pipeline database at {pipeline_db.DB_PATH} — nothing to mark',
+              file=sys.stderr)
+        sys.exit(1)
+    qids, unknown = manifest_qids(shard_names)
+    if unknown:
+        print(f'Not in {SHARDS_DIR / "manifest.json"}: {", ".join(unknown)}', file=sys.stderr)
+        sys.exit(1)
+    conn = pipeline_db.connect()
+    marked = pipeline_db.mark_published(conn, qids)
+    conn.close()
+    print(f'Marked {marked} of {len(qids)} items in {len(shard_names)} shards as published')
+
+
+class ShardWriter:
+    """Write lines into shard-NNNN.txt files of at most shard_size lines."""
+
+    def __init__(self, shards_dir, shard_size):
+        self.shards_dir = shards_dir
+        self.shard_size = shard_size
+        self.shards = []
+        self._file = None
+
+    def __enter__(self):
+        self.shards_dir.mkdir(parents=True, exist_ok=True)
+        for stale in self.shards_dir.glob('shard-*.txt'):
+            stale.unlink()
+        return self
+
+    def __exit__(self, *exc):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def write(self, qid, line):
+        """Append line to the current shard and return that shard's filename."""
+        if self._file is None or self.shards[-1]['lines'] >= self.shard_size:
+            if self._file:
+                self._file.close()
+            name = f'shard-{len(self.shards) + 1:04d}.txt'
+            self._file = open(self.shards_dir / name, 'w', encoding='utf-8')
+            self.shards.append({'file': name, 'lines': 0, 'qids': []})
+        self._file.write(line + '\n')
+        self.shards[-1]['lines'] += 1
+        self.shards[-1]['qids'].append(qid)
+        return self.shards[-1]['file']
+
+    def write_manifest(self):
+        manifest_path = self.shards_dir / 'manifest.json'
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({'shard_size': self.shard_size, 'shards': self.shards},
+                      f, ensure_ascii=False, indent=None)
+        return manifest_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+                        help=f'maximum lines per shard (default {DEFAULT_SHARD_SIZE})')
+    parser.add_argument('--claims', type=Path, default=CLAIMS_FILE,
+                        help='cached P18 claims snapshot (qid,image CSV)')
+    parser.add_argument('--mark-published', nargs='+', metavar='SHARD',
+                        help='record the items of these submitted shards as published and exit')
+    args = parser.parse_args()
+    if args.shard_size < 1:
+        parser.error('--shard-size must be at least 1')
+    if args.mark_published:
+        mark_published(args.mark_published)
+        return
+
+    DATA_DIR.mkdir(exist_ok=True)
+    labels_path = DATA_DIR / 'wikidata_tok_labels.csv'
+
+    has_p18 = load_p18_snapshot(args.claims)
+    if not has_p18:
+        print(f'No P18 snapshot at {args.claims} — not skipping any items')
+
+    conn = None
+    if pipeline_db.DB_PATH.exists():
+        conn = pipeline_db.connect()
+        if not pipeline_db.has_renders(conn):
+            conn.close()
+            conn = None
+
+    stats = {}
+    if conn:
+        print(f'Joining items and renders in {pipeline_db.DB_PATH.name}')
+        statements = iter_db_quickstatements(conn, stats, has_p18)
+    else:
+        if not labels_path.exists():
+            print(f'Missing {labels_path} — run fetch_wikidata_sparql.py first')
+            return
+        if not INDEX_FILE.exists():
+            print(f'Missing {INDEX_FILE} — run batch_generate_svgs.py first')
+            return
+        statements = iter_quickstatements(labels_path, load_output_names(), stats, has_p18)
 
     out_path = DATA_DIR / 'quickstatements.txt'
-    with open(out_path, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(lines) + '\n')
+    written = 0
+    queued = []
+    with open(out_path, 'w', encoding='utf-8') as f, \
+            ShardWriter(SHARDS_DIR, args.shard_size) as shards:
+        for qid, line in statements:
+            f.write(line + '\n')
+            shard = shards.write(qid, line)
+            queued.append((qid, shard))
+            written += 1
+    manifest_path = shards.write_manifest()
+
+    if conn:
+        filenames = {qid: name for qid, name in pipeline_db.iter_publishable(conn)}
+        pipeline_db.set_publications(conn, [
+            (qid, filenames.get(qid), 'queued', shard) for qid, shard in queued
+        ] + [
+            (qid, name, 'has_p18', None) for qid, name in stats['p18_qids']
+        ])
+        conn.close()
 
-    print(f'Generated {len(lines)} QuickStatements lines '
-          f'({skipped} labels skipped — no SVG output).')
+    print(f'Generated {written} QuickStatements lines '
+          f'({stats["skipped"]} labels skipped — no SVG output, '
+          f'{stats["has_p18"]} already have P18).')
     print(f'Wrote {out_path}')
+    print(f'Wrote {len(shards.shards)} shards of up to {args.shard_size} lines '
+          f'to {SHARDS_DIR} (manifest: {manifest_path.name})')
     print()
-    print('To apply: go to https://quickstatements.toolforge.org/ and paste the file contents.')
+    print('To apply: go to https://quickstatements.toolforge.org/ and paste the file '
+          'contents, or submit each shard as a separate batch.')
 
 
 if __name__ == '__main__':
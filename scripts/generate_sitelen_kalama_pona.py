@@ -15,8 +15,11 @@ import sys
 import io
 import re
 import xml.etree.ElementTree as ET
+from collections import namedtuple
 from pathlib import Path
 
+from tracing import span, traced
+
 if sys.stdout and hasattr(sys.stdout, 'buffer'):
     try:
         sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -38,27 +41,104 @@ TARGET_HEIGHT = 1000
 SPACING = 80
 CARTOUCHE_SVG = ROOT_DIR / 'Jan_Sinpo_We_(Jimbo_Wales_in_Sitelen_Pona).svg'
 
+# One <path> of a source SVG. Path data strings are interned and the tuples
+# cached per file, so every layout that uses a glyph shares one copy.
+SvgPath = namedtuple('SvgPath', ['d', 'transform'])
+
+
+class Piece:
+    """A glyph placed in a layout: shared paths and viewBox, plus its scale and offset."""
+
+    __slots__ = ('paths', 'viewbox', 'scale_x', 'scale_y', 'x_offset', 'y_offset')
+
+    def __init__(self, paths, viewbox, scale_x, scale_y, x_offset, y_offset):
+        self.paths = paths
+        self.viewbox = viewbox
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self.x_offset = x_offset
+        self.y_offset = y_offset
+
+
+class Layout:
+    """Everything generate() needs to write one SVG and its sidecar."""
+
+    __slots__ = ('text', 'word_tokens', 'syllables', 'word_pieces', 'cartouche_pieces',
+                 'syllable_pieces', 'sources', 'total_width', 'height')
+
+    def __init__(self, text, word_tokens, syllables, word_pieces, cartouche_pieces,
+                 syllable_pieces, sources, total_width, height=TARGET_HEIGHT):
+        self.text = text
+        self.word_tokens = word_tokens
+        self.syllables = syllables
+        self.word_pieces = word_pieces
+        self.cartouche_pieces = cartouche_pieces
+        self.syllable_pieces = syllable_pieces
+        self.sources = sources
+        self.total_width = total_width
+        self.height = height
+
 
+# (kind, path) -> (mtime_ns, parsed result); see _cached()
+_svg_cache = {}
+
+
+def _cached(kind, path, load):
+    """load() for path, reused until the file's mtime changes."""
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return load()
+    key = (kind, path)
+    hit = _svg_cache.get(key)
+    if hit is not None and hit[0] == mtime:
+        return hit[1]
+    value = load()
+    _svg_cache[key] = (mtime, value)
+    return value
+
+
+def _svg_path(path_el):
+    """SvgPath for a <path> element, or None without path data."""
+    d = path_el.get('d')
+    if not d:
+        return None
+    return SvgPath(sys.intern(d), sys.intern(path_el.get('transform', '')))
+
+
+@traced()
 def get_available_compounds():
-    """Scan sitelen_seli_kiwen_svgs/ for compound SVG files (those with hyphens)."""
-    compounds = set()
-    for f in WORD_SVGS_DIR.glob('Sitelen seli kiwen - *-*.svg'):
-        name = f.stem.replace('Sitelen seli kiwen - ', '')
-        compounds.add(name)
-    return compounds
+    """Scan sitelen_seli_kiwen_svgs/ for compound SVG files (those with hyphens).
 
+    The scan is reused until the directory changes.
+    """
+    def scan():
+        compounds = set()
+        for f in WORD_SVGS_DIR.glob('Sitelen seli kiwen - *-*.svg'):
+            name = f.stem.replace('Sitelen seli kiwen - ', '')
+            compounds.add(name)
+        return frozenset(compounds)
+    return _cached('compounds', WORD_SVGS_DIR, scan)
 
+
+@traced()
 def read_svg_paths(svg_file):
-    """Read path data and viewBox from an SVG file. Returns (paths, viewBox)."""
+    """Read path data and viewBox from an SVG file. Returns (paths, viewBox).
+
+    paths is a tuple of SvgPath, shared by every caller until the file changes.
+    """
     if not svg_file.exists():
         return None, None
+    return _cached('paths', svg_file, lambda: _read_svg_paths(svg_file))
+
 
+def _read_svg_paths(svg_file):
     tree = ET.parse(str(svg_file))
     root = tree.getroot()
     ns = {'svg': 'http://www.w3.org/2000/svg'}
 
     viewBox = root.get('viewBox', '0 0 1000 1000')
-    vb = [float(x) for x in viewBox.split()]
+    vb = tuple(float(x) for x in viewBox.split())
 
     path_els = root.findall('.//svg:path', ns)
     if not path_els:
@@ -66,25 +146,27 @@ def read_svg_paths(svg_file):
     if not path_els:
         return None, None
 
-    paths = []
-    for path_el in path_els:
-        d = path_el.get('d')
-        if not d:
-            continue
-        transform = path_el.get('transform', '')
-        paths.append({'d': d, 'transform': transform})
-
+    paths = tuple(p for p in map(_svg_path, path_els) if p)
     if not paths:
         return None, None
 
     return paths, vb
 
 
+@traced()
 def read_svg_paths_by_label(svg_file, labels):
-    """Read path data by inkscape:label. Returns (paths_by_label, viewBox)."""
+    """Read path data by inkscape:label. Returns (paths_by_label, viewBox).
+
+    Each label maps to a tuple of SvgPath, cached like read_svg_paths().
+    """
     if not svg_file.exists():
         return None, None
+    labels = frozenset(labels)
+    return _cached(('labels', labels), svg_file,
+                   lambda: _read_svg_paths_by_label(svg_file, labels))
+
 
+def _read_svg_paths_by_label(svg_file, labels):
     tree = ET.parse(str(svg_file))
     root = tree.getroot()
     ns = {
@@ -93,20 +175,18 @@ def read_svg_paths_by_label(svg_file, labels):
     }
 
     viewBox = root.get('viewBox', '0 0 1000 1000')
-    vb = [float(x) for x in viewBox.split()]
+    vb = tuple(float(x) for x in viewBox.split())
 
     paths_by_label = {label: [] for label in labels}
     for path_el in root.findall('.//svg:path', ns) + root.findall('.//path'):
         label = path_el.get(f'{{{ns["inkscape"]}}}label')
         if label not in paths_by_label:
             continue
-        d = path_el.get('d')
-        if not d:
-            continue
-        transform = path_el.get('transform', '')
-        paths_by_label[label].append({'d': d, 'transform': transform})
+        path = _svg_path(path_el)
+        if path:
+            paths_by_label[label].append(path)
 
-    return paths_by_label, vb
+    return {label: tuple(paths) for label, paths in paths_by_label.items()}, vb
 
 
 def _path_bbox(d):
@@ -241,10 +321,11 @@ def _path_bbox(d):
     return min_x, min_y, max_x, max_y
 
 
+@traced()
 def _paths_bbox(paths):
     bbox = None
     for p in paths:
-        b = _path_bbox(p.get('d', ''))
+        b = _path_bbox(p.d)
         if not b:
             continue
         if bbox is None:
@@ -259,6 +340,7 @@ def _paths_bbox(paths):
     return tuple(bbox)
 
 
+@traced()
 def parse_syllables(name):
     """Parse a proper name into toki pona syllables.
     e.g., 'Amatelasu' -> ['a', 'ma', 'te', 'la', 'su']
@@ -298,6 +380,7 @@ def syllable_to_svg_name(syllable):
     return syllable
 
 
+@traced()
 def parse_input(text):
     """Parse input into word tokens and sound name.
     Lowercase tokens = word symbols, first uppercase token starts sound symbols.
@@ -315,6 +398,7 @@ def parse_input(text):
     return words, sound_name
 
 
+@traced()
 def match_compounds(word_tokens, compound_set):
     """Greedily match word tokens into compounds where possible."""
     result = []
@@ -366,8 +450,124 @@ def safe_filename(name):
     return name
 
 
-def generate(text):
-    """Generate a composed SVG for the given toki pona phrase."""
+def output_filename(text):
+    """The output/ SVG filename that generate() writes for the given text."""
+    word_tokens, sound_name = parse_input(text)
+    if word_tokens and sound_name:
+        filename_text = f'{" ".join(word_tokens)}, {sound_name.lower()}'
+    elif sound_name:
+        filename_text = f', {sound_name.lower()}'
+    else:
+        filename_text = text
+    return f'sitelen ilo pona - {safe_filename(filename_text)}.svg'
+
+
+def word_piece(word, x=0):
+    """Piece for a word or compound glyph at x and its width, or (None, 0) without an SVG."""
+    paths, vb = read_svg_paths(WORD_SVGS_DIR / f'Sitelen seli kiwen - {word}.svg')
+    if not (paths and vb):
+        return None, 0
+    vb_x, vb_y, vb_w, vb_h = vb
+    scale = (TARGET_HEIGHT / vb_h if vb_h > 0 else 1) * 1.15
+    return Piece(paths, vb, scale, scale, x, 0), vb_w * scale
+
+
+def syllable_piece(syl):
+    """Unplaced Piece for a syllable glyph, or None without an SVG."""
+    svg_name = syllable_to_svg_name(syl)
+    paths, vb = read_svg_paths(SYLLABLES_DIR / f'sitelen kalama pona - {svg_name}.svg')
+    if not (paths and vb):
+        return None
+    vb_x, vb_y, vb_w, vb_h = vb
+    scale = (TARGET_HEIGHT / vb_h if vb_h > 0 else 1) * 0.8
+    return Piece(paths, vb, scale, scale, 0, 0)
+
+
+def cartouche_parts():
+    """(paths by label, viewBox, scale, bbox by label) of the cartouche SVG.
+
+    Measured once and reused until the file changes.
+    """
+    return _cached('cartouche', CARTOUCHE_SVG, _cartouche_parts)
+
+
+def _cartouche_parts():
+    cartouche_labels = {'left', 'center', 'right'}
+    cartouche_paths_by_label, cartouche_vb = read_svg_paths_by_label(
+        CARTOUCHE_SVG,
+        cartouche_labels,
+    )
+    if not cartouche_paths_by_label or not cartouche_vb:
+        raise FileNotFoundError(
+            f'Cartouche SVG not found or invalid: {CARTOUCHE_SVG}'
+        )
+
+    if any(not cartouche_paths_by_label[label] for label in cartouche_labels):
+        raise ValueError('Cartouche SVG is missing left/center/right labels.')
+
+    c_vb_x, c_vb_y, c_vb_w, c_vb_h = cartouche_vb
+    cartouche_scale = TARGET_HEIGHT / c_vb_h if c_vb_h > 0 else 1
+    bboxes = {label: _paths_bbox(cartouche_paths_by_label[label])
+              for label in ('left', 'center', 'right')}
+    if not bboxes['center']:
+        raise ValueError('Failed to compute cartouche center bounds.')
+    if not bboxes['left'] or not bboxes['right']:
+        raise ValueError('Failed to compute cartouche side bounds.')
+    return cartouche_paths_by_label, cartouche_vb, cartouche_scale, bboxes
+
+
+def place_cartouche(syllable_items, x):
+    """Place syllable Pieces inside a cartouche starting at x.
+
+    Sets the syllables' offsets in place. Returns (cartouche pieces, width).
+    """
+    cartouche_paths_by_label, cartouche_vb, cartouche_scale, bboxes = cartouche_parts()
+    left_bbox, center_bbox, right_bbox = bboxes['left'], bboxes['center'], bboxes['right']
+
+    syllable_widths = [item.viewbox[2] * item.scale_x for item in syllable_items]
+
+    left_w = (left_bbox[2] - left_bbox[0]) * cartouche_scale
+    right_w = (right_bbox[2] - right_bbox[0]) * cartouche_scale
+    center_w = (center_bbox[2] - center_bbox[0]) * cartouche_scale
+
+    seg_w = center_w
+    cartouche_inner_width = seg_w * len(syllable_widths)
+    cartouche_total_width = left_w + cartouche_inner_width + right_w
+
+    left_x = x
+    middle_x = left_x + left_w
+    right_x = middle_x + cartouche_inner_width
+
+    # Left/right keep native proportions (scale_x == scale_y)
+    cartouche_pieces = [Piece(
+        cartouche_paths_by_label['left'], cartouche_vb, cartouche_scale, cartouche_scale,
+        left_x - left_bbox[0] * cartouche_scale, 0)]
+
+    # Center repeats per syllable, no stretching
+    for i in range(len(syllable_widths)):
+        seg_x = middle_x + i * seg_w
+        center_x = seg_x + (seg_w - center_w) / 2
+        cartouche_pieces.append(Piece(
+            cartouche_paths_by_label['center'], cartouche_vb, cartouche_scale,
+            cartouche_scale, center_x - center_bbox[0] * cartouche_scale, 0))
+
+    cartouche_pieces.append(Piece(
+        cartouche_paths_by_label['right'], cartouche_vb, cartouche_scale, cartouche_scale,
+        right_x - right_bbox[0] * cartouche_scale, 0))
+
+    # Place syllables inside cartouche
+    for i, (item, width) in enumerate(zip(syllable_items, syllable_widths)):
+        seg_x = middle_x + i * seg_w
+        vb_x, vb_y, vb_w, vb_h = item.viewbox
+        item.x_offset = seg_x + (seg_w - width) / 2
+        item.y_offset = (TARGET_HEIGHT - vb_h * item.scale_y) / 2
+
+    return cartouche_pieces, cartouche_total_width
+
+
+@traced()
+def layout(text):
+    """Place the word, syllable and cartouche glyphs for a toki pona phrase."""
     print(f'Input: {text}')
 
     word_tokens, sound_name = parse_input(text)
@@ -394,151 +594,46 @@ def generate(text):
 
     # Read word SVGs
     for word in matched_words:
-        svg_file = WORD_SVGS_DIR / f'Sitelen seli kiwen - {word}.svg'
-        paths, vb = read_svg_paths(svg_file)
-
-        if paths and vb:
-            vb_x, vb_y, vb_w, vb_h = vb
-            scale = (TARGET_HEIGHT / vb_h if vb_h > 0 else 1) * 1.15
-            word_pieces.append({
-                'type': 'word',
-                'paths': paths,
-                'viewbox': vb,
-                'scale': scale,
-                'x_offset': x_cursor,
-                'y_offset': 0,
-            })
-            x_cursor += vb_w * scale + SPACING
-            sources.append(f'{word}: {word_commons_url(word)}')
+        piece, width = word_piece(word, x_cursor)
+        if piece:
+            word_pieces.append(piece)
+            x_cursor += width + SPACING
+            sources.append(sys.intern(f'{word}: {word_commons_url(word)}'))
             print(f'  Loaded word SVG: {word}')
         else:
             print(f'  Warning: could not load SVG for "{word}"')
 
     # Read syllable SVGs and compute cartouche layout
-    syllable_items = []
     for syl in syllables:
-        svg_name = syllable_to_svg_name(syl)
-        svg_file = SYLLABLES_DIR / f'sitelen kalama pona - {svg_name}.svg'
-        paths, vb = read_svg_paths(svg_file)
-
-        if paths and vb:
-            vb_x, vb_y, vb_w, vb_h = vb
-            scale = (TARGET_HEIGHT / vb_h if vb_h > 0 else 1) * 0.8
-            syllable_items.append({
-                'syllable': syl,
-                'paths': paths,
-                'viewbox': vb,
-                'scale': scale,
-            })
-            sources.append(f'{syl}: {syllable_commons_url(syl)}')
+        piece = syllable_piece(syl)
+        if piece:
+            syllable_pieces.append(piece)
+            sources.append(sys.intern(f'{syl}: {syllable_commons_url(syl)}'))
             print(f'  Loaded syllable: {syl}')
         else:
             print(f'  Warning: could not load syllable "{syl}"')
 
-    if syllable_items:
-        cartouche_labels = {'left', 'center', 'right'}
-        cartouche_paths_by_label, cartouche_vb = read_svg_paths_by_label(
-            CARTOUCHE_SVG,
-            cartouche_labels,
-        )
-        if not cartouche_paths_by_label or not cartouche_vb:
-            raise FileNotFoundError(
-                f'Cartouche SVG not found or invalid: {CARTOUCHE_SVG}'
-            )
-
-        if any(not cartouche_paths_by_label[label] for label in cartouche_labels):
-            raise ValueError('Cartouche SVG is missing left/center/right labels.')
-
-        c_vb_x, c_vb_y, c_vb_w, c_vb_h = cartouche_vb
-        cartouche_scale = TARGET_HEIGHT / c_vb_h if c_vb_h > 0 else 1
-        center_bbox = _paths_bbox(cartouche_paths_by_label['center'])
-        if not center_bbox:
-            raise ValueError('Failed to compute cartouche center bounds.')
-        cartouche_bar_height = (center_bbox[3] - center_bbox[1]) * cartouche_scale
-
-        # Update syllable scaling to fit cartouche height
-        syllable_widths = []
-        for item in syllable_items:
-            vb_x, vb_y, vb_w, vb_h = item['viewbox']
-            item['scale'] = (TARGET_HEIGHT / vb_h if vb_h > 0 else 1) * 0.8
-            syllable_widths.append(vb_w * item['scale'])
-
+    if syllable_pieces:
         syllable_start_x = x_cursor
-
-        syllable_total_width = sum(syllable_widths)
-        if len(syllable_widths) > 1:
-            syllable_total_width += SPACING * (len(syllable_widths) - 1)
-
-        left_bbox = _paths_bbox(cartouche_paths_by_label['left'])
-        right_bbox = _paths_bbox(cartouche_paths_by_label['right'])
-        if not left_bbox or not right_bbox:
-            raise ValueError('Failed to compute cartouche side bounds.')
-
-        left_w = (left_bbox[2] - left_bbox[0]) * cartouche_scale
-        right_w = (right_bbox[2] - right_bbox[0]) * cartouche_scale
-        center_w = (center_bbox[2] - center_bbox[0]) * cartouche_scale
-
-        seg_w = center_w
-        cartouche_inner_width = seg_w * len(syllable_widths)
-        cartouche_total_width = left_w + cartouche_inner_width + right_w
-
-        left_x = syllable_start_x
-        middle_x = left_x + left_w
-        right_x = middle_x + cartouche_inner_width
-
-        # Left/right keep native proportions (scale_x == scale_y)
-        cartouche_pieces.append({
-            'paths': cartouche_paths_by_label['left'],
-            'viewbox': cartouche_vb,
-            'scale_x': cartouche_scale,
-            'scale_y': cartouche_scale,
-            'x_offset': left_x - left_bbox[0] * cartouche_scale,
-            'y_offset': 0,
-        })
-
-        # Center repeats per syllable, no stretching
-        for i in range(len(syllable_widths)):
-            seg_x = middle_x + i * seg_w
-            center_x = seg_x + (seg_w - center_w) / 2
-            cartouche_pieces.append({
-                'paths': cartouche_paths_by_label['center'],
-                'viewbox': cartouche_vb,
-                'scale_x': cartouche_scale,
-                'scale_y': cartouche_scale,
-                'x_offset': center_x - center_bbox[0] * cartouche_scale,
-                'y_offset': 0,
-            })
-
-        cartouche_pieces.append({
-            'paths': cartouche_paths_by_label['right'],
-            'viewbox': cartouche_vb,
-            'scale_x': cartouche_scale,
-            'scale_y': cartouche_scale,
-            'x_offset': right_x - right_bbox[0] * cartouche_scale,
-            'y_offset': 0,
-        })
-
-        # Place syllables inside cartouche
-        for i, (item, width) in enumerate(zip(syllable_items, syllable_widths)):
-            seg_x = middle_x + i * seg_w
-            x_cursor = seg_x + (seg_w - width) / 2
-            vb_x, vb_y, vb_w, vb_h = item['viewbox']
-            y_offset = (TARGET_HEIGHT - vb_h * item['scale']) / 2
-            syllable_pieces.append({
-                'type': 'syllable',
-                'paths': item['paths'],
-                'viewbox': item['viewbox'],
-                'scale': item['scale'],
-                'x_offset': x_cursor,
-                'y_offset': y_offset,
-            })
-
+        cartouche_pieces, cartouche_total_width = place_cartouche(syllable_pieces, x_cursor)
         # Move cursor to the end of cartouche block
         x_cursor = syllable_start_x + cartouche_total_width + SPACING
 
-    # Build SVG
     has_content = bool(word_pieces or syllable_pieces or cartouche_pieces)
     total_width = x_cursor - SPACING if has_content else 0
+    return Layout(text, word_tokens, syllables, word_pieces, cartouche_pieces,
+                  syllable_pieces, sources, total_width, TARGET_HEIGHT)
+
+
+@traced()
+def svg_document(layout):
+    """Return (svg text, sidecar text) for a Layout."""
+    text = layout.text
+    word_tokens = layout.word_tokens
+    syllables = layout.syllables
+    sources = layout.sources
+    total_width = layout.total_width
+    height = layout.height
 
     # Categories for Commons uploads
     word_phrase = ' '.join(word_tokens)
@@ -572,8 +667,8 @@ def generate(text):
     svg_parts = [
         '<?xml version="1.0" encoding="UTF-8" standalone="no"?>',
         f'<!--\n{comment}\n-->',
-        f'<svg version="1.1" width="{total_width:.0f}" height="{TARGET_HEIGHT}"',
-        f'     viewBox="0 0 {total_width:.0f} {TARGET_HEIGHT}"',
+        f'<svg version="1.1" width="{total_width:.0f}" height="{height}"',
+        f'     viewBox="0 0 {total_width:.0f} {height}"',
         '     xmlns="http://www.w3.org/2000/svg">',
     ]
 
@@ -583,14 +678,14 @@ def generate(text):
         return re.sub(r'scale\(\s*1\s*,\s*-1\s*\)', '', transform).strip()
 
     # Render word glyphs
-    for piece in word_pieces:
-        vb_x, vb_y, vb_w, vb_h = piece['viewbox']
-        s = piece['scale']
-        tx = piece['x_offset'] - vb_x * s
-        ty = -vb_y * s + piece['y_offset']
-
-        for path in piece['paths']:
-            transform = path.get('transform', '')
+    for piece in layout.word_pieces:
+        vb_x, vb_y, vb_w, vb_h = piece.viewbox
+        s = piece.scale_x
+        tx = piece.x_offset - vb_x * s
+        ty = -vb_y * s + piece.y_offset
+
+        for path in piece.paths:
+            transform = path.transform
             has_flip = 'scale(1,-1)' in transform.replace(' ', '')
             inner_transform = strip_flip_transform(transform) if has_flip else transform
             inner_transform = inner_transform.strip()
@@ -607,48 +702,48 @@ def generate(text):
             if inner_transform:
                 svg_parts.append(
                     f'  <g transform="{outer}">'
-                    f'<path d="{path["d"]}" transform="{inner_transform}" fill="#000000" />'
+                    f'<path d="{path.d}" transform="{inner_transform}" fill="#000000" />'
                     f'</g>'
                 )
             else:
                 svg_parts.append(
-                    f'  <path d="{path["d"]}"'
+                    f'  <path d="{path.d}"'
                     f' transform="{outer}"'
                     f' fill="#000000" />'
                 )
 
     # Render cartouche pieces behind syllables
-    for piece in cartouche_pieces:
-        vb_x, vb_y, vb_w, vb_h = piece['viewbox']
-        sx = piece['scale_x']
-        sy = piece['scale_y']
-        tx = piece['x_offset'] - vb_x * sx
-        ty = piece['y_offset'] - vb_y * sy
-
-        for path in piece['paths']:
-            inner_transform = (path.get('transform') or '').strip()
+    for piece in layout.cartouche_pieces:
+        vb_x, vb_y, vb_w, vb_h = piece.viewbox
+        sx = piece.scale_x
+        sy = piece.scale_y
+        tx = piece.x_offset - vb_x * sx
+        ty = piece.y_offset - vb_y * sy
+
+        for path in piece.paths:
+            inner_transform = path.transform.strip()
             if inner_transform:
                 svg_parts.append(
                     f'  <g transform="translate({tx:.2f},{ty:.2f}) scale({sx:.4f},{sy:.4f})">'
-                    f'<path d="{path["d"]}" transform="{inner_transform}" fill="#000000" />'
+                    f'<path d="{path.d}" transform="{inner_transform}" fill="#000000" />'
                     f'</g>'
                 )
             else:
                 svg_parts.append(
-                    f'  <path d="{path["d"]}"'
+                    f'  <path d="{path.d}"'
                     f' transform="translate({tx:.2f},{ty:.2f}) scale({sx:.4f},{sy:.4f})"'
                     f' fill="#000000" />'
                 )
 
     # Render syllable glyphs
-    for piece in syllable_pieces:
-        vb_x, vb_y, vb_w, vb_h = piece['viewbox']
-        s = piece['scale']
-        tx = piece['x_offset'] - vb_x * s
-        ty = -vb_y * s + piece['y_offset']
-
-        for path in piece['paths']:
-            transform = path.get('transform', '')
+    for piece in layout.syllable_pieces:
+        vb_x, vb_y, vb_w, vb_h = piece.viewbox
+        s = piece.scale_x
+        tx = piece.x_offset - vb_x * s
+        ty = -vb_y * s + piece.y_offset
+
+        for path in piece.paths:
+            transform = path.transform
             has_flip = 'scale(1,-1)' in transform.replace(' ', '')
             inner_transform = strip_flip_transform(transform) if has_flip else transform
             inner_transform = inner_transform.strip()
@@ -661,38 +756,39 @@ def generate(text):
             if inner_transform:
                 svg_parts.append(
                     f'  <g transform="{outer}">'
-                    f'<path d="{path["d"]}" transform="{inner_transform}" fill="#000000" />'
+                    f'<path d="{path.d}" transform="{inner_transform}" fill="#000000" />'
                     f'</g>'
                 )
             else:
                 svg_parts.append(
-                    f'  <path d="{path["d"]}"'
+                    f'  <path d="{path.d}"'
                     f' transform="{outer}"'
                     f' fill="#000000" />'
                 )
 
     svg_parts.append('</svg>')
     svg_content = '\n'.join(svg_parts) + '\n'
+    sidecar = '\n'.join(description_lines + [''] + categories) + '\n'
+    return svg_content, sidecar
 
-    output_dir = ROOT_DIR / 'output'
-    output_dir.mkdir(exist_ok=True)
-    if word_tokens and sound_name:
-        filename_text = f'{" ".join(word_tokens)}, {sound_name.lower()}'
-    elif sound_name:
-        filename_text = f', {sound_name.lower()}'
-    else:
-        filename_text = text
-    output_name = f'sitelen ilo pona - {safe_filename(filename_text)}.svg'
-    output_path = output_dir / output_name
-    with open(str(output_path), 'w', encoding='utf-8') as f:
-        f.write(svg_content)
-
-    # Write a Commons-friendly description + categories sidecar
-    sidecar_name = f'{output_name}.wiki.txt'
-    sidecar_path = output_dir / sidecar_name
-    sidecar_lines = description_lines + [''] + categories
-    with open(str(sidecar_path), 'w', encoding='utf-8') as f:
-        f.write('\n'.join(sidecar_lines) + '\n')
+
+@traced()
+def generate(text):
+    """Generate a composed SVG for the given toki pona phrase."""
+    svg_content, sidecar = svg_document(layout(text))
+
+    with span('write'):
+        output_dir = ROOT_DIR / 'output'
+        output_dir.mkdir(exist_ok=True)
+        output_name = output_filename(text)
+        output_path = output_dir / output_name
+        with open(str(output_path), 'w', encoding='utf-8') as f:
+            f.write(svg_content)
+
+        # Write a Commons-friendly description + categories sidecar
+        sidecar_path = output_dir / f'{output_name}.wiki.txt'
+        with open(str(sidecar_path), 'w', encoding='utf-8') as f:
+            f.write(sidecar)
 
     print(f'\n  Output: {output_path}')
     return output_path
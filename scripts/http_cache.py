@@ -0,0 +1,169 @@
+"""
+On-disk HTTP response cache for the MediaWiki fetch scripts.
+
+Entries are keyed by a hash of host, path and sorted query parameters. Each
+entry is two files in the cache directory:
+  <key>.gz    the response body, gzip-compressed
+  <key>.json  url, ETag, Last-Modified and fetch time
+
+An entry younger than max_age seconds is served without touching the
+network. Older entries are revalidated with If-None-Match /
+If-Modified-Since, so an unchanged resource costs one empty 304 response.
+When the bodies exceed max_bytes the least recently used entries are
+evicted.
+
+Used through MediaWikiClient(cache=ResponseCache(...)).
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+DEFAULT_CACHE_DIR = ROOT_DIR / '.cache' / 'http'
+DEFAULT_MAX_AGE = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+def cache_key(host, path, params):
+    """Stable key for a GET of host+path with params (order-insensitive)."""
+    query = urllib.parse.urlencode(sorted((str(k), str(v)) for k, v in params.items()))
+    return hashlib.sha256(f'{host}{path}?{query}'.encode('utf-8')).hexdigest()
+
+
+def _write_atomic(path, data):
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class ResponseCache:
+    """Compressed, size-bounded response store with conditional revalidation."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_age=DEFAULT_MAX_AGE,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def _paths(self, key):
+        return self.cache_dir / f'{key}.gz', self.cache_dir / f'{key}.json'
+
+    def lookup(self, key):
+        """Return (body, meta) for a cached entry, or (None, None)."""
+        body_path, meta_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            body = gzip.decompress(body_path.read_bytes())
+        except (OSError, ValueError, EOFError):
+            return None, None
+        return body, meta
+
+    def fresh(self, meta):
+        """True if meta was fetched less than max_age seconds ago."""
+        return time.time() - meta.get('fetched', 0) < self.max_age
+
+    def conditional_headers(self, meta):
+        """Request headers that let the server answer 304 for this entry."""
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def hit(self, key):
+        """Record a fresh hit and mark the entry recently used."""
+        self._count('hits')
+        self._touch(key)
+
+    def revalidated(self, key, meta):
+        """Record a 304 and restart the entry's max-age clock."""
+        self._count('revalidated')
+        meta['fetched'] = time.time()
+        _write_atomic(self._paths(key)[1], json.dumps(meta).encode('utf-8'))
+        self._touch(key)
+
+    def store(self, key, url, body, etag=None, last_modified=None):
+        """Record a miss and save body with its validators."""
+        self._count('misses')
+        body_path, meta_path = self._paths(key)
+        _write_atomic(body_path, gzip.compress(body, compresslevel=6))
+        meta = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched': time.time(),
+        }
+        _write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def _touch(self, key):
+        try:
+            os.utime(self._paths(key)[0])
+        except OSError:
+            pass
+
+    def evict(self):
+        """Delete least recently used entries until bodies fit in max_bytes."""
+        entries = []
+        total = 0
+        for body_path in self.cache_dir.glob('*.gz'):
+            try:
+                st = body_path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, body_path))
+            total += st.st_size
+        entries.sort()
+        evicted = 0
+        for _, size, body_path in entries:
+            if total <= self.max_bytes:
+                break
+            body_path.unlink(missing_ok=True)
+            body_path.with_suffix('.json').unlink(missing_ok=True)
+            total -= size
+            evicted += 1
+        self._count('evicted', evicted)
+        return evicted
+
+    def report(self):
+        """One-line summary of cache effectiveness for the end of a run."""
+        s = self.stats
+        requests = s['hits'] + s['revalidated'] + s['misses']
+        saved = s['hits'] + s['revalidated']
+        rate = f'{100 * saved / requests:.0f}%' if requests else 'n/a'
+        return (f'HTTP cache: {s["hits"]} hits, {s["revalidated"]} revalidated (304), '
+                f'{s["misses"]} misses, {s["evicted"]} evicted — {rate} served from cache')
+
+
+def add_cache_arguments(parser):
+    """Add the shared --no-cache/--cache-dir/--max-age/--cache-size options."""
+    parser.add_argument('--no-cache', action='store_true',
+                        help='bypass the on-disk HTTP response cache')
+    parser.add_argument('--cache-dir', type=Path, default=DEFAULT_CACHE_DIR,
+                        help=f'response cache directory (default {DEFAULT_CACHE_DIR.relative_to(ROOT_DIR)})')
+    parser.add_argument('--max-age', type=float, default=DEFAULT_MAX_AGE,
+                        help='seconds a cached response is used without revalidation '
+                             f'(default {DEFAULT_MAX_AGE})')
+    parser.add_argument('--cache-size', type=float, default=DEFAULT_MAX_BYTES / 2**20,
+                        help=f'cache size limit in MiB (default {DEFAULT_MAX_BYTES // 2**20})')
+
+
+def cache_from_args(args):
+    """Build the ResponseCache selected by add_cache_arguments() options."""
+    if args.no_cache:
+        return None
+    return ResponseCache(args.cache_dir, max_age=args.max_age,
+                         max_bytes=int(args.cache_size * 2**20))
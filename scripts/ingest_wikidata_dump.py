@@ -0,0 +1,204 @@
+"""
+Build wikidata_tok_labels.csv from a local Wikidata JSON dump instead of the API.
+
+Reads a line-delimited entity dump (latest-all.json, .json.gz or .json.bz2
+from dumps.wikimedia.org) and writes the same qid,label,tok_title CSV and
+names file as fetch_wikidata_sparql.py, for every item with a tok label,
+and replaces the items table of the pipeline database (--no-db to skip).
+Like the fetcher's haslabel:tok search, this keeps items without a tokwiki
+sitelink (their tok_title is empty); --require-sitelink keeps only the
+items that have one.
+
+The main process only decompresses and cuts the stream into ~16 MiB blocks
+at line boundaries. A pool of worker processes splits the blocks into
+lines, discards every line that does not contain the raw bytes '"tok"'
+(almost all of them), or '"tokwiki"' with --require-sitelink, before any
+JSON decoding, and parses the rest.
+Results come back in dump order. At most two blocks per worker are in
+flight, so memory stays bounded when the workers fall behind. When pigz or
+lbzip2 is on PATH it is used for decompression, which moves that work onto
+further cores as well.
+
+Usage:
+    python scripts/ingest_wikidata_dump.py latest-all.json.bz2 [--workers 8]
+    python scripts/ingest_wikidata_dump.py dump.json.gz --output /tmp/labels.csv
+"""
+
+import argparse
+import bz2
+import csv
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from collections import deque
+from multiprocessing import Pool
+from pathlib import Path
+
+from fetch_wikidata_sparql import LABELS_FILE, NAMES_FILE, write_label_files
+import pipeline_db
+
+BLOCK_SIZE = 16 * 1024 * 1024
+PREFILTER = b'"tok"'
+SITELINK_PREFILTER = b'"tokwiki"'
+
+# (suffix, external parallel decompressor, Python fallback)
+DECOMPRESSORS = {
+    '.gz': ('pigz', gzip.open),
+    '.bz2': ('lbzip2', bz2.open),
+}
+
+
+def open_dump(path):
+    """Open path for binary reading, decompressing by suffix.
+
+    Returns (stream, process); process is the external decompressor, if any.
+    """
+    suffix = path.suffix.lower()
+    if suffix not in DECOMPRESSORS:
+        return open(path, 'rb'), None
+    tool, fallback = DECOMPRESSORS[suffix]
+    if shutil.which(tool):
+        proc = subprocess.Popen([tool, '-dc', str(path)], stdout=subprocess.PIPE,
+                                bufsize=BLOCK_SIZE)
+        return proc.stdout, proc
+    return fallback(path, 'rb'), None
+
+
+def iter_blocks(stream, block_size=BLOCK_SIZE):
+    """Yield chunks of stream that each end on a line boundary."""
+    carry = b''
+    while True:
+        data = stream.read(block_size)
+        if not data:
+            break
+        data = carry + data
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            carry = data
+            continue
+        carry = data[cut:]
+        yield data[:cut]
+    if carry:
+        yield carry
+
+
+def parse_entity_line(line, require_sitelink=False):
+    """Return a {'qid', 'label', 'tok_title'} row for a tok-labelled item line, else None.
+
+    With require_sitelink, items without a tokwiki sitelink give None too.
+    """
+    line = line.strip().rstrip(b',')
+    if not line.startswith(b'{'):
+        return None
+    entity = json.loads(line)
+    if entity.get('type') != 'item':
+        return None
+    label = entity.get('labels', {}).get('tok', {}).get('value')
+    if not label:
+        return None
+    tok_title = entity.get('sitelinks', {}).get('tokwiki', {}).get('title', '')
+    if require_sitelink and not tok_title:
+        return None
+    return {'qid': entity['id'], 'label': label, 'tok_title': tok_title}
+
+
+def parse_block(block, require_sitelink=False):
+    """Worker: return (rows, line count) for one block of dump lines."""
+    rows = []
+    prefilter = SITELINK_PREFILTER if require_sitelink else PREFILTER
+    lines = block.split(b'\n')
+    for line in lines:
+        if prefilter not in line:
+            continue
+        row = parse_entity_line(line, require_sitelink)
+        if row:
+            rows.append(row)
+    return rows, len(lines) - 1
+
+
+def iter_parsed_blocks(pool, blocks, window, require_sitelink=False):
+    """parse_block() over blocks in pool, yielding results in order.
+
+    At most window blocks are queued or being parsed at a time, so reading
+    the dump waits for the workers instead of piling blocks up in memory.
+    """
+    pending = deque()
+    for block in blocks:
+        pending.append(pool.apply_async(parse_block, (block, require_sitelink)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def iter_dump_rows(path, workers=None, block_size=BLOCK_SIZE, stats=None,
+                   require_sitelink=False):
+    """Yield label rows from the dump at path, in dump order."""
+    stats = {} if stats is None else stats
+    stats.setdefault('lines', 0)
+    window = 2 * (workers or os.cpu_count() or 1)
+    stream, proc = open_dump(path)
+    try:
+        with Pool(workers) as pool:
+            results = iter_parsed_blocks(pool, iter_blocks(stream, block_size), window,
+                                         require_sitelink)
+            for n, (rows, lines) in enumerate(results, 1):
+                stats['lines'] += lines
+                yield from rows
+                if n % 64 == 0:
+                    print(f'  ...{stats["lines"]:,} entities scanned')
+    finally:
+        stream.close()
+        if proc:
+            proc.wait()
+    if proc and proc.returncode:
+        raise RuntimeError(f'{proc.args[0]} exited with status {proc.returncode}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract tok labels from a Wikidata JSON dump.')
+    parser.add_argument('dump', type=Path, help='latest-all.json[.gz|.bz2]')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='parser processes (default: CPU count)')
+    parser.add_argument('--output', type=Path, default=LABELS_FILE,
+                        help=f'labels CSV to write (default {LABELS_FILE.name})')
+    parser.add_argument('--names', type=Path, default=NAMES_FILE,
+                        help=f'names file to write (default {NAMES_FILE.name})')
+    parser.add_argument('--no-db', action='store_true',
+                        help='do not update the pipeline database items table')
+    parser.add_argument('--require-sitelink', action='store_true',
+                        help='keep only items with a tokwiki sitelink')
+    args = parser.parse_args()
+
+    if not args.dump.exists():
+        print(f'Missing dump: {args.dump}', file=sys.stderr)
+        sys.exit(1)
+
+    print(f'Scanning {args.dump} with {args.workers} workers...')
+    start = time.perf_counter()
+    stats = {}
+    rows = iter_dump_rows(args.dump, args.workers, stats=stats,
+                          require_sitelink=args.require_sitelink)
+    total = write_label_files(rows, args.output, args.names)
+    elapsed = time.perf_counter() - start
+
+    print(f'Scanned {stats["lines"]:,} entities in {elapsed:.1f}s; '
+          f'found {total} items with "tok" labels'
+          f'{" and tokwiki sitelinks" if args.require_sitelink else ""}.')
+    print(f'Wrote {args.output}')
+    print(f'Wrote {args.names}')
+
+    if not args.no_db:
+        conn = pipeline_db.connect()
+        with open(args.output, encoding='utf-8', newline='') as f:
+            pipeline_db.replace_items(conn, csv.DictReader(f))
+        conn.close()
+        print(f'Updated {pipeline_db.DB_PATH}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Pooled, rate-limited client for the MediaWiki action API.
+
+Shared by the fetch scripts. Each worker thread keeps its own persistent
+HTTP(S) connection per host, responses are requested gzip-compressed, all
+threads draw from a single token bucket so the combined request rate stays
+polite, and failed or throttled requests are retried with exponential
+backoff (honouring Retry-After when the server sends one). An optional
+http_cache.ResponseCache serves repeated requests from disk.
+
+Usage:
+    client = MediaWikiClient('https://www.wikidata.org/w/api.php')
+    data = client.get({'action': 'wbgetentities', 'ids': 'Q5', 'format': 'json'})
+"""
+
+import gzip
+import http.client
+import json
+import sys
+import threading
+import time
+import urllib.parse
+
+from http_cache import cache_key
+from tracing import span
+
+USER_AGENT = 'SitelenBot/1.0 (https://github.com/Emma-Leonhart/Sitelen)'
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `burst` saved."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class APIError(Exception):
+    """Raised when a request keeps failing after all retries."""
+
+
+class MediaWikiClient:
+    """GET JSON from a MediaWiki api.php over pooled keep-alive connections."""
+
+    def __init__(self, api_url, user_agent=USER_AGENT, rate=5.0, burst=5,
+                 retries=4, backoff=2.0, timeout=60, cache=None):
+        parts = urllib.parse.urlsplit(api_url)
+        self.scheme = parts.scheme
+        self.host = parts.netloc
+        self.path = parts.path or '/'
+        self.user_agent = user_agent
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            cls = (http.client.HTTPSConnection if self.scheme == 'https'
+                   else http.client.HTTPConnection)
+            conn = cls(self.host, timeout=self.timeout)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _request(self, url, extra_headers=None):
+        """One GET over this thread's connection. Returns (status, response, body)."""
+        conn = self._connection()
+        headers = {
+            'User-Agent': self.user_agent,
+            'Accept-Encoding': 'gzip',
+        }
+        if extra_headers:
+            headers.update(extra_headers)
+        conn.request('GET', url, headers=headers)
+        resp = conn.getresponse()
+        body = resp.read()
+        if resp.getheader('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        return resp.status, resp, body
+
+    def get(self, params):
+        """GET api.php with params and return the decoded JSON response."""
+        url = self.path + '?' + urllib.parse.urlencode(params)
+        key = cached = meta = None
+        if self.cache:
+            key = cache_key(self.host, self.path, params)
+            cached, meta = self.cache.lookup(key)
+            if cached is not None and self.cache.fresh(meta):
+                self.cache.hit(key)
+                return json.loads(cached.decode('utf-8'))
+        conditional = self.cache.conditional_headers(meta) if cached is not None else None
+
+        delay = self.backoff
+        for attempt in range(self.retries):
+            if self.bucket:
+                with span('rate_limit_wait'):
+                    self.bucket.acquire()
+            try:
+                with span('http_request', action=params.get('action', '')):
+                    status, resp, body = self._request(url, conditional)
+                if status == 304 and cached is not None:
+                    self.cache.revalidated(key, meta)
+                    return json.loads(cached.decode('utf-8'))
+                if status == 200:
+                    with span('json_decode'):
+                        data = json.loads(body.decode('utf-8'))
+                    if self.cache:
+                        self.cache.store(key, f'{self.scheme}://{self.host}{url}', body,
+                                         etag=resp.getheader('ETag'),
+                                         last_modified=resp.getheader('Last-Modified'))
+                    return data
+                if status not in RETRY_STATUSES:
+                    raise APIError(f'HTTP {status} for {url}')
+                retry_after = resp.getheader('Retry-After')
+                wait = float(retry_after) if retry_after and retry_after.isdigit() else delay
+                error = f'HTTP {status}'
+            except (OSError, http.client.HTTPException, ValueError) as exc:
+                self._reset_connection()
+                wait = delay
+                error = exc
+            if attempt == self.retries - 1:
+                raise APIError(f'{error} (gave up after {self.retries} attempts)')
+            print(f'  Attempt {attempt + 1} failed: {error}. Retrying in {wait:g}s...',
+                  file=sys.stderr)
+            time.sleep(wait)
+            delay *= 2
+
+    def close(self):
+        """Close every pooled connection and trim the cache, if any."""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        if self.cache:
+            self.cache.evict()
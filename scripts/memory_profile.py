@@ -0,0 +1,176 @@
+"""
+Memory profiling and a memory budget for long batch runs.
+
+    memory = memory_from_args(args)      # None unless --memory-profile/--memory-budget
+    with stage(memory, 'render'):
+        ...
+        if memory:
+            memory.check()               # fail early inside long loops
+    if memory:
+        memory.report()
+
+With --memory-profile, tracemalloc records allocations: each stage reports
+its peak and the memory still held when it ended, and the report lists the
+source lines holding the most memory at the stage that peaked highest.
+Each stage also reports the resident set size when it ended (from
+/proc/self/statm, where there is one); the report ends with the process's
+peak RSS, a high-water mark over the whole run (from getrusage).
+
+--memory-budget MIB fails the run as soon as a check finds peak RSS above
+the budget (or, where getrusage is unavailable, the traced peak), so CI
+runners stop before the kernel kills them.
+"""
+
+import os
+import sys
+import tracemalloc
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MIB = 1024 * 1024
+
+# tracemalloc frames kept per allocation; the report groups by the innermost
+TRACE_FRAMES = 1
+
+
+def current_rss():
+    """Resident set size of this process now, in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None if unknown.
+
+    This is a high-water mark since the process started, so it never falls.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised by MemoryProfiler.check() when peak memory is over budget."""
+
+
+class MemoryProfiler:
+    """Per-stage tracemalloc peaks, top allocation sites and a memory budget."""
+
+    def __init__(self, profile=True, budget_mib=None, top=10):
+        self.profile = profile
+        self.budget = budget_mib * MIB if budget_mib else None
+        self.top = top
+        self.stages = []        # (name, traced peak, traced at end, RSS at end)
+        self.peak_snapshot = None
+        self.peak_traced = 0
+        if profile:
+            tracemalloc.start(TRACE_FRAMES)
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def _finish_stage(self, name):
+        current = peak = 0
+        if self.profile:
+            current, peak = tracemalloc.get_traced_memory()
+            if peak >= self.peak_traced:
+                self.peak_traced = peak
+                self.peak_snapshot = tracemalloc.take_snapshot()
+        self.stages.append((name, peak, current, current_rss()))
+        self.check(name)
+
+    def check(self, where=''):
+        """Raise MemoryBudgetExceeded if peak memory so far is over the budget."""
+        if not self.budget:
+            return
+        used = peak_rss()
+        if used is None and self.profile:
+            used = tracemalloc.get_traced_memory()[1]
+        if used is not None and used > self.budget:
+            place = f' during {where}' if where else ''
+            raise MemoryBudgetExceeded(
+                f'peak memory {used / MIB:.1f} MiB{place} exceeds the budget of '
+                f'{self.budget / MIB:.1f} MiB')
+
+    def report(self, file=sys.stdout):
+        """Print per-stage memory and the top allocation sites."""
+        print('\nMemory:', file=file)
+        if self.profile:
+            print(f'  {"stage":20} {"traced peak":>12} {"at end":>10} {"RSS at end":>12}',
+                  file=file)
+        for name, peak, current, rss in self.stages:
+            rss_text = f'{rss / MIB:8.1f} MiB' if rss is not None else '         n/a'
+            if self.profile:
+                print(f'  {name:20} {peak / MIB:8.1f} MiB {current / MIB:6.1f} MiB   {rss_text}',
+                      file=file)
+            else:
+                print(f'  {name:20} RSS at end {rss_text}', file=file)
+        rss = peak_rss()
+        if rss is not None:
+            print(f'  Peak RSS (high-water mark of the whole run): {rss / MIB:.1f} MiB',
+                  file=file)
+        if self.budget:
+            print(f'  Budget: {self.budget / MIB:.1f} MiB', file=file)
+
+        if self.peak_snapshot is None:
+            return
+        snapshot = self.peak_snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        ])
+        print(f'  Top {self.top} allocation sites at the highest stage peak:', file=file)
+        for stat in snapshot.statistics('lineno')[:self.top]:
+            frame = stat.traceback[0]
+            print(f'    {stat.size / 1024:9.1f} KiB {stat.count:8} blocks  '
+                  f'{frame.filename}:{frame.lineno}', file=file)
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.profile:
+            tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.profiler._finish_stage(self.name)
+        return False
+
+
+def stage(profiler, name):
+    """profiler.stage(name), or a no-op when profiling is off (profiler is None)."""
+    return profiler.stage(name) if profiler else nullcontext()
+
+
+def add_memory_arguments(parser):
+    """Add the shared --memory-profile/--memory-budget/--memory-top options."""
+    parser.add_argument('--memory-profile', action='store_true',
+                        help='trace allocations per stage and report the top allocation sites')
+    parser.add_argument('--memory-budget', type=float, metavar='MIB',
+                        help='fail the run when peak memory exceeds this many MiB')
+    parser.add_argument('--memory-top', type=int, default=10, metavar='N',
+                        help='allocation sites to list in the memory report (default 10)')
+
+
+def memory_from_args(args):
+    """The MemoryProfiler selected by add_memory_arguments() options, or None."""
+    if not (args.memory_profile or args.memory_budget):
+        return None
+    return MemoryProfiler(profile=args.memory_profile, budget_mib=args.memory_budget,
+                          top=args.memory_top)
@@ -0,0 +1,418 @@
+"""
+Outline simplification for the hand-traced FontForge glyphs.
+
+The ..sfdir glyphs are traced with many short segments. simplify_contours()
+takes contours in the splineset.py form ('m'/'l'/'c' tuples, absolute
+coordinates) and, within a tolerance in font units:
+
+  1. drops zero-length segments,
+  2. turns cubics that are straight within tolerance/2 into lines,
+  3. merges runs of lines whose inner points lie within tolerance/2 of
+     the combined line,
+  4. refits runs of smoothly joined cubics as one cubic when the fit stays
+     within tolerance of the original run (Schneider's least-squares fit
+     with the run's end tangents kept).
+
+Steps 2-3 and step 4 never touch the same segments. Each simplified
+contour is then measured against the original with max_deviation() (the
+largest distance between the two, both ways, on densely sampled outlines)
+and is only used if that is within the tolerance.
+"""
+
+import math
+from collections import defaultdict
+
+DEFAULT_TOLERANCE = 1.0
+
+# Joins between cubics sharper than this (degrees) are corners and kept
+SMOOTH_ANGLE = 12.0
+
+EPSILON = 1e-6
+FIT_SAMPLES = 8        # samples per original segment when fitting
+CHECK_SAMPLES = 16     # samples per segment when measuring deviation
+REPARAMETERIZE = 4     # Newton reparameterization rounds per fit
+
+
+# -- geometry ----------------------------------------------------------------
+
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1])
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1]
+
+
+def _length(a):
+    return math.hypot(a[0], a[1])
+
+
+def _unit(a):
+    n = _length(a)
+    return (a[0] / n, a[1] / n) if n > EPSILON else (0.0, 0.0)
+
+
+def _bezier(p0, c1, c2, p3, t):
+    s = 1 - t
+    a, b, c, d = s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t
+    return (a * p0[0] + b * c1[0] + c * c2[0] + d * p3[0],
+            a * p0[1] + b * c1[1] + c * c2[1] + d * p3[1])
+
+
+def _bezier_d1(p0, c1, c2, p3, t):
+    s = 1 - t
+    return (3 * (s * s * (c1[0] - p0[0]) + 2 * s * t * (c2[0] - c1[0]) + t * t * (p3[0] - c2[0])),
+            3 * (s * s * (c1[1] - p0[1]) + 2 * s * t * (c2[1] - c1[1]) + t * t * (p3[1] - c2[1])))
+
+
+def _bezier_d2(p0, c1, c2, p3, t):
+    s = 1 - t
+    return (6 * (s * (c2[0] - 2 * c1[0] + p0[0]) + t * (p3[0] - 2 * c2[0] + c1[0])),
+            6 * (s * (c2[1] - 2 * c1[1] + p0[1]) + t * (p3[1] - 2 * c2[1] + c1[1])))
+
+
+def _point_segment_distance(p, a, b):
+    abx, aby = b[0] - a[0], b[1] - a[1]
+    apx, apy = p[0] - a[0], p[1] - a[1]
+    denom = abx * abx + aby * aby
+    t = 0.0 if denom < EPSILON else max(0.0, min(1.0, (apx * abx + apy * aby) / denom))
+    return math.hypot(apx - t * abx, apy - t * aby)
+
+
+def _sample(start, seg, n):
+    """n + 1 points along a segment from start, both ends included."""
+    if seg[0] == 'l':
+        end = seg[1]
+        return [(start[0] + (end[0] - start[0]) * i / n,
+                 start[1] + (end[1] - start[1]) * i / n) for i in range(n + 1)]
+    return [_bezier(start, seg[1], seg[2], seg[3], i / n) for i in range(n + 1)]
+
+
+class _EdgeGrid:
+    """Polyline edges bucketed in square cells, for nearest-edge distance queries."""
+
+    def __init__(self, polylines, cell=4.0):
+        self.cell = cell
+        self.grid = grid = defaultdict(list)
+        for poly in polylines:
+            for a, b in zip(poly, poly[1:]):
+                # Split long edges so each piece only touches a few cells
+                pieces = int(max(abs(b[0] - a[0]), abs(b[1] - a[1])) // cell) + 1
+                for k in range(pieces):
+                    if pieces == 1:
+                        p, q = a, b
+                    else:
+                        p = (a[0] + (b[0] - a[0]) * k / pieces, a[1] + (b[1] - a[1]) * k / pieces)
+                        q = (a[0] + (b[0] - a[0]) * (k + 1) / pieces,
+                             a[1] + (b[1] - a[1]) * (k + 1) / pieces)
+                    edge = (p, q)
+                    gx0, gx1 = int(min(p[0], q[0]) // cell), int(max(p[0], q[0]) // cell)
+                    gy0, gy1 = int(min(p[1], q[1]) // cell), int(max(p[1], q[1]) // cell)
+                    for gx in range(gx0, gx1 + 1):
+                        for gy in range(gy0, gy1 + 1):
+                            grid[gx, gy].append(edge)
+        xs = [key[0] for key in self.grid] or [0]
+        ys = [key[1] for key in self.grid] or [0]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+
+    def distance(self, p, limit=math.inf):
+        """Distance from p to the nearest edge, or limit if no edge is closer."""
+        cell = self.cell
+        gx, gy = int(p[0] // cell), int(p[1] // cell)
+        x0, y0, x1, y1 = self.bounds
+        max_ring = max(abs(gx - x0), abs(gx - x1), abs(gy - y0), abs(gy - y1))
+        best = limit
+        ring = 0
+        while ring <= max_ring and (ring - 1) * cell <= best:
+            for dx in range(-ring, ring + 1):
+                for dy in (range(-ring, ring + 1) if abs(dx) == ring else (-ring, ring)):
+                    for a, b in self.grid.get((gx + dx, gy + dy), ()):
+                        d = _point_segment_distance(p, a, b)
+                        if d < best:
+                            best = d
+            ring += 1
+        return best
+
+    def within(self, points, tolerance):
+        """True if every point is within tolerance of some edge."""
+        return all(self.distance(p, tolerance * 2) <= tolerance for p in points)
+
+
+# -- contour form ------------------------------------------------------------
+
+def _to_segments(contour):
+    """[('m', x, y), ('l', x, y), ('c', ...)] -> (start, [('l', p) | ('c', c1, c2, p)])"""
+    start = (contour[0][1], contour[0][2])
+    segs = []
+    for op in contour[1:]:
+        if op[0] == 'l':
+            segs.append(('l', (op[1], op[2])))
+        elif op[0] == 'c':
+            segs.append(('c', (op[1], op[2]), (op[3], op[4]), (op[5], op[6])))
+    return start, segs
+
+
+def _from_segments(start, segs):
+    contour = [('m', start[0], start[1])]
+    for seg in segs:
+        if seg[0] == 'l':
+            contour.append(('l', seg[1][0], seg[1][1]))
+        else:
+            contour.append(('c', seg[1][0], seg[1][1], seg[2][0], seg[2][1],
+                            seg[3][0], seg[3][1]))
+    return contour
+
+
+def _starts(start, segs):
+    """Start point of each segment."""
+    points = [start]
+    for seg in segs[:-1]:
+        points.append(seg[-1])
+    return points
+
+
+def node_count(contours):
+    """On-curve points in contours."""
+    return sum(len(contour) for contour in contours)
+
+
+# -- simplification passes ---------------------------------------------------
+
+def _drop_empty(start, segs):
+    kept = []
+    prev = start
+    for seg in segs:
+        points = seg[1:]
+        if all(_length(_sub(p, prev)) < EPSILON for p in points):
+            continue
+        kept.append(seg)
+        prev = seg[-1]
+    return kept
+
+
+def _straighten(start, segs, tolerance):
+    result = []
+    for p0, seg in zip(_starts(start, segs), segs):
+        if seg[0] == 'c':
+            samples = _sample(p0, seg, FIT_SAMPLES)
+            if max(_point_segment_distance(p, p0, seg[3]) for p in samples) <= tolerance:
+                seg = ('l', seg[3])
+        result.append(seg)
+    return result
+
+
+def _merge_lines(start, segs, tolerance):
+    result = []
+    run_start = None
+    inner = []   # points between run_start and the end of the current line run
+    prev = start
+    for seg in segs:
+        if seg[0] == 'l' and run_start is not None:
+            candidate = inner + [prev]
+            if all(_point_segment_distance(p, run_start, seg[1]) <= tolerance
+                   for p in candidate):
+                inner = candidate
+                result[-1] = seg
+                prev = seg[1]
+                continue
+        if seg[0] == 'l':
+            run_start, inner = prev, []
+        else:
+            run_start = None
+        result.append(seg)
+        prev = seg[-1]
+    return result
+
+
+def _tangent_in(p0, seg):
+    """Unit direction leaving p0 along a cubic."""
+    for p in seg[1:]:
+        d = _sub(p, p0)
+        if _length(d) > EPSILON:
+            return _unit(d)
+    return (0.0, 0.0)
+
+
+def _tangent_out(p0, seg):
+    """Unit direction arriving at a cubic's end point."""
+    end = seg[3]
+    for p in (seg[2], seg[1], p0):
+        d = _sub(end, p)
+        if _length(d) > EPSILON:
+            return _unit(d)
+    return (0.0, 0.0)
+
+
+def _smooth_join(p0a, a, p0b, b):
+    cos = _dot(_tangent_out(p0a, a), _tangent_in(p0b, b))
+    return cos >= math.cos(math.radians(SMOOTH_ANGLE))
+
+
+def _fit_cubic(points, params, p0, p3, t1, t2):
+    """Least-squares cubic from p0 to p3 leaving along t1 and arriving along -t2."""
+    c00 = c01 = c11 = x0 = x1 = 0.0
+    for p, u in zip(points, params):
+        s = 1 - u
+        b0, b1, b2, b3 = s * s * s, 3 * s * s * u, 3 * s * u * u, u * u * u
+        a0 = (t1[0] * b1, t1[1] * b1)
+        a1 = (t2[0] * b2, t2[1] * b2)
+        c00 += _dot(a0, a0)
+        c01 += _dot(a0, a1)
+        c11 += _dot(a1, a1)
+        tmp = (p[0] - (p0[0] * (b0 + b1) + p3[0] * (b2 + b3)),
+               p[1] - (p0[1] * (b0 + b1) + p3[1] * (b2 + b3)))
+        x0 += _dot(a0, tmp)
+        x1 += _dot(a1, tmp)
+    det = c00 * c11 - c01 * c01
+    chord = _length(_sub(p3, p0))
+    alpha1 = alpha2 = 0.0
+    if abs(det) > EPSILON:
+        alpha1 = (x0 * c11 - x1 * c01) / det
+        alpha2 = (c00 * x1 - c01 * x0) / det
+    if alpha1 < EPSILON * chord or alpha2 < EPSILON * chord:
+        alpha1 = alpha2 = chord / 3
+    return ((p0[0] + t1[0] * alpha1, p0[1] + t1[1] * alpha1),
+            (p3[0] + t2[0] * alpha2, p3[1] + t2[1] * alpha2))
+
+
+def _reparameterize(curve, points, params):
+    p0, c1, c2, p3 = curve
+    result = []
+    for p, u in zip(points, params):
+        q = _bezier(p0, c1, c2, p3, u)
+        d1 = _bezier_d1(p0, c1, c2, p3, u)
+        d2 = _bezier_d2(p0, c1, c2, p3, u)
+        diff = _sub(q, p)
+        denom = _dot(d1, d1) + _dot(diff, d2)
+        if abs(denom) > EPSILON:
+            u = max(0.0, min(1.0, u - _dot(diff, d1) / denom))
+        result.append(u)
+    return result
+
+
+def _refit_run(p0, run, tolerance):
+    """One cubic replacing run (cubics starting at p0) within tolerance, else None."""
+    points = [p0]
+    prev = p0
+    for seg in run:
+        points.extend(_sample(prev, seg, FIT_SAMPLES)[1:])
+        prev = seg[3]
+    p3 = prev
+
+    lengths = [0.0]
+    for a, b in zip(points, points[1:]):
+        lengths.append(lengths[-1] + _length(_sub(b, a)))
+    if lengths[-1] < EPSILON:
+        return None
+    params = [d / lengths[-1] for d in lengths]
+
+    t1 = _tangent_in(p0, run[0])
+    last_start = run[-2][3] if len(run) > 1 else p0
+    t2 = _tangent_out(last_start, run[-1])
+    t2 = (-t2[0], -t2[1])
+
+    original = []
+    prev = p0
+    for seg in run:
+        original.extend(_sample(prev, seg, CHECK_SAMPLES)[int(bool(original)):])
+        prev = seg[3]
+    original_grid = _EdgeGrid([original])
+
+    for _ in range(REPARAMETERIZE):
+        c1, c2 = _fit_cubic(points, params, p0, p3, t1, t2)
+        fitted = _sample(p0, ('c', c1, c2, p3), CHECK_SAMPLES * len(run))
+        if (_EdgeGrid([fitted]).within(points, tolerance) and
+                original_grid.within(fitted, tolerance)):
+            return ('c', c1, c2, p3)
+        params = _reparameterize((p0, c1, c2, p3), points, params)
+    return None
+
+
+def _refit_cubics(start, segs, tolerance):
+    starts = _starts(start, segs)
+    result = []
+    i = 0
+    while i < len(segs):
+        if segs[i][0] != 'c':
+            result.append(segs[i])
+            i += 1
+            continue
+        best, best_end = segs[i], i + 1
+        j = i + 1
+        while (j < len(segs) and segs[j][0] == 'c' and
+               _smooth_join(starts[j - 1], segs[j - 1], starts[j], segs[j])):
+            fit = _refit_run(starts[i], segs[i:j + 1], tolerance)
+            if fit is None:
+                break
+            best, best_end = fit, j + 1
+            j += 1
+        result.append(best)
+        i = best_end
+    return result
+
+
+def _simplify_once(contour, tolerance):
+    start, segs = _to_segments(contour)
+    segs = _drop_empty(start, segs)
+    segs = _straighten(start, segs, tolerance / 2)
+    segs = _merge_lines(start, segs, tolerance / 2)
+    segs = _refit_cubics(start, segs, tolerance)
+    return _from_segments(start, segs)
+
+
+def simplify_contour(contour, tolerance=DEFAULT_TOLERANCE):
+    """Simplified contour, checked to stay within tolerance of the original.
+
+    The fits are checked on samples, so a result can still overshoot
+    slightly between them; such contours are redone at half the tolerance,
+    and kept as they were if that overshoots too.
+    """
+    for attempt in (tolerance, tolerance / 2):
+        simplified = _simplify_once(contour, attempt)
+        if max_deviation([contour], [simplified]) <= tolerance:
+            return simplified
+    return contour
+
+
+def simplify_contours(contours, tolerance=DEFAULT_TOLERANCE):
+    """Simplified copy of contours, no point further than tolerance from the original."""
+    return [simplify_contour(contour, tolerance) for contour in contours]
+
+
+def add_simplify_arguments(parser):
+    """Add the --tolerance / --no-simplify options shared by the glyph scripts."""
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'outline simplification tolerance in font units '
+                             f'(default {DEFAULT_TOLERANCE})')
+    parser.add_argument('--no-simplify', action='store_true',
+                        help='use the traced outlines as they are')
+
+
+def tolerance_from_args(args):
+    """The simplification tolerance chosen on the command line, or None."""
+    return None if args.no_simplify or args.tolerance <= 0 else args.tolerance
+
+
+# -- checking ----------------------------------------------------------------
+
+def _polylines(contours, samples):
+    for contour in contours:
+        start, segs = _to_segments(contour)
+        points = [start]
+        prev = start
+        for seg in segs:
+            points.extend(_sample(prev, seg, samples)[1:])
+            prev = seg[-1]
+        yield points
+
+
+def _one_way(contours_a, contours_b):
+    grid = _EdgeGrid(_polylines(contours_b, CHECK_SAMPLES))
+    return max(grid.distance(p) for poly in _polylines(contours_a, CHECK_SAMPLES) for p in poly)
+
+
+def max_deviation(original, simplified):
+    """Largest distance between the two outlines, measured both ways on samples."""
+    if not original or not simplified:
+        return 0.0 if not original and not simplified else math.inf
+    return max(_one_way(original, simplified), _one_way(simplified, original))
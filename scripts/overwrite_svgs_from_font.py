@@ -1,9 +1,33 @@
+"""
+Regenerate the uniform_syllables/ SVGs from the ..sfdir/ glyph files.
+
+regenerate() is the stage itself and can be imported by other tooling.
+It records the SHA-256 of each .glyph source, the simplification tolerance
+and the SVG it wrote in .cache/uniform_syllables.json, and on the next run
+rewrites only the syllables whose source or options changed or whose SVG
+was edited or removed. SVGs are written atomically.
+
+Usage:
+    python overwrite_svgs_from_font.py [--tolerance 1.0 | --no-simplify] [--force]
+"""
+
+import argparse
+import hashlib
+import json
 import os
-import re
-import glob
+import time
 
-SFDIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..sfdir')
-OUTDIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uniform_syllables')
+from outline_simplify import (DEFAULT_TOLERANCE, add_simplify_arguments, node_count,
+                              tolerance_from_args)
+from splineset import GlyphCache
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SFDIR = os.path.join(ROOT_DIR, '..sfdir')
+OUTDIR = os.path.join(ROOT_DIR, 'uniform_syllables')
+STATE_FILE = os.path.join(ROOT_DIR, '.cache', 'uniform_syllables.json')
+
+# Bump when the SVG text changes for the same outlines, so every file is rewritten
+OUTPUT_VERSION = 2
 
 ASCENT = 800  # from font.props
 
@@ -28,73 +52,45 @@ for c in consonants:
         syllable_to_svgname[glyph_name] = svg_syllable
 
 
-def parse_splineset(lines):
-    """Parse FontForge SplineSet into SVG path data, flipping Y axis."""
-    path_parts = []
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if not line or line == 'EndSplineSet':
-            break
-
-        tokens = line.split()
-
-        if len(tokens) >= 3 and tokens[-2] == 'm':
-            # Move to: x y m flag
-            x = float(tokens[0])
-            y = ASCENT - float(tokens[1])
-            path_parts.append(f'M {x:.2f},{y:.2f}')
-
-        elif len(tokens) >= 3 and tokens[-2] == 'l':
-            # Line to: x y l flag
-            x = float(tokens[0])
-            y = ASCENT - float(tokens[1])
-            path_parts.append(f'L {x:.2f},{y:.2f}')
-
-        elif len(tokens) >= 7 and tokens[-2] == 'c':
-            # Cubic bezier: cp1x cp1y cp2x cp2y x y c flag
-            cp1x = float(tokens[0])
-            cp1y = ASCENT - float(tokens[1])
-            cp2x = float(tokens[2])
-            cp2y = ASCENT - float(tokens[3])
-            x = float(tokens[4])
-            y = ASCENT - float(tokens[5])
-            path_parts.append(f'C {cp1x:.2f},{cp1y:.2f} {cp2x:.2f},{cp2y:.2f} {x:.2f},{y:.2f}')
-
-        i += 1
-
-    # Close each subpath
-    path_data = ' '.join(path_parts)
-    # Add Z to close paths at each new M (except the first)
-    # Split on M, add Z before each subsequent M
-    segments = path_data.split('M ')
-    result = ''
-    for j, seg in enumerate(segments):
-        if not seg.strip():
-            continue
-        if j > 1:  # close previous subpath
-            result += ' Z '
-        result += 'M ' + seg
-    result += ' Z'
-    return result
-
-
-def glyph_to_svg(glyph_path, svg_syllable):
-    """Convert a .glyph file to an SVG file."""
-    with open(glyph_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Extract Width
-    width_match = re.search(r'Width:\s+(\d+)', content)
-    width = int(width_match.group(1)) if width_match else 1000
-
-    # Extract SplineSet
-    spline_match = re.search(r'SplineSet\n(.*?)EndSplineSet', content, re.DOTALL)
-    if not spline_match:
-        return None
-
-    spline_lines = spline_match.group(1).strip().split('\n')
-    path_data = parse_splineset(spline_lines)
+def contours_to_path(contours):
+    """Convert parsed contours to SVG path data, flipping the Y axis.
+
+    Each contour becomes one subpath closed with Z.
+    """
+    subpaths = []
+    for contour in contours:
+        parts = []
+        for seg in contour:
+            if seg[0] == 'm':
+                parts.append(f'M {seg[1]:.2f},{ASCENT - seg[2]:.2f}')
+            elif seg[0] == 'l':
+                parts.append(f'L {seg[1]:.2f},{ASCENT - seg[2]:.2f}')
+            else:
+                parts.append(f'C {seg[1]:.2f},{ASCENT - seg[2]:.2f} '
+                             f'{seg[3]:.2f},{ASCENT - seg[4]:.2f} '
+                             f'{seg[5]:.2f},{ASCENT - seg[6]:.2f}')
+        parts.append('Z')
+        subpaths.append(' '.join(parts))
+    return ' '.join(subpaths)
+
+
+def glyph_to_svg(glyph_path, svg_syllable, cache, tolerance=None):
+    """Convert a .glyph file to SVG text.
+
+    Returns (svg, nodes before, nodes after simplifying), or None without splines.
+    """
+    if tolerance is None:
+        result = cache.load(glyph_path)
+        if result is None:
+            return None
+        width, contours = result
+        before = after = node_count(contours)
+    else:
+        result = cache.load_simplified(glyph_path, tolerance)
+        if result is None:
+            return None
+        width, contours, before, after = result
+    path_data = contours_to_path(contours)
 
     height = 1000  # ascent + descent
     svg_name = f'sitelen kalama pona - {svg_syllable}'
@@ -113,32 +109,130 @@ def glyph_to_svg(glyph_path, svg_syllable):
      id="glyph" />
 </svg>
 '''
-    return svg
-
-
-# Process all glyphs
-count = 0
-for glyph_name, svg_syllable in sorted(syllable_to_svgname.items()):
-    # Find glyph file
-    glyph_filename = f'{glyph_name}.sitelen_kalama_pona.glyph'
-    glyph_path = os.path.join(SFDIR, glyph_filename)
-
-    if not os.path.exists(glyph_path):
-        print(f'  MISSING glyph: {glyph_filename}')
-        continue
-
-    svg_filename = f'sitelen kalama pona - {svg_syllable}.svg'
-    svg_path = os.path.join(OUTDIR, svg_filename)
-
-    svg_content = glyph_to_svg(glyph_path, svg_syllable)
-    if svg_content is None:
-        print(f'  NO SPLINES: {glyph_name}')
-        continue
-
-    with open(svg_path, 'w', encoding='utf-8') as f:
-        f.write(svg_content)
-
-    count += 1
-    print(f'  {glyph_name} -> {svg_filename}')
+    return svg, before, after
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def load_state(path=STATE_FILE):
+    """{svg filename: {'source', 'options', 'svg'}} from the last run, or {}."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state.get('files', {}) if state.get('version') == OUTPUT_VERSION else {}
+
+
+def save_state(files, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': OUTPUT_VERSION, 'files': files}, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def write_atomic(path, text):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def regenerate(tolerance=DEFAULT_TOLERANCE, force=False, cache=None, verbose=True):
+    """Rewrite the uniform_syllables/ SVGs whose glyph source changed.
+
+    tolerance is the outline simplification tolerance (None to keep the
+    traced outlines); force rewrites every SVG. Returns counts of SVGs
+    'written', 'unchanged' and 'skipped' (source unchanged since the last
+    run), glyphs 'missing' or without splines, and total 'nodes_before' /
+    'nodes_after' for the SVGs generated this run.
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    own_cache = cache is None
+    if own_cache:
+        cache = GlyphCache()
+    state = {} if force else load_state()
+    new_state = {}
+    options = 'none' if tolerance is None else repr(float(tolerance))
+    stats = dict.fromkeys(('written', 'unchanged', 'skipped', 'missing',
+                           'nodes_before', 'nodes_after'), 0)
+
+    for glyph_name, svg_syllable in sorted(syllable_to_svgname.items()):
+        glyph_filename = f'{glyph_name}.sitelen_kalama_pona.glyph'
+        glyph_path = os.path.join(SFDIR, glyph_filename)
+        svg_filename = f'sitelen kalama pona - {svg_syllable}.svg'
+        svg_path = os.path.join(OUTDIR, svg_filename)
+
+        try:
+            with open(glyph_path, 'rb') as f:
+                source_hash = _sha256(f.read())
+        except FileNotFoundError:
+            log(f'  MISSING glyph: {glyph_filename}')
+            stats['missing'] += 1
+            continue
 
-print(f'\nDone! Wrote {count} SVG files to {OUTDIR}')
+        previous = state.get(svg_filename)
+        if (previous and previous['source'] == source_hash and previous['options'] == options
+                and os.path.exists(svg_path)):
+            with open(svg_path, 'rb') as f:
+                if _sha256(f.read()) == previous['svg']:
+                    new_state[svg_filename] = previous
+                    cache.keep(source_hash)
+                    stats['skipped'] += 1
+                    continue
+
+        result = glyph_to_svg(glyph_path, svg_syllable, cache, tolerance)
+        if result is None:
+            log(f'  NO SPLINES: {glyph_name}')
+            stats['missing'] += 1
+            continue
+        svg_content, before, after = result
+        stats['nodes_before'] += before
+        stats['nodes_after'] += after
+
+        data = svg_content.encode('utf-8')
+        existing = None
+        if os.path.exists(svg_path):
+            with open(svg_path, 'rb') as f:
+                existing = f.read()
+        if existing == data:
+            stats['unchanged'] += 1
+        else:
+            write_atomic(svg_path, svg_content)
+            stats['written'] += 1
+            log(f'  {glyph_name} -> {svg_filename} ({before} -> {after} nodes)')
+        new_state[svg_filename] = {'source': source_hash, 'options': options,
+                                   'svg': _sha256(data)}
+
+    if own_cache:
+        cache.save()
+    save_state(new_state)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rewrite uniform_syllables/ from the ..sfdir glyphs.')
+    add_simplify_arguments(parser)
+    parser.add_argument('--force', action='store_true',
+                        help='regenerate every SVG, not just those whose glyph changed')
+    args = parser.parse_args()
+    tolerance = tolerance_from_args(args)
+
+    cache = GlyphCache()
+    start = time.perf_counter()
+    stats = regenerate(tolerance, force=args.force, cache=cache)
+    cache.save()
+
+    print(f'\nDone! {stats["written"]} written, {stats["unchanged"]} unchanged, '
+          f'{stats["skipped"]} skipped (source unchanged) in {OUTDIR} in '
+          f'{(time.perf_counter() - start) * 1000:.0f} ms ({cache.report()})')
+    if tolerance is not None and stats['nodes_before']:
+        print(f'Simplified outlines within {tolerance:g} units: '
+              f'{stats["nodes_before"]} -> {stats["nodes_after"]} nodes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+SQLite state store for the Wikidata-to-Commons pipeline.
+
+One database, data/pipeline.sqlite, holds what the pipeline scripts used to
+re-derive from CSVs, output_index.json and the output/ directory:
+
+  items         qid, label, tok_title, revision   (fetch_wikidata_sparql.py,
+                                                   ingest_wikidata_dump.py)
+  renders       label -> filename, content hash and the glyph-set version
+                it was rendered with               (batch_generate_svgs.py)
+  publications  qid -> P18 status and QuickStatements shard
+                                                  (generate_quickstatements.py)
+                status is 'queued' (in the current shards), 'has_p18' (in
+                the latest claims snapshot, re-derived on every run) or
+                'published' (its shard was submitted and marked with
+                --mark-published; never queued again)
+
+Writers use one transaction per logical step. The joins between tables are
+indexed, so questions like "which labels need a re-render" are queries
+instead of full scans. The CSV and JSON files are still written alongside
+for the tools and workflow that read them.
+"""
+
+import hashlib
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+DB_PATH = ROOT_DIR / 'data' / 'pipeline.sqlite'
+
+# Inputs whose contents change how a label renders
+GLYPH_SOURCES = [
+    (ROOT_DIR / 'uniform_syllables', '*.svg'),
+    (ROOT_DIR / 'sitelen_seli_kiwen_svgs', '*.svg'),
+    (ROOT_DIR, 'Jan_Sinpo_We_*.svg'),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    qid       TEXT PRIMARY KEY,
+    label     TEXT NOT NULL,
+    tok_title TEXT NOT NULL DEFAULT '',
+    revision  INTEGER,
+    updated   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_label ON items (label);
+
+CREATE TABLE IF NOT EXISTS renders (
+    label         TEXT PRIMARY KEY,
+    filename      TEXT NOT NULL,
+    content_hash  TEXT NOT NULL,
+    glyph_version TEXT NOT NULL,
+    rendered      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS renders_filename ON renders (filename);
+CREATE INDEX IF NOT EXISTS renders_glyph_version ON renders (glyph_version);
+
+CREATE TABLE IF NOT EXISTS publications (
+    qid      TEXT PRIMARY KEY,
+    filename TEXT,
+    status   TEXT NOT NULL,
+    shard    TEXT,
+    updated  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS publications_status ON publications (status);
+"""
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def connect(path=None):
+    """Open (creating if needed) the pipeline database, DB_PATH by default."""
+    path = Path(path or DB_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def glyph_set_version():
+    """Short digest of every glyph source file's name and contents."""
+    digest = hashlib.sha256()
+    for directory, pattern in GLYPH_SOURCES:
+        for path in sorted(directory.glob(pattern)):
+            digest.update(path.name.encode('utf-8') + b'\0')
+            digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()[:16]
+
+
+# -- items -------------------------------------------------------------------
+
+def _item_params(rows, now):
+    for row in rows:
+        yield (row['qid'], row['label'], row.get('tok_title') or '',
+               row.get('revision'), now)
+
+
+def replace_items(conn, rows):
+    """Replace the whole items table with rows ({'qid', 'label', 'tok_title', 'revision'})."""
+    with conn:
+        conn.execute('DELETE FROM items')
+        conn.executemany(
+            'INSERT OR REPLACE INTO items (qid, label, tok_title, revision, updated) '
+            'VALUES (?, ?, ?, ?, ?)', _item_params(rows, _now()))
+
+
+def upsert_items(conn, rows, removed=()):
+    """Insert or update rows and delete the removed QIDs, in one transaction."""
+    with conn:
+        conn.executemany(
+            'INSERT INTO items (qid, label, tok_title, revision, updated) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (qid) DO UPDATE SET label = excluded.label, '
+            'tok_title = excluded.tok_title, revision = excluded.revision, '
+            'updated = excluded.updated', _item_params(rows, _now()))
+        conn.executemany('DELETE FROM items WHERE qid = ?', ((q,) for q in removed))
+
+
+def item_count(conn):
+    return conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+
+
+def iter_items(conn):
+    """Yield item rows as dicts, in QID insertion order."""
+    for row in conn.execute('SELECT qid, label, tok_title FROM items ORDER BY rowid'):
+        yield dict(row)
+
+
+# -- renders -----------------------------------------------------------------
+
+def record_renders(conn, renders, glyph_version):
+    """Store [(label, filename, content_hash)] rendered with glyph_version."""
+    now = _now()
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO renders '
+            '(label, filename, content_hash, glyph_version, rendered) '
+            'VALUES (?, ?, ?, ?, ?)',
+            ((label, filename, content_hash, glyph_version, now)
+             for label, filename, content_hash in renders))
+
+
+def _labels_query(conn, glyph_version, qid_filter):
+    """FROM ... WHERE clause and parameters selecting the items iter_labels() covers."""
+    sql = 'FROM items i '
+    where = []
+    params = []
+    if glyph_version is not None:
+        sql += 'LEFT JOIN renders r ON r.label = i.label '
+        where.append('(r.label IS NULL OR r.glyph_version != ?)')
+        params.append(glyph_version)
+    if qid_filter is not None:
+        conn.create_function('keep_qid', 1, qid_filter, deterministic=True)
+        where.append('keep_qid(i.qid)')
+    if where:
+        sql += 'WHERE ' + ' AND '.join(where) + ' '
+    return sql, params
+
+
+def iter_labels(conn, glyph_version=None, qid_filter=None):
+    """Yield each distinct item label once, in the order of its first item.
+
+    With glyph_version, only labels with no render or one made with a different
+    glyph set; with qid_filter (a function of a QID), only labels of the items
+    it accepts. SQLite does the grouping, so memory does not grow with the
+    number of labels.
+    """
+    sql, params = _labels_query(conn, glyph_version, qid_filter)
+    for row in conn.execute(
+            f'SELECT i.label {sql}GROUP BY i.label ORDER BY MIN(i.rowid)', params):
+        yield row[0]
+
+
+def label_count(conn, glyph_version=None, qid_filter=None):
+    """Number of labels iter_labels() yields for the same arguments."""
+    sql, params = _labels_query(conn, glyph_version, qid_filter)
+    return conn.execute(f'SELECT COUNT(DISTINCT i.label) {sql}', params).fetchone()[0]
+
+
+def labels_needing_render(conn, glyph_version):
+    """Labels with no render, or one made with a different glyph set."""
+    return list(iter_labels(conn, glyph_version))
+
+
+def output_index(conn):
+    """{filename: {'qid', 'tok_title'}} for every rendered item, like output_index.json."""
+    index = {}
+    for row in conn.execute(
+            'SELECT r.filename, i.qid, i.tok_title FROM items i '
+            'JOIN renders r ON r.label = i.label ORDER BY i.rowid'):
+        index[row['filename']] = {'qid': row['qid'], 'tok_title': row['tok_title']}
+    return index
+
+
+def has_renders(conn):
+    """True if any item has a render."""
+    return bool(conn.execute(
+        'SELECT EXISTS (SELECT 1 FROM items i JOIN renders r ON r.label = i.label)'
+    ).fetchone()[0])
+
+
+def unrendered_count(conn):
+    """Number of items whose label has no render."""
+    return conn.execute(
+        'SELECT COUNT(*) FROM items i LEFT JOIN renders r ON r.label = i.label '
+        'WHERE r.label IS NULL').fetchone()[0]
+
+
+# -- publications ------------------------------------------------------------
+
+def iter_publishable(conn):
+    """Yield (qid, filename) for rendered items not yet published.
+
+    Queued items are included: each QuickStatements run replaces the
+    previous run's shards, so they are queued again. So are items recorded
+    as 'has_p18': the caller checks them against the current claims
+    snapshot, since a P18 can be removed.
+    """
+    yield from conn.execute(
+        'SELECT i.qid, r.filename FROM items i '
+        'JOIN renders r ON r.label = i.label '
+        'LEFT JOIN publications p ON p.qid = i.qid '
+        "WHERE p.status IS NULL OR p.status != 'published' "
+        'ORDER BY i.rowid')
+
+
+def set_publications(conn, entries):
+    """Store [(qid, filename, status, shard)] publication records."""
+    now = _now()
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO publications (qid, filename, status, shard, updated) '
+            'VALUES (?, ?, ?, ?, ?)',
+            ((qid, filename, status, shard, now)
+             for qid, filename, status, shard in entries))
+
+
+def mark_published(conn, qids):
+    """Set the status of the given QIDs' publication records to 'published'.
+
+    Returns the number of records changed.
+    """
+    now = _now()
+    with conn:
+        cursor = conn.executemany(
+            "UPDATE publications SET status = 'published', updated = ? "
+            "WHERE qid = ? AND status != 'published'", ((now, qid) for qid in qids))
+    return cursor.rowcount
@@ -4,8 +4,17 @@ Process toki pona Wikipedia page titles from the fetched CSV.
 Reads wikidata_toki_pona.csv (pageid, title) and:
   1. Filters to titles that contain at least one valid toki pona word or proper name
   2. Writes wikidata_toki_pona_names.txt (one title per line, for batch SVG generation)
+
+The filter is a generator stage over CSV rows: titles are read, checked and
+written one at a time, so memory stays constant however many titles there
+are. Pass --input - to read the CSV from stdin, e.g. straight from a fetch.
+
+Usage:
+    python scripts/process_wikidata_toki_pona.py
+    python scripts/process_wikidata_toki_pona.py --input - < pages.csv
 """
 
+import argparse
 import csv
 import re
 import sys
@@ -15,16 +24,22 @@ SCRIPT_DIR = Path(__file__).parent
 ROOT_DIR = SCRIPT_DIR.parent
 WORD_SVGS_DIR = ROOT_DIR / 'sitelen_seli_kiwen_svgs'
 
+WORD_SVG_PREFIX = 'Sitelen seli kiwen - '
+# Capitalized token with only letters = proper name for cartouche
+is_proper_name = re.compile(r'[A-Z][A-Za-z]*').fullmatch
+
+EXAMPLES = 10
+
 
 def get_known_words():
     """Get the set of toki pona words that have SVG glyphs."""
     words = set()
-    for f in WORD_SVGS_DIR.glob('Sitelen seli kiwen - *.svg'):
-        name = f.stem.replace('Sitelen seli kiwen - ', '')
+    for f in WORD_SVGS_DIR.glob(f'{WORD_SVG_PREFIX}*.svg'):
+        name = f.stem[len(WORD_SVG_PREFIX):]
         # Single words only (compounds have hyphens)
         if '-' not in name:
             words.add(name)
-    return words
+    return frozenset(words)
 
 
 def is_processable(title, known_words):
@@ -33,49 +48,66 @@ def is_processable(title, known_words):
     A title is processable if it contains at least one known toki pona word
     or a capitalized proper name (which would become a sound cartouche).
     """
-    tokens = title.split()
-    for token in tokens:
-        if token.lower() in known_words:
-            return True
-        # Capitalized token with only letters = proper name for cartouche
-        if token[0].isupper() and re.match(r'^[A-Za-z]+$', token):
+    for token in title.split():
+        if token.lower() in known_words or is_proper_name(token):
             return True
     return False
 
 
-def main():
-    src = ROOT_DIR / 'data' / 'wikidata_toki_pona.csv'
-    out_names = ROOT_DIR / 'data' / 'wikidata_toki_pona_names.txt'
+def iter_titles(rows):
+    """Yield the stripped, non-empty titles from an iterable of CSV rows."""
+    for row in rows:
+        title = row['title'].strip()
+        if title:
+            yield title
+
+
+def filter_titles(titles, known_words, stats):
+    """Yield processable titles; count kept/skipped and keep a few skipped examples."""
+    stats.setdefault('kept', 0)
+    stats.setdefault('skipped', 0)
+    stats.setdefault('examples', [])
+    for title in titles:
+        if is_processable(title, known_words):
+            stats['kept'] += 1
+            yield title
+        else:
+            stats['skipped'] += 1
+            if len(stats['examples']) < EXAMPLES:
+                stats['examples'].append(title)
 
-    if not src.exists():
-        print(f'Missing input: {src}', file=sys.stderr)
-        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Filter tok.wikipedia titles to processable names.')
+    parser.add_argument('--input', default=str(ROOT_DIR / 'data' / 'wikidata_toki_pona.csv'),
+                        help="pageid,title CSV to read, or '-' for stdin")
+    parser.add_argument('--output', type=Path,
+                        default=ROOT_DIR / 'data' / 'wikidata_toki_pona_names.txt',
+                        help='names file to write')
+    args = parser.parse_args()
+
+    if args.input == '-':
+        src = sys.stdin
+    else:
+        if not Path(args.input).exists():
+            print(f'Missing input: {args.input}', file=sys.stderr)
+            sys.exit(1)
+        src = open(args.input, 'r', encoding='utf-8', newline='')
 
     known_words = get_known_words()
     print(f'Known toki pona word glyphs: {len(known_words)}')
 
-    titles = []
-    skipped = []
-
-    with open(src, 'r', encoding='utf-8', newline='') as f:
-        for row in csv.DictReader(f):
-            title = row['title'].strip()
-            if not title:
-                continue
-            if is_processable(title, known_words):
-                titles.append(title)
-            else:
-                skipped.append(title)
-
-    with open(out_names, 'w', encoding='utf-8') as f:
-        for title in titles:
-            f.write(title + '\n')
-
-    print(f'Processable titles: {len(titles)}')
-    print(f'Skipped titles: {len(skipped)}')
-    if skipped:
-        print(f'  Examples of skipped: {skipped[:10]}')
-    print(f'Wrote {out_names}')
+    stats = {}
+    with src, open(args.output, 'w', encoding='utf-8') as out:
+        titles = iter_titles(csv.DictReader(src))
+        for title in filter_titles(titles, known_words, stats):
+            out.write(title + '\n')
+
+    print(f'Processable titles: {stats["kept"]}')
+    print(f'Skipped titles: {stats["skipped"]}')
+    if stats['examples']:
+        print(f'  Examples of skipped: {stats["examples"]}')
+    print(f'Wrote {args.output}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,278 @@
+"""
+Run the build pipeline, skipping stages whose inputs have not changed.
+
+Each stage declares the script it runs, the files it reads and writes, and
+the stages it depends on. Before a stage runs, its inputs are fingerprinted
+by content, together with its script and every scripts/ module the script
+imports, directly or through other modules; if the fingerprint matches the one
+recorded after its last successful run and all of its outputs exist, the
+stage is skipped. Fingerprints are kept in data/pipeline_fingerprints.json,
+so a committed data/ directory carries them between CI runs.
+
+Stages with no dependency between them (the font build, the syllable SVG
+refresh and the Wikidata fetch) run concurrently. Each stage's output goes
+to .cache/pipeline/<stage>.log, and its tail is shown if the stage fails.
+The fetch stage reads from the network, so it always runs; the stages after
+it are still skipped when it leaves the labels unchanged.
+
+Usage:
+    python scripts/run_pipeline.py                  # everything
+    python scripts/run_pipeline.py gallery          # gallery and what it needs
+    python scripts/run_pipeline.py --force font     # rebuild the font regardless
+    python scripts/run_pipeline.py --no-deps render gallery
+    python scripts/run_pipeline.py --dry-run
+"""
+
+import argparse
+import ast
+import functools
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+ROOT_DIR = SCRIPT_DIR.parent
+STATE_FILE = ROOT_DIR / 'data' / 'pipeline_fingerprints.json'
+
+# Lines of a failed stage's log to show
+LOG_TAIL = 20
+
+CARTOUCHE = 'Jan_Sinpo_We_*.svg'
+
+# name: script (+ args), inputs and outputs (globs relative to the repo root),
+# stages that must finish first, and whether it runs even when unchanged.
+STAGES = {
+    'font': {
+        'command': ['build_font.py'],
+        'inputs': ['..sfdir/*.glyph'],
+        'outputs': ['fonts/sitelen-kalama-pona.*', 'fonts/subsets/*.woff2'],
+        'after': [],
+    },
+    'docs': {
+        'command': ['generate_docs_page.py'],
+        'inputs': ['fonts/sitelen-kalama-pona.otf', 'fonts/subsets/*.woff2'],
+        'outputs': ['docs/index.html'],
+        'after': ['font'],
+    },
+    'syllables': {
+        'command': ['overwrite_svgs_from_font.py'],
+        'inputs': ['..sfdir/*.glyph'],
+        'outputs': ['uniform_syllables/*.svg'],
+        'after': [],
+    },
+    'fetch': {
+        'command': ['fetch_wikidata_sparql.py', '--incremental'],
+        'inputs': [],
+        'outputs': ['data/wikidata_tok_labels.csv'],
+        'after': [],
+        'always': True,
+    },
+    'render': {
+        'command': ['batch_generate_svgs.py'],
+        'inputs': ['data/wikidata_tok_labels.csv', 'uniform_syllables/*.svg',
+                   'sitelen_seli_kiwen_svgs/*.svg', CARTOUCHE],
+        'outputs': ['data/output_index.json'],
+        'after': ['fetch', 'syllables'],
+    },
+    'quickstatements': {
+        'command': ['generate_quickstatements.py'],
+        'inputs': ['data/output_index.json', 'data/wikidata_tok_labels.csv',
+                   'data/wikidata_p18_claims.csv'],
+        'outputs': ['data/quickstatements.txt'],
+        'after': ['render'],
+    },
+    'gallery': {
+        'command': ['generate_gallery.py'],
+        'inputs': ['data/output_index.json', 'output/*.svg'],
+        'outputs': ['gallery.html'],
+        'after': ['render'],
+    },
+}
+
+
+def expand(patterns):
+    """Sorted files matching glob patterns relative to the repo root."""
+    paths = set()
+    for pattern in patterns:
+        paths.update(p for p in ROOT_DIR.glob(pattern) if p.is_file())
+    return sorted(paths)
+
+
+@functools.lru_cache(maxsize=None)
+def local_imports(script):
+    """scripts/ modules that script imports, directly or through each other, sorted."""
+    found = set()
+    pending = [script]
+    while pending:
+        tree = ast.parse(pending.pop().read_bytes())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                path = SCRIPT_DIR / f'{name.split(".")[0]}.py'
+                if path.is_file() and path != script and path not in found:
+                    found.add(path)
+                    pending.append(path)
+    return tuple(sorted(found))
+
+
+def fingerprint(stage):
+    """Digest of a stage's command, script, imported modules and input files."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(stage['command']).encode('utf-8'))
+    script = SCRIPT_DIR / stage['command'][0]
+    paths = [script, *local_imports(script), *expand(stage['inputs'])]
+    for path in dict.fromkeys(paths):
+        digest.update(path.relative_to(ROOT_DIR).as_posix().encode('utf-8') + b'\0')
+        digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()
+
+
+def outputs_exist(stage):
+    return all(expand([pattern]) for pattern in stage['outputs'])
+
+
+def load_state():
+    if not STATE_FILE.exists():
+        return {}
+    with open(STATE_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(state):
+    STATE_FILE.parent.mkdir(exist_ok=True)
+    tmp = STATE_FILE.with_name(STATE_FILE.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp, STATE_FILE)
+
+
+def select(targets):
+    """The targets plus everything they depend on, in declaration order."""
+    wanted = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in wanted:
+            wanted.add(name)
+            pending.extend(STAGES[name]['after'])
+    return [name for name in STAGES if name in wanted]
+
+
+def run_stage(name, log_dir):
+    """Run one stage's script, logging its output. Returns the exit status."""
+    stage = STAGES[name]
+    command = [sys.executable, str(SCRIPT_DIR / stage['command'][0])] + stage['command'][1:]
+    log_path = log_dir / f'{name}.log'
+    with open(log_path, 'w', encoding='utf-8') as log:
+        return subprocess.run(command, cwd=ROOT_DIR, stdout=log,
+                              stderr=subprocess.STDOUT).returncode
+
+
+def decide(name, state, force):
+    """(should run, input fingerprint) for a stage whose dependencies are done."""
+    stage = STAGES[name]
+    fp = fingerprint(stage)
+    if force or stage.get('always') or not outputs_exist(stage):
+        return True, fp
+    return state.get(name) != fp, fp
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the pipeline, skipping unchanged stages.')
+    parser.add_argument('targets', nargs='*', metavar='stage',
+                        help=f'stages to bring up to date: {", ".join(STAGES)} (default: all)')
+    parser.add_argument('--force', action='store_true',
+                        help='run the selected stages even if their inputs are unchanged')
+    parser.add_argument('--no-deps', action='store_true',
+                        help='run only the named stages, not the stages they depend on')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='report which stages would run, assuming upstream outputs stay the same')
+    parser.add_argument('--jobs', type=int, default=3,
+                        help='stages to run at once (default 3)')
+    args = parser.parse_args()
+    unknown = [t for t in args.targets if t not in STAGES]
+    if unknown:
+        parser.error(f'unknown stage(s): {", ".join(unknown)}')
+
+    if args.no_deps and args.targets:
+        names = [name for name in STAGES if name in args.targets]
+    else:
+        names = select(args.targets or list(STAGES))
+    state = load_state()
+    log_dir = ROOT_DIR / '.cache' / 'pipeline'
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.dry_run:
+        for name in names:
+            run, _ = decide(name, state, args.force)
+            print(f'  {name:16} {"run" if run else "up to date"}')
+        return
+
+    results = {}   # name -> (status, seconds)
+    running = {}   # future -> (name, fingerprint, start)
+    start_all = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        while len(results) < len(names):
+            for name in names:
+                if name in results or name in {n for n, _, _ in running.values()}:
+                    continue
+                deps = STAGES[name]['after']
+                if any(dep in names and dep not in results for dep in deps):
+                    continue
+                if any(results.get(dep, ('',))[0] in ('failed', 'blocked') for dep in deps):
+                    results[name] = ('blocked', 0.0)
+                    print(f'[{name}] not run: a dependency failed')
+                    continue
+                run, fp = decide(name, state, args.force)
+                if not run:
+                    results[name] = ('skipped', 0.0)
+                    print(f'[{name}] up to date')
+                    continue
+                print(f'[{name}] running {" ".join(STAGES[name]["command"])}')
+                running[pool.submit(run_stage, name, log_dir)] = (name, fp, time.perf_counter())
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, fp, start = running.pop(future)
+                elapsed = time.perf_counter() - start
+                if future.result() == 0:
+                    state[name] = fp
+                    save_state(state)
+                    results[name] = ('ran', elapsed)
+                    print(f'[{name}] done in {elapsed:.1f}s')
+                else:
+                    results[name] = ('failed', elapsed)
+                    log_path = log_dir / f'{name}.log'
+                    tail = log_path.read_text(encoding='utf-8').splitlines()[-LOG_TAIL:]
+                    print(f'[{name}] FAILED after {elapsed:.1f}s; last lines of {log_path}:',
+                          file=sys.stderr)
+                    for line in tail:
+                        print(f'  {line}', file=sys.stderr)
+
+    total = time.perf_counter() - start_all
+    print(f'\n{"stage":16} {"result":8} {"wall time":>9}')
+    for name in names:
+        status, seconds = results[name]
+        print(f'{name:16} {status:8} {seconds:8.1f}s')
+    print(f'{"total":16} {"":8} {total:8.1f}s')
+
+    if any(status in ('failed', 'blocked') for status, _ in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
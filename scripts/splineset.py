@@ -0,0 +1,189 @@
+"""
+Shared parser for FontForge .glyph files, with an on-disk parse cache.
+
+build_font.py and overwrite_svgs_from_font.py both read the SplineSet of
+every glyph in ..sfdir/. parse_splineset() turns one into a list of
+contours, each a list of (op, *coords) tuples in absolute font units:
+  ('m', x, y)   ('l', x, y)   ('c', x1, y1, x2, y2, x, y)
+
+GlyphCache keeps parsed glyphs in .cache/glyphs.json, keyed by the SHA-256
+of each .glyph file's contents. A contour is stored compactly as its op
+letters and one flat list of coordinates ('mlcc', [x, y, ...]), so after
+editing one glyph only that file is parsed again. Simplified outlines are
+cached alongside, per tolerance.
+"""
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+from outline_simplify import node_count, simplify_contours
+
+ROOT_DIR = Path(__file__).parent.parent
+DEFAULT_CACHE_FILE = ROOT_DIR / '.cache' / 'glyphs.json'
+
+# Bump when parse or simplification output changes, so stale cache entries are ignored
+PARSER_VERSION = 2
+
+WIDTH_RE = re.compile(r'Width:\s+(\d+)')
+SPLINESET_RE = re.compile(r'SplineSet\n(.*?)EndSplineSet', re.DOTALL)
+
+COORD_COUNTS = {'m': 2, 'l': 2, 'c': 6}
+
+
+def parse_splineset(lines):
+    """Parse FontForge SplineSet lines into a list of contours."""
+    contours = []
+    current = []
+    for line in lines:
+        line = line.strip()
+        if not line or line == 'EndSplineSet':
+            break
+        tokens = line.split()
+
+        if len(tokens) >= 3 and tokens[-2] == 'm':
+            if current:
+                contours.append(current)
+                current = []
+            current.append(('m', float(tokens[0]), float(tokens[1])))
+        elif len(tokens) >= 3 and tokens[-2] == 'l':
+            current.append(('l', float(tokens[0]), float(tokens[1])))
+        elif len(tokens) >= 7 and tokens[-2] == 'c':
+            current.append(('c',
+                            float(tokens[0]), float(tokens[1]),
+                            float(tokens[2]), float(tokens[3]),
+                            float(tokens[4]), float(tokens[5])))
+
+    if current:
+        contours.append(current)
+    return contours
+
+
+def parse_glyph(content):
+    """Return (width, contours) for the text of a .glyph file, or None without splines."""
+    width_match = WIDTH_RE.search(content)
+    width = int(width_match.group(1)) if width_match else 1000
+
+    spline_match = SPLINESET_RE.search(content)
+    if not spline_match:
+        return None
+
+    return width, parse_splineset(spline_match.group(1).strip().split('\n'))
+
+
+def pack_contours(contours):
+    """[[(op, *coords)]] -> [[ops, flat coords]]"""
+    packed = []
+    for contour in contours:
+        ops = ''.join(seg[0] for seg in contour)
+        coords = [c for seg in contour for c in seg[1:]]
+        packed.append([ops, coords])
+    return packed
+
+
+def unpack_contours(packed):
+    """Inverse of pack_contours()."""
+    contours = []
+    for ops, coords in packed:
+        contour = []
+        i = 0
+        for op in ops:
+            n = COORD_COUNTS[op]
+            contour.append((op, *coords[i:i + n]))
+            i += n
+        contours.append(contour)
+    return contours
+
+
+class GlyphCache:
+    """Parsed glyphs keyed by file content hash, persisted as one JSON file."""
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, enabled=True):
+        self.path = Path(path)
+        self.enabled = enabled
+        self.entries = {}
+        self.used = set()
+        self.dirty = False
+        self.stats = {'hits': 0, 'parsed': 0, 'simplified': 0}
+        if enabled and self.path.exists():
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == PARSER_VERSION:
+                    self.entries = data['glyphs']
+            except (OSError, ValueError, KeyError):
+                self.entries = {}
+
+    def _entry(self, glyph_path):
+        raw = Path(glyph_path).read_bytes()
+        key = hashlib.sha256(raw).hexdigest()
+        self.used.add(key)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.stats['hits'] += 1
+            return entry
+
+        self.stats['parsed'] += 1
+        result = parse_glyph(raw.decode('utf-8'))
+        entry = {
+            'width': result[0] if result else None,
+            'contours': pack_contours(result[1]) if result else None,
+        }
+        if self.enabled:
+            self.entries[key] = entry
+            self.dirty = True
+        return entry
+
+    def load(self, glyph_path):
+        """Return (width, contours) for a .glyph file, or None if it has no splines."""
+        entry = self._entry(glyph_path)
+        if entry['contours'] is None:
+            return None
+        return entry['width'], unpack_contours(entry['contours'])
+
+    def load_simplified(self, glyph_path, tolerance):
+        """Like load(), with contours simplified within tolerance (see outline_simplify.py).
+
+        Returns (width, contours, nodes before, nodes after), or None.
+        """
+        entry = self._entry(glyph_path)
+        if entry['contours'] is None:
+            return None
+        simplified = entry.setdefault('simplified', {})
+        key = repr(float(tolerance))
+        if key not in simplified:
+            contours = unpack_contours(entry['contours'])
+            result = simplify_contours(contours, tolerance)
+            simplified[key] = {
+                'contours': pack_contours(result),
+                'nodes': [node_count(contours), node_count(result)],
+            }
+            self.stats['simplified'] += 1
+            if self.enabled:
+                self.dirty = True
+        cached = simplified[key]
+        return (entry['width'], unpack_contours(cached['contours']), *cached['nodes'])
+
+    def keep(self, key):
+        """Keep the entry for a file hash through save() without loading it."""
+        self.used.add(key)
+
+    def save(self):
+        """Write the cache if anything was parsed, dropping entries not used this run."""
+        if not self.enabled or not (self.dirty or len(self.used) < len(self.entries)):
+            return
+        glyphs = {key: self.entries[key] for key in self.used if key in self.entries}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': PARSER_VERSION, 'glyphs': glyphs}, f,
+                      separators=(',', ':'))
+        os.replace(tmp, self.path)
+
+    def report(self):
+        report = f'glyph cache: {self.stats["hits"]} cached, {self.stats["parsed"]} parsed'
+        if self.stats['simplified']:
+            report += f', {self.stats["simplified"]} simplified'
+        return report
@@ -0,0 +1,151 @@
+"""
+Timing spans for the pipeline scripts, with an optional Chrome trace.
+
+    from tracing import span
+    with span('read_svgs'):
+        ...
+
+Spans cost one global check while tracing is off. Turn tracing on with a
+script's --trace option (see add_trace_arguments()) or the SITELEN_TRACE
+environment variable, which also reaches scripts run by run_pipeline.py:
+
+  SITELEN_TRACE=1            print per-span totals when the script exits
+  SITELEN_TRACE=trace.json   also write Chrome trace events to trace.json
+                             ({pid} in the name is replaced by the process id)
+
+The trace file opens in chrome://tracing or https://ui.perfetto.dev. The
+summary lists each span name with its count, total and mean time; nested
+spans are counted in their parents' totals too.
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+ENV_VAR = 'SITELEN_TRACE'
+
+_NULL = nullcontext()
+
+_enabled = False
+_trace_file = None
+_events = []
+_totals = {}      # name -> [count, seconds]
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        elapsed = end - self.start
+        with _lock:
+            total = _totals.setdefault(self.name, [0, 0.0])
+            total[0] += 1
+            total[1] += elapsed
+            if _trace_file:
+                event = {'name': self.name, 'ph': 'X', 'pid': os.getpid(),
+                         'tid': threading.get_ident(),
+                         'ts': (self.start - _origin) * 1e6, 'dur': elapsed * 1e6}
+                if self.args:
+                    event['args'] = self.args
+                _events.append(event)
+        return False
+
+
+def span(name, **args):
+    """Context manager timing the block under name; args go into the trace event."""
+    if not _enabled:
+        return _NULL
+    return _Span(name, args)
+
+
+def traced(name=None):
+    """Decorator form of span(), named after the function by default."""
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(label, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def enabled():
+    return _enabled
+
+
+def enable(trace_file=None):
+    """Start recording spans; report them (and write trace_file) at exit."""
+    global _enabled, _trace_file
+    if trace_file:
+        _trace_file = Path(str(trace_file).replace('{pid}', str(os.getpid())))
+    if not _enabled:
+        _enabled = True
+        atexit.register(finish)
+
+
+def report(file=sys.stderr):
+    """Print the per-span totals, slowest first."""
+    with _lock:
+        totals = sorted(_totals.items(), key=lambda item: -item[1][1])
+    if not totals:
+        return
+    print(f'\nTiming ({os.path.basename(sys.argv[0]) or "python"}):', file=file)
+    print(f'  {"span":28} {"count":>8} {"total ms":>11} {"mean ms":>10}', file=file)
+    for name, (count, seconds) in totals:
+        print(f'  {name:28} {count:8} {seconds * 1000:11.1f} {seconds * 1000 / count:10.3f}',
+              file=file)
+
+
+def write_trace(path):
+    """Write the recorded spans as Chrome trace-event JSON."""
+    with _lock:
+        events = list(_events)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    print(f'Wrote trace ({len(events)} spans) to {path}', file=sys.stderr)
+
+
+def finish():
+    report()
+    if _trace_file:
+        write_trace(_trace_file)
+
+
+def add_trace_arguments(parser):
+    """Add the shared --trace option."""
+    parser.add_argument('--trace', nargs='?', const='1', metavar='FILE',
+                        help='print per-span timings at exit; with FILE, also write a '
+                             f'Chrome trace there (or set {ENV_VAR})')
+
+
+def trace_from_args(args):
+    """Enable tracing if --trace was given."""
+    if args.trace:
+        enable(None if args.trace == '1' else args.trace)
+
+
+_env = os.environ.get(ENV_VAR, '')
+if _env and _env != '0':
+    enable(None if _env == '1' else _env)
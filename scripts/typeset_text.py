@@ -0,0 +1,260 @@
+"""
+Typeset long toki pona text as pages of sitelen kalama pona.
+
+generate_sitelen_kalama_pona.py lays a phrase out on one line, which only
+suits titles. This breaks running text (a whole tok.wikipedia article, say)
+into lines of a target width and the lines into pages, writing one SVG per
+page:
+
+  - lowercase words become word glyphs, matched greedily into compounds
+    within each run of words (runs end at punctuation, names and line ends)
+  - each run of capitalised words becomes one name in a cartouche, so
+    "jan Lisa li pona" puts only "Lisa" in a cartouche
+  - a blank line ends a paragraph and starts a new line
+  - digits and punctuation are dropped
+
+Lines break greedily between words and names; a name wider than the page
+gets a line of its own. Input is read a line at a time and pages are laid
+out and written one at a time, so memory stays bounded by the page size
+whatever the length of the input. Each distinct word and name is laid out
+once, and its glyph paths are shared by every page (see read_svg_paths()).
+
+Usage:
+    python typeset_text.py article.txt
+    python typeset_text.py article.txt --width 20000 --lines 30 --output-dir pages
+    curl ... | python typeset_text.py - --output-dir pages
+"""
+
+import argparse
+import re
+import sys
+from collections import Counter, namedtuple
+from pathlib import Path
+
+from generate_sitelen_kalama_pona import (
+    ROOT_DIR, SPACING, TARGET_HEIGHT, Layout, Piece, get_available_compounds, match_compounds,
+    parse_syllables, place_cartouche, svg_document, syllable_commons_url, syllable_piece,
+    word_commons_url, word_piece)
+from tracing import add_trace_arguments, span, trace_from_args
+
+DEFAULT_OUTPUT_DIR = ROOT_DIR / 'output' / 'pages'
+
+# Line width in glyph units (a line is TARGET_HEIGHT tall) and lines per page
+DEFAULT_WIDTH = 16000
+DEFAULT_LINES = 20
+LINE_GAP = 400
+
+TOKEN_RE = re.compile(r'[^\W\d_]+|[^\w\s]+|\d+')
+
+# A word or a name laid out at x = 0, copied into place on each page it appears on
+Unit = namedtuple('Unit', ['text', 'word_pieces', 'cartouche_pieces', 'syllable_pieces',
+                           'width', 'sources'])
+
+# Marks a paragraph break in the unit stream
+PARAGRAPH = None
+
+
+def tokens(lines):
+    """('word' | 'name' | 'break', text) for each token of the input lines.
+
+    'break' ends a run of words or a name: punctuation, digits, line ends.
+    A blank line gives ('paragraph', '').
+    """
+    for line in lines:
+        if not line.strip():
+            yield 'paragraph', ''
+            continue
+        for match in TOKEN_RE.finditer(line):
+            token = match.group()
+            if not token[0].isalpha():
+                yield 'break', token
+            elif token[0].isupper():
+                yield 'name', token
+            else:
+                yield 'word', token.lower()
+        yield 'break', ''
+
+
+def phrases(lines, compound_set):
+    """Words (compounds matched), names and PARAGRAPH markers from the input lines."""
+    words = []
+    name = []
+    for kind, token in tokens(lines):
+        if kind != 'word' and words:
+            yield from match_compounds(words, compound_set)
+            words = []
+        if kind != 'name' and name:
+            yield ''.join(name)
+            name = []
+        if kind == 'word':
+            words.append(token)
+        elif kind == 'name':
+            name.append(token)
+        elif kind == 'paragraph':
+            yield PARAGRAPH
+
+
+def is_name(phrase):
+    return phrase[0].isupper()
+
+
+def unit(phrase):
+    """(Unit or None without glyphs, the words and syllables missing a glyph)."""
+    if is_name(phrase):
+        pieces = []
+        sources = []
+        missing = []
+        for syl in parse_syllables(phrase):
+            piece = syllable_piece(syl)
+            if piece:
+                pieces.append(piece)
+                sources.append(sys.intern(f'{syl}: {syllable_commons_url(syl)}'))
+            else:
+                missing.append(syl)
+        if not pieces:
+            return None, missing + [phrase]
+        cartouche_pieces, width = place_cartouche(pieces, 0)
+        return Unit(phrase, (), tuple(cartouche_pieces), tuple(pieces), width,
+                    tuple(sources)), missing
+
+    piece, width = word_piece(phrase)
+    if not piece:
+        return None, [phrase]
+    return Unit(phrase, (piece,), (), (), width,
+                (sys.intern(f'{phrase}: {word_commons_url(phrase)}'),)), []
+
+
+def lines_of_units(stream, width, missing):
+    """Break a stream of phrases into lines no wider than width: lists of (x, Unit).
+
+    Units are laid out once per distinct word or name and reused.
+    """
+    units = {}
+    line = []
+    x = 0
+    for phrase in stream:
+        if phrase is PARAGRAPH:
+            if line:
+                yield line
+            line = []
+            x = 0
+            continue
+        if phrase not in units:
+            units[phrase] = unit(phrase)
+        item, not_found = units[phrase]
+        missing.update(not_found)
+        if item is None:
+            continue
+        if line and x + item.width > width:
+            yield line
+            line = []
+            x = 0
+        line.append((x, item))
+        x += item.width + SPACING
+    if line:
+        yield line
+
+
+def page_layout(lines, width):
+    """Layout for one page of lines, stacked top to bottom."""
+    word_pieces = []
+    cartouche_pieces = []
+    syllable_pieces = []
+    sources = {}
+    words = []
+    page_width = width
+    for row, line in enumerate(lines):
+        y = row * (TARGET_HEIGHT + LINE_GAP)
+        for x, item in line:
+            for placed, pieces in ((word_pieces, item.word_pieces),
+                                   (cartouche_pieces, item.cartouche_pieces),
+                                   (syllable_pieces, item.syllable_pieces)):
+                for p in pieces:
+                    placed.append(Piece(p.paths, p.viewbox, p.scale_x, p.scale_y,
+                                        p.x_offset + x, p.y_offset + y))
+            sources.update(dict.fromkeys(item.sources))
+            words.append(item.text)
+        x, item = line[-1]
+        page_width = max(page_width, x + item.width)
+    height = len(lines) * (TARGET_HEIGHT + LINE_GAP) - LINE_GAP
+    return Layout(' '.join(words), (), (), word_pieces, cartouche_pieces,
+                  syllable_pieces, list(sources), page_width, height)
+
+
+def pages(lines, width=DEFAULT_WIDTH, lines_per_page=DEFAULT_LINES, missing=None):
+    """Yield a Layout per page of the input lines, laying out one page at a time.
+
+    Words and names without glyphs are skipped and counted in missing (a Counter).
+    """
+    if missing is None:
+        missing = Counter()
+    units = lines_of_units(phrases(lines, get_available_compounds()), width, missing)
+    page = []
+    for line in units:
+        page.append(line)
+        if len(page) == lines_per_page:
+            yield page_layout(page, width)
+            page = []
+    if page:
+        yield page_layout(page, width)
+
+
+def write_pages(lines, output_dir, width=DEFAULT_WIDTH, lines_per_page=DEFAULT_LINES):
+    """Write page-NNNN.svg files to output_dir. Returns (pages written, missing Counter)."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    missing = Counter()
+    count = 0
+    for layout in pages(lines, width, lines_per_page, missing):
+        count += 1
+        svg_content, _ = svg_document(layout)
+        with span('write'):
+            path = output_dir / f'page-{count:04d}.svg'
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(svg_content)
+        print(f'  Wrote {path.name} ({len(layout.word_pieces)} words, '
+              f'{len(layout.syllable_pieces)} syllables)')
+
+    # Drop pages left over from a longer earlier run
+    for stale in sorted(output_dir.glob('page-*.svg')):
+        match = re.fullmatch(r'page-(\d+)\.svg', stale.name)
+        if match and int(match.group(1)) > count:
+            stale.unlink()
+    return count, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Typeset long toki pona text as SVG pages.')
+    parser.add_argument('input', help='UTF-8 text file, or - for stdin')
+    parser.add_argument('--output-dir', type=Path,
+                        help=f'directory for page-NNNN.svg (default {DEFAULT_OUTPUT_DIR}/<input name>)')
+    parser.add_argument('--width', type=float, default=DEFAULT_WIDTH,
+                        help=f'line width in glyph units; lines are {TARGET_HEIGHT} tall '
+                             f'(default {DEFAULT_WIDTH})')
+    parser.add_argument('--lines', type=int, default=DEFAULT_LINES,
+                        help=f'lines per page (default {DEFAULT_LINES})')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    trace_from_args(args)
+    if args.lines < 1 or args.width <= 0:
+        parser.error('--width and --lines must be positive')
+
+    if args.input == '-':
+        sys.stdin.reconfigure(encoding='utf-8')
+        output_dir = args.output_dir or DEFAULT_OUTPUT_DIR / 'stdin'
+        count, missing = write_pages(sys.stdin, output_dir, args.width, args.lines)
+    else:
+        input_path = Path(args.input)
+        output_dir = args.output_dir or DEFAULT_OUTPUT_DIR / input_path.stem
+        with open(input_path, encoding='utf-8') as f:
+            count, missing = write_pages(f, output_dir, args.width, args.lines)
+
+    print(f'\nWrote {count} pages to {output_dir}')
+    if missing:
+        print(f'Skipped {sum(missing.values())} words/syllables without glyphs '
+              f'({len(missing)} distinct); most common:', file=sys.stderr)
+        for text, n in missing.most_common(10):
+            print(f'  {text}: {n}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
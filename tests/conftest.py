@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPTS_DIR = Path(__file__).parent.parent / 'scripts'
+sys.path.insert(0, str(SCRIPTS_DIR))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from stub_api import StubAPI  # noqa: E402
+
+
+@pytest.fixture
+def stub_api():
+    with StubAPI() as api:
+        yield api
@@ -0,0 +1,189 @@
+"""
+A local stand-in for the MediaWiki action API, for the fetch script tests.
+
+StubAPI serves canned data on 127.0.0.1 from a background thread:
+
+  wbgetentities   entities from StubAPI.entities ({qid: entity JSON})
+  query/search    haslabel:tok results from StubAPI.search_results (QIDs),
+                  each with its entity's 'timestamp' (last edit), paging no
+                  further than StubAPI.search_ceiling like CirrusSearch
+  query/info      lastrevid of each entity (prop=info)
+  query/allpages  titles from StubAPI.pages, honouring apfrom/apto/apcontinue
+                  and normalizing their first letter the way MediaWiki does
+
+Every response carries an ETag and is answered with 304 when the request's
+If-None-Match matches, and is gzip-compressed when the client asks for it.
+Tests can queue failing statuses with fail(), slow every response down with
+delay, and inspect the recorded requests and the peak number in flight.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubAPI:
+    def __init__(self, entities=None, search_results=None, pages=None, delay=0.0):
+        self.entities = entities or {}
+        self.search_results = search_results or []
+        self.pages = pages or []          # [(pageid, title)]
+        self.delay = delay
+        self.page_limit = 500
+        self.search_ceiling = 10000       # sroffset past which search stops paging
+        self.requests = []                # parsed query dicts, in arrival order
+        self.headers = []                 # request headers, in arrival order
+        self.failures = []                # (status, headers) to answer with next
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.clients = set()              # client ports seen (one per connection)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/w/api.php'
+
+    def __enter__(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                api._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,),
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail(self, status, count=1, retry_after=None):
+        """Answer the next count requests with status (and Retry-After, if given)."""
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+        self.failures.extend([(status, headers)] * count)
+
+    def actions(self, action):
+        """The recorded requests for one action."""
+        return [r for r in self.requests if r.get('action') == action]
+
+    def _handle(self, handler):
+        params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(handler.path).query))
+        with self._lock:
+            self.requests.append(params)
+            self.headers.append(dict(handler.headers))
+            self.clients.add(handler.client_address[1])
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failure = self.failures.pop(0) if self.failures else None
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            if failure:
+                status, headers = failure
+                self._send(handler, status, b'', headers)
+                return
+            body = json.dumps(self._respond(params), sort_keys=True).encode('utf-8')
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            if handler.headers.get('If-None-Match') == etag:
+                self._send(handler, 304, b'', {'ETag': etag})
+                return
+            headers = {'ETag': etag, 'Content-Type': 'application/json'}
+            if 'gzip' in handler.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body)
+                headers['Content-Encoding'] = 'gzip'
+            self._send(handler, 200, body, headers)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _send(handler, status, body, headers):
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _respond(self, params):
+        action = params.get('action')
+        if action == 'wbgetentities':
+            return self._wbgetentities(params)
+        if action == 'query' and params.get('list') == 'search':
+            return self._search(params)
+        if action == 'query' and params.get('list') == 'allpages':
+            return self._allpages(params)
+        if action == 'query' and params.get('prop') == 'info':
+            return self._info(params)
+        return {'error': {'code': 'badvalue', 'info': f'unsupported request {params}'}}
+
+    def _wbgetentities(self, params):
+        props = params.get('props', '').split('|')
+        entities = {}
+        for qid in params['ids'].split('|'):
+            entity = self.entities.get(qid)
+            if entity is None:
+                entities[qid] = {'id': qid, 'missing': ''}
+                continue
+            out = {'id': qid, 'type': 'item'}
+            if 'info' in props:
+                out['lastrevid'] = entity.get('lastrevid', 1)
+            for prop in ('labels', 'sitelinks', 'claims'):
+                if prop in props and prop in entity:
+                    out[prop] = entity[prop]
+            entities[qid] = out
+        return {'entities': entities, 'success': 1}
+
+    def _search(self, params):
+        offset = int(params.get('sroffset', 0))
+        limit = int(params.get('srlimit', 10))
+        hits = self.search_results[offset:min(offset + limit, self.search_ceiling)]
+        data = {'query': {'searchinfo': {'totalhits': len(self.search_results)},
+                          'search': [{'ns': 0, 'title': qid, 'timestamp': self.entities.get(
+                              qid, {}).get('timestamp', '2001-01-01T00:00:00Z')}
+                              for qid in hits]}}
+        if offset + limit < min(len(self.search_results), self.search_ceiling):
+            data['continue'] = {'sroffset': offset + limit, 'continue': '-||'}
+        return data
+
+    def _info(self, params):
+        pages = {}
+        for n, qid in enumerate(params['titles'].split('|')):
+            entity = self.entities.get(qid)
+            if entity is None:
+                pages[str(-1 - n)] = {'ns': 0, 'title': qid, 'missing': ''}
+            else:
+                pages[str(n + 1)] = {'ns': 0, 'title': qid,
+                                     'lastrevid': entity.get('lastrevid', 1)}
+        return {'query': {'pages': pages}}
+
+    def _allpages(self, params):
+        def normalize(title):
+            return title[:1].upper() + title[1:]
+
+        titles = sorted(self.pages, key=lambda page: page[1])
+        start = normalize(params.get('apcontinue') or params.get('apfrom') or '')
+        end = normalize(params['apto']) if params.get('apto') else None
+        limit = min(int(params.get('aplimit', 10)), self.page_limit)
+        selected = [(pageid, title) for pageid, title in titles
+                    if title >= start and (end is None or title <= end)]
+        data = {'query': {'allpages': [{'pageid': pageid, 'ns': 0, 'title': title}
+                                       for pageid, title in selected[:limit]]}}
+        if len(selected) > limit:
+            data['continue'] = {'apcontinue': selected[limit][1], 'continue': '-||'}
+        return data
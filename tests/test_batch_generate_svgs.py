@@ -0,0 +1,72 @@
+import argparse
+import tracemalloc
+
+import pytest
+
+import batch_generate_svgs
+import pipeline_db
+from memory_profile import MemoryProfiler
+
+
+@pytest.fixture
+def batch(tmp_path, monkeypatch):
+    """Run batch_generate_svgs against a database of n labels, with a stub generate()."""
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+
+    def generate(label):
+        path = output_dir / f'{label}.svg'
+        path.write_text(f'<svg>{label}</svg>', encoding='utf-8')
+        return path
+
+    monkeypatch.setattr(batch_generate_svgs, 'generate', generate)
+    monkeypatch.setattr(batch_generate_svgs, 'CSV_FILE', tmp_path / 'missing.csv')
+    monkeypatch.setattr(batch_generate_svgs, 'INDEX_FILE', tmp_path / 'output_index.json')
+    monkeypatch.setattr(batch_generate_svgs, 'SHARDS_DIR', tmp_path / 'shards')
+    monkeypatch.setattr(batch_generate_svgs, 'OUTPUT_DIR', output_dir)
+
+    def run(n, changed_only=False, shard=None, db='pipeline.sqlite'):
+        conn = pipeline_db.connect(tmp_path / db)
+        # n labels; every third one is shared by two items
+        pipeline_db.replace_items(conn, (
+            {'qid': f'Q{q}', 'label': f'nimi {q // 2}', 'tok_title': ''}
+            for q in range(2 * n) if q % 2 == 0 or q // 2 % 3 == 0))
+        monkeypatch.setattr(pipeline_db, 'DB_PATH', tmp_path / db)
+        memory = MemoryProfiler()
+        try:
+            batch_generate_svgs.run(argparse.Namespace(
+                merge=None, shard=shard, changed_only=changed_only), memory)
+        finally:
+            tracemalloc.stop()
+        conn.close()
+        return {name: peak for name, peak, *_ in memory.stages}
+
+    return run
+
+
+def test_render_memory_does_not_grow_with_label_count(batch, capfd):
+    small = batch(1000, db='small.sqlite')
+    large = batch(4000, db='large.sqlite')
+    assert 'Done! 4000 succeeded' in capfd.readouterr().out
+
+    # The output index holds every render; selecting and rendering must not
+    for name in ('select labels', 'render'):
+        assert large[name] < small[name] * 1.5 + 64 * 1024, (name, small, large)
+
+
+def test_changed_only_and_shards_select_distinct_labels(batch, capsys):
+    batch(30)
+    out = capsys.readouterr().out
+    assert 'Generating SVGs for 30 titles' in out
+    assert out.count('] nimi 3\n') == 1
+
+    batch(30, changed_only=True)
+    assert 'Generating SVGs for 0 titles' in capsys.readouterr().out
+
+    titles = 0
+    for index in (1, 2, 3):
+        batch(30, shard=(index, 3))
+        out = capsys.readouterr().out
+        titles += int(out.split('Generating SVGs for ')[1].split()[0])
+    # A shared label is rendered by each shard holding one of its items
+    assert 30 <= titles <= 40
@@ -0,0 +1,53 @@
+import pytest
+
+import build_font
+import cff_optimize
+from splineset import GlyphCache
+
+# Each syllable shares whole contours with its -n form, so subroutines are made
+SYLLABLES = ['ma', 'man', 'mi', 'min', 'pa', 'pan', 'pi', 'pin']
+
+
+@pytest.fixture(scope='module')
+def glyphs():
+    cache = GlyphCache(enabled=False)
+    glyph_data = {}
+    cmap = {}
+    for i, syllable in enumerate(SYLLABLES):
+        width, contours, _, _ = build_font.load_glyph(syllable, cache, tolerance=1.0)
+        glyph_data[f'skp.{syllable}'] = (width, contours)
+        cmap[build_font.PUA_BASE + i] = f'skp.{syllable}'
+    programs = {'.notdef': build_font.make_notdef_charstring().program}
+    for name, (width, contours) in glyph_data.items():
+        programs[name] = build_font.contours_to_charstring(contours, width).program
+    return glyph_data, cmap, programs
+
+
+def compile_font(glyphs, programs, subrs=()):
+    glyph_data, cmap, _ = glyphs
+    return cff_optimize.font_bytes(
+        build_font.make_font(glyph_data, cmap, programs, subrs, timestamp=0))
+
+
+def test_optimized_charstrings_draw_the_same_outlines(glyphs):
+    programs = glyphs[2]
+    plain = compile_font(glyphs, programs)
+    specialized = {name: cff_optimize.specialize(p) for name, p in programs.items()}
+    subroutinized, subrs = cff_optimize.subroutinize(specialized)
+
+    assert subrs
+    for data in (compile_font(glyphs, specialized), compile_font(glyphs, subroutinized, subrs)):
+        assert len(data) < len(plain)
+        assert cff_optimize.outline_mismatches(plain, data) == []
+
+
+def test_changed_outline_is_detected(glyphs):
+    programs = glyphs[2]
+    moved = dict(programs)
+    program = list(programs['skp.pi'])
+    # Nudge the first moveto by one unit
+    program[program.index('rmoveto') - 1] += 1
+    moved['skp.pi'] = program
+
+    assert cff_optimize.outline_mismatches(compile_font(glyphs, programs),
+                                           compile_font(glyphs, moved)) == ['skp.pi']
@@ -0,0 +1,140 @@
+import csv
+import sys
+
+import pytest
+
+import fetch_wikidata_sparql as fetch
+import pipeline_db
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point the fetcher's output files at tmp_path."""
+    for name, filename in [('LABELS_FILE', 'labels.csv'), ('NAMES_FILE', 'names.txt'),
+                           ('STATE_FILE', 'revisions.json'), ('CHANGED_FILE', 'changed.txt'),
+                           ('CLAIMS_FILE', 'p18.csv')]:
+        monkeypatch.setattr(fetch, name, tmp_path / filename)
+    return tmp_path
+
+
+def entity(label, revision, image=None):
+    data = {'labels': {'tok': {'language': 'tok', 'value': label}}, 'lastrevid': revision}
+    if image:
+        data['claims'] = {'P18': [{'rank': 'normal', 'mainsnak': {
+            'snaktype': 'value', 'datavalue': {'value': image, 'type': 'string'}}}]}
+    return data
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_full_refresh_stores_revisions_and_p18(stub_api, data_dir):
+    stub_api.entities = {'Q1': entity('ma Kanata', 11, 'Flag of Canada.svg'),
+                         'Q2': entity('jan Lisa', 22)}
+    stub_api.search_results = ['Q1', 'Q2']
+    client = fetch.MediaWikiClient(stub_api.url, rate=None)
+    conn = pipeline_db.connect(data_dir / 'pipeline.sqlite')
+
+    revisions = fetch.full_refresh(client, conn, workers=2, filters=[])
+
+    assert revisions == {'Q1': 11, 'Q2': 22}
+    request = stub_api.actions('wbgetentities')[0]
+    assert 'info' in request['props'].split('|')
+    assert [r['label'] for r in read_csv(fetch.LABELS_FILE)] == ['ma Kanata', 'jan Lisa']
+    assert read_csv(fetch.CLAIMS_FILE) == [{'qid': 'Q1', 'image': 'Flag of Canada.svg'}]
+    assert pipeline_db.item_count(conn) == 2
+    conn.close()
+    client.close()
+
+
+def test_incremental_refresh_refetches_only_changed_items(stub_api, data_dir):
+    stub_api.entities = {f'Q{n}': entity(f'nimi {n}', n) for n in range(1, 6)}
+    stub_api.search_results = list(stub_api.entities)
+    client = fetch.MediaWikiClient(stub_api.url, rate=None)
+    conn = pipeline_db.connect(data_dir / 'pipeline.sqlite')
+    revisions = fetch.full_refresh(client, conn, workers=2, filters=[])
+    fetch.save_state('2024-01-01T00:00:00Z', revisions)
+
+    stub_api.entities['Q3'] = entity('nimi sin', 300, 'Sin.svg')
+    stub_api.requests.clear()
+    last_run, revisions = fetch.load_state()
+    revisions = fetch.incremental_refresh(client, conn, 2, last_run, revisions)
+
+    refetched = [r['ids'] for r in stub_api.actions('wbgetentities')]
+    assert refetched == ['Q3']
+    assert revisions['Q3'] == 300
+    assert all(revision is not None for revision in revisions.values())
+    assert [r['label'] for r in read_csv(fetch.LABELS_FILE)][2] == 'nimi sin'
+    assert fetch.CHANGED_FILE.read_text(encoding='utf-8') == 'nimi sin\n'
+    assert read_csv(fetch.CLAIMS_FILE) == [{'qid': 'Q3', 'image': 'Sin.svg'}]
+    conn.close()
+    client.close()
+
+
+def test_incremental_refresh_fills_a_fresh_database(stub_api, data_dir):
+    stub_api.entities = {f'Q{n}': entity(f'nimi {n}', n) for n in range(1, 6)}
+    stub_api.search_results = list(stub_api.entities)
+    client = fetch.MediaWikiClient(stub_api.url, rate=None)
+    conn = pipeline_db.connect(data_dir / 'pipeline.sqlite')
+    revisions = fetch.full_refresh(client, conn, workers=2, filters=[])
+    conn.close()
+
+    # As in CI: the CSV and revision state are committed, the database is not
+    stub_api.entities['Q2'] = entity('nimi ante', 200)
+    conn = pipeline_db.connect(data_dir / 'fresh.sqlite')
+    fetch.incremental_refresh(client, conn, 2, '2024-01-01T00:00:00Z', revisions)
+
+    items = list(pipeline_db.iter_items(conn))
+    assert [item['qid'] for item in items] == ['Q1', 'Q2', 'Q3', 'Q4', 'Q5']
+    assert items[1]['label'] == 'nimi ante'
+    assert conn.execute('SELECT revision FROM items WHERE qid = ?', ('Q5',)).fetchone()[0] == 5
+    conn.close()
+    client.close()
+
+
+def test_edited_since_search_detects_the_offset_ceiling(stub_api):
+    stub_api.entities = {f'Q{n}': dict(entity(f'nimi {n}', n), timestamp='2025-06-01T00:00:00Z')
+                         for n in range(1, 31)}
+    stub_api.search_results = list(stub_api.entities)
+    client = fetch.MediaWikiClient(stub_api.url, rate=None)
+
+    # Every result reached, or one edited before since: the list is complete
+    assert len(fetch.search_edited_since(client, '2025-01-01T00:00:00Z', limit=50)) == 30
+    assert fetch.search_edited_since(client, '2025-07-01T00:00:00Z', limit=5) == []
+
+    stub_api.search_ceiling = 10
+    with pytest.raises(fetch.SearchCeilingReached, match='offset 10 of 30'):
+        fetch.search_edited_since(client, '2025-01-01T00:00:00Z', limit=5)
+    client.close()
+
+
+def test_incremental_run_past_the_ceiling_falls_back_to_full_refresh(
+        stub_api, data_dir, monkeypatch, capsys):
+    stub_api.entities = {f'Q{n}': entity(f'nimi {n}', n) for n in range(1, 6)}
+    stub_api.search_results = list(stub_api.entities)
+    monkeypatch.setattr(pipeline_db, 'DB_PATH', data_dir / 'pipeline.sqlite')
+    monkeypatch.setattr(fetch, 'SHARD_FILTERS', [])
+    argv = ['fetch_wikidata_sparql.py', '--api-url', stub_api.url, '--rate', '0',
+            '--no-cache', '--skip-p18']
+    monkeypatch.setattr(sys, 'argv', argv)
+    fetch.main()
+
+    # More new items than the edited-since search can page through
+    for n in range(6, 16):
+        stub_api.entities[f'Q{n}'] = dict(entity(f'nimi {n}', n),
+                                          timestamp='2099-01-01T00:00:00Z')
+    stub_api.search_results = sorted(stub_api.entities, key=lambda q: -int(q[1:]))
+    stub_api.search_ceiling = 5
+    monkeypatch.setattr(sys, 'argv', argv + ['--incremental'])
+    stub_api.requests.clear()
+    capsys.readouterr()
+    fetch.main()
+
+    assert 'Falling back to a full refresh' in capsys.readouterr().err
+    searches = [r for r in stub_api.actions('query') if r.get('list') == 'search']
+    # The edited-since search, then the full enumeration
+    assert searches[0]['srsort'] == 'last_edit_desc'
+    assert 'srsort' not in searches[-1]
+    assert len(stub_api.actions('wbgetentities')) == 1
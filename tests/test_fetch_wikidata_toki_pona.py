@@ -0,0 +1,105 @@
+import csv
+import sys
+
+import pytest
+
+import fetch_wikidata_toki_pona as crawl
+from mediawiki_client import APIError, MediaWikiClient
+
+TITLES = ['Akesi', 'Ala', 'B', 'Bbb', 'Jan', 'Jan Lisa', 'Kala', 'Ma', 'Ma Kanata', 'Pona',
+          'Sewi', 'Toki', 'Toki Pona', 'Wawa']
+
+
+@pytest.fixture
+def wiki(stub_api):
+    stub_api.pages = [(n, title) for n, title in enumerate(TITLES, 1)]
+    stub_api.page_limit = 3
+    return stub_api
+
+
+def titles(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return [row['title'] for row in csv.DictReader(f)]
+
+
+class FailingClient:
+    """Pass requests through until the given number have been made, then fail."""
+
+    def __init__(self, client, succeed):
+        self.client = client
+        self.succeed = succeed
+
+    def get(self, params):
+        if self.succeed == 0:
+            raise APIError('connection lost')
+        self.succeed -= 1
+        return self.client.get(params)
+
+
+def test_resume_truncates_rows_after_the_checkpoint(wiki, tmp_path):
+    out = tmp_path / 'pages.csv'
+    client = MediaWikiClient(wiki.url, rate=None)
+
+    with pytest.raises(APIError):
+        crawl.crawl_range(FailingClient(client, 2), out)
+    checkpoint = crawl.load_checkpoint(out)
+    assert checkpoint['pages'] == 6
+    # A row written after the checkpoint, as if the process died mid-batch
+    with open(out, 'a', encoding='utf-8', newline='') as f:
+        f.write('999,Half written\n')
+
+    wiki.requests.clear()
+    assert crawl.crawl_range(client, out) == len(TITLES)
+    client.close()
+
+    assert titles(out) == TITLES
+    assert wiki.requests[0]['apcontinue'] == checkpoint['apcontinue']
+    assert crawl.load_checkpoint(out) == {'apfrom': None, 'apto': None, 'done': True,
+                                          'pages': len(TITLES)}
+
+
+def test_completed_crawl_is_not_repeated(wiki, tmp_path):
+    out = tmp_path / 'pages.csv'
+    client = MediaWikiClient(wiki.url, rate=None)
+    crawl.crawl_range(client, out)
+    wiki.requests.clear()
+    assert crawl.crawl_range(client, out) == len(TITLES)
+    client.close()
+    assert wiki.requests == []
+
+
+def test_split_ranges_cover_every_title_once(wiki, tmp_path, monkeypatch):
+    out = tmp_path / 'pages.csv'
+    monkeypatch.setattr(crawl, 'OUT_PATH', out)
+    # Lowercase boundaries that equal existing titles once normalized
+    monkeypatch.setattr(sys, 'argv', ['fetch_wikidata_toki_pona.py', '--api-url', wiki.url,
+                                      '--split', 'jan,b,ma_Kanata,toki', '--workers', '3',
+                                      '--no-cache'])
+    crawl.main()
+
+    assert titles(out) == TITLES
+    assert {r.get('apto') for r in wiki.actions('query')} >= {'B', 'Jan', 'Ma Kanata', 'Toki'}
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['pages.csv']
+
+
+def test_checkpoints_for_other_split_boundaries_are_discarded(wiki, tmp_path, monkeypatch):
+    out = tmp_path / 'pages.csv'
+    monkeypatch.setattr(crawl, 'OUT_PATH', out)
+    part_0 = tmp_path / 'pages.part-00.csv'
+    part_1 = tmp_path / 'pages.part-01.csv'
+    client = MediaWikiClient(wiki.url, rate=None)
+    # Left behind by a failed run with --split ma: part 0 done, part 1 midway
+    crawl.crawl_range(client, part_0, None, 'ma')
+    with pytest.raises(APIError):
+        crawl.crawl_range(FailingClient(client, 1), part_1, 'ma', None)
+    client.close()
+    assert crawl.load_checkpoint(part_0)['done']
+    assert crawl.load_checkpoint(part_1)['apfrom'] == 'Ma'
+
+    # Rerun with different boundaries: both parts now cover other ranges
+    monkeypatch.setattr(sys, 'argv', ['fetch_wikidata_toki_pona.py', '--api-url', wiki.url,
+                                      '--split', 'jan', '--no-cache'])
+    crawl.main()
+
+    assert titles(out) == TITLES
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['pages.csv']
@@ -0,0 +1,42 @@
+import sys
+
+import generate_quickstatements as qs
+import pipeline_db
+
+
+def statuses(conn):
+    return dict(conn.execute('SELECT qid, status FROM publications ORDER BY qid'))
+
+
+def test_publication_status_follows_snapshot_and_submitted_shards(tmp_path, monkeypatch):
+    monkeypatch.setattr(qs, 'DATA_DIR', tmp_path)
+    monkeypatch.setattr(qs, 'SHARDS_DIR', tmp_path / 'quickstatements')
+    monkeypatch.setattr(qs, 'CLAIMS_FILE', tmp_path / 'p18.csv')
+    monkeypatch.setattr(pipeline_db, 'DB_PATH', tmp_path / 'pipeline.sqlite')
+    conn = pipeline_db.connect()
+    pipeline_db.replace_items(conn, [
+        {'qid': f'Q{n}', 'label': f'nimi {n}', 'tok_title': ''} for n in range(1, 5)])
+    pipeline_db.record_renders(conn, [(f'nimi {n}', f'nimi {n}.svg', 'hash')
+                                      for n in range(1, 5)], 'v1')
+
+    def run(*args, p18=()):
+        qs.CLAIMS_FILE.write_text(''.join(['qid,image\n'] + [f'{q},{q}.jpg\n' for q in p18]),
+                                  encoding='utf-8')
+        monkeypatch.setattr(sys, 'argv', ['generate_quickstatements.py', '--shard-size', '2',
+                                          *args])
+        qs.main()
+        return [line.split('\t')[0] for line in
+                (tmp_path / 'quickstatements.txt').read_text(encoding='utf-8').splitlines()]
+
+    assert run(p18=['Q2']) == ['Q1', 'Q3', 'Q4']
+    assert statuses(conn) == {'Q1': 'queued', 'Q2': 'has_p18', 'Q3': 'queued', 'Q4': 'queued'}
+
+    # Q2's P18 was removed: it is queued again
+    assert run() == ['Q1', 'Q2', 'Q3', 'Q4']
+    assert statuses(conn)['Q2'] == 'queued'
+
+    run('--mark-published', 'shard-0001.txt')
+    assert statuses(conn) == {'Q1': 'published', 'Q2': 'published', 'Q3': 'queued',
+                              'Q4': 'queued'}
+    assert run() == ['Q3', 'Q4']
+    conn.close()
@@ -0,0 +1,96 @@
+import bz2
+import gzip
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+import fetch_wikidata_sparql
+import ingest_wikidata_dump as ingest
+from mediawiki_client import MediaWikiClient
+
+FIXTURE = Path(__file__).parent / 'fixtures' / 'wikidata-dump.json.bz2'
+
+# Items with a tok label, in dump order. Q42 (tok description only), Q64
+# (tok alias only) and P18 (a property) pass the '"tok"' prefilter but are
+# not items with a tok label.
+EXPECTED = [
+    {'qid': 'Q1', 'label': 'ali', 'tok_title': 'ali'},
+    {'qid': 'Q16', 'label': 'ma Kanata', 'tok_title': ''},
+    {'qid': 'Q90', 'label': 'ma tomo Pali', 'tok_title': 'ma tomo Pali'},
+    {'qid': 'Q1860', 'label': 'toki Inli', 'tok_title': ''},
+]
+
+
+def dump_entities():
+    lines = bz2.decompress(FIXTURE.read_bytes()).decode('utf-8').splitlines()
+    return [json.loads(line.rstrip(',')) for line in lines if line.startswith('{')]
+
+
+@pytest.fixture(params=['bz2', 'gz', 'json'])
+def dump(request, tmp_path):
+    """The fixture dump in each supported compression."""
+    if request.param == 'bz2':
+        return FIXTURE
+    data = bz2.decompress(FIXTURE.read_bytes())
+    path = tmp_path / f'dump.json{"" if request.param == "json" else ".gz"}'
+    path.write_bytes(gzip.compress(data) if request.param == 'gz' else data)
+    return path
+
+
+def test_rows_in_dump_order(dump):
+    stats = {}
+    # A tiny block size makes every few lines a separate worker task
+    rows = list(ingest.iter_dump_rows(dump, workers=2, block_size=256, stats=stats))
+    assert rows == EXPECTED
+    assert stats['lines'] == len(dump_entities()) + 2   # plus the [ and ] lines
+
+
+def test_require_sitelink(dump):
+    rows = list(ingest.iter_dump_rows(dump, workers=2, block_size=256, require_sitelink=True))
+    assert rows == [row for row in EXPECTED if row['tok_title']]
+
+
+def test_csv_matches_the_fetcher(stub_api, tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', [
+        'ingest_wikidata_dump.py', str(FIXTURE), '--workers', '2', '--no-db',
+        '--output', str(tmp_path / 'dump.csv'), '--names', str(tmp_path / 'dump.txt')])
+    ingest.main()
+
+    # The same entities served by the stand-in API and fetched the normal way
+    stub_api.entities = {e['id']: e for e in dump_entities() if e['type'] == 'item'}
+    client = MediaWikiClient(stub_api.url, rate=None)
+    rows = fetch_wikidata_sparql.fetch_entity_batch(client, list(stub_api.entities))
+    client.close()
+    fetch_wikidata_sparql.write_label_files(rows, tmp_path / 'api.csv', tmp_path / 'api.txt')
+
+    assert (tmp_path / 'dump.csv').read_bytes() == (tmp_path / 'api.csv').read_bytes()
+    assert (tmp_path / 'dump.txt').read_bytes() == (tmp_path / 'api.txt').read_bytes()
+
+
+class InlinePool:
+    """Stands in for multiprocessing.Pool, tracking how many tasks are outstanding."""
+
+    def __init__(self):
+        self.outstanding = 0
+        self.max_outstanding = 0
+
+    def apply_async(self, func, args):
+        self.outstanding += 1
+        self.max_outstanding = max(self.max_outstanding, self.outstanding)
+        pool = self
+
+        class Result:
+            def get(self):
+                pool.outstanding -= 1
+                return func(*args)
+        return Result()
+
+
+def test_blocks_in_flight_are_bounded():
+    pool = InlinePool()
+    blocks = (b'{"type": "item", "id": "Q%d"}\n' % n for n in range(100))
+    results = list(ingest.iter_parsed_blocks(pool, blocks, window=4))
+    assert len(results) == 100
+    assert pool.max_outstanding == 4
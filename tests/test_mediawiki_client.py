@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+import fetch_wikidata_sparql
+from http_cache import ResponseCache
+from mediawiki_client import APIError, MediaWikiClient
+
+
+def entities(count):
+    return {f'Q{n}': {'labels': {'tok': {'language': 'tok', 'value': f'nimi {n}'}},
+                      'lastrevid': 1000 + n}
+            for n in range(1, count + 1)}
+
+
+def client_for(api, **kwargs):
+    kwargs.setdefault('rate', None)
+    kwargs.setdefault('backoff', 0.01)
+    return MediaWikiClient(api.url, **kwargs)
+
+
+def test_entity_batches_of_fifty_in_order(stub_api):
+    stub_api.entities = entities(120)
+    qids = list(stub_api.entities)
+    client = client_for(stub_api)
+
+    rows = [row for batch in fetch_wikidata_sparql.iter_entity_rows(client, qids, workers=3)
+            for row in batch]
+    client.close()
+
+    requests = stub_api.actions('wbgetentities')
+    assert sorted(len(r['ids'].split('|')) for r in requests) == [20, 50, 50]
+    assert [row['qid'] for row in rows] == qids
+    assert rows[0]['label'] == 'nimi 1'
+
+
+def test_batches_run_concurrently_over_pooled_connections(stub_api):
+    stub_api.entities = entities(400)
+    stub_api.delay = 0.2
+    client = client_for(stub_api)
+
+    start = time.perf_counter()
+    batches = list(fetch_wikidata_sparql.iter_entity_rows(client, list(stub_api.entities),
+                                                         workers=4))
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    assert len(batches) == 8
+    assert stub_api.max_in_flight > 1
+    # 8 requests of 0.2 s each would take 1.6 s one at a time
+    assert elapsed < 1.2
+    # Each worker thread reuses its keep-alive connection
+    assert len(stub_api.clients) <= 4
+    assert all(h.get('Accept-Encoding') == 'gzip' for h in stub_api.headers)
+
+
+def test_throttled_request_is_retried(stub_api):
+    stub_api.entities = entities(1)
+    stub_api.fail(503, count=1, retry_after=0)
+    stub_api.fail(429)
+    client = client_for(stub_api)
+
+    data = client.get({'action': 'wbgetentities', 'ids': 'Q1', 'props': 'labels',
+                       'format': 'json'})
+    client.close()
+
+    assert data['entities']['Q1']['labels']['tok']['value'] == 'nimi 1'
+    assert len(stub_api.requests) == 3
+
+
+def test_gives_up_after_retries(stub_api):
+    stub_api.fail(503, count=3)
+    client = client_for(stub_api, retries=3)
+    with pytest.raises(APIError, match='gave up after 3 attempts'):
+        client.get({'action': 'wbgetentities', 'ids': 'Q1', 'format': 'json'})
+    client.close()
+
+
+def test_client_errors_are_not_retried(stub_api):
+    stub_api.fail(403)
+    client = client_for(stub_api)
+    with pytest.raises(APIError, match='HTTP 403'):
+        client.get({'action': 'wbgetentities', 'ids': 'Q1', 'format': 'json'})
+    client.close()
+    assert len(stub_api.requests) == 1
+
+
+def test_stale_cache_entry_is_revalidated_with_304(stub_api, tmp_path):
+    stub_api.entities = entities(1)
+    cache = ResponseCache(tmp_path / 'http', max_age=0)
+    client = client_for(stub_api, cache=cache)
+    params = {'action': 'wbgetentities', 'ids': 'Q1', 'props': 'labels', 'format': 'json'}
+
+    first = client.get(params)
+    second = client.get(params)
+    client.close()
+
+    assert first == second
+    assert 'If-None-Match' not in stub_api.headers[0]
+    assert stub_api.headers[1]['If-None-Match']
+    assert cache.stats['misses'] == 1
+    assert cache.stats['revalidated'] == 1
+
+
+def test_fresh_cache_entry_skips_the_network(stub_api, tmp_path):
+    stub_api.entities = entities(1)
+    cache = ResponseCache(tmp_path / 'http', max_age=3600)
+    client = client_for(stub_api, cache=cache)
+    params = {'action': 'wbgetentities', 'ids': 'Q1', 'props': 'labels', 'format': 'json'}
+
+    client.get(params)
+    client.get(params)
+    client.close()
+
+    assert len(stub_api.requests) == 1
+    assert cache.stats['hits'] == 1
+
+
+def test_search_enumeration_pages_through_results(stub_api):
+    stub_api.search_results = [f'Q{n}' for n in range(1, 1201)]
+    client = client_for(stub_api)
+    qids, total = fetch_wikidata_sparql.enumerate_qids(client, verbose=False)
+    client.close()
+    assert total == 1200
+    assert qids == stub_api.search_results
+    assert len(stub_api.actions('query')) == 3
@@ -0,0 +1,28 @@
+import io
+import tracemalloc
+
+import pytest
+
+from memory_profile import MIB, MemoryProfiler, current_rss, stage
+
+
+@pytest.mark.skipif(current_rss() is None, reason='needs /proc/self/statm')
+def test_stage_rss_falls_when_memory_is_freed():
+    memory = MemoryProfiler()
+    try:
+        with stage(memory, 'allocate'):
+            block = b'x' * (64 * MIB)
+        del block
+        with stage(memory, 'after free'):
+            pass
+    finally:
+        tracemalloc.stop()
+
+    (_, peak, held, rss_held), (_, _, freed, rss_freed) = memory.stages
+    assert peak >= 64 * MIB and held >= 64 * MIB and freed < MIB
+    # Unlike the process high-water mark, the per-stage RSS comes back down
+    assert rss_held - rss_freed > 32 * MIB
+
+    out = io.StringIO()
+    memory.report(file=out)
+    assert 'RSS at end' in out.getvalue()
@@ -0,0 +1,46 @@
+import pytest
+
+from build_font import SFDIR
+import outline_simplify
+from outline_simplify import max_deviation, node_count, simplify_contour, simplify_contours
+from splineset import GlyphCache
+
+SYLLABLES = ['a', 'ma', 'nen', 'pi', 'ton', 'ku', 'wo', 'jun', 'le', 'sin']
+
+
+@pytest.fixture(scope='module')
+def outlines():
+    cache = GlyphCache(enabled=False)
+    return {s: cache.load(SFDIR / f'{s}.sitelen_kalama_pona.glyph')[1] for s in SYLLABLES}
+
+
+@pytest.mark.parametrize('tolerance', [0.5, 1.0, 4.0])
+def test_simplified_glyphs_stay_within_tolerance(outlines, tolerance):
+    before = after = 0
+    for syllable, contours in outlines.items():
+        simplified = simplify_contours(contours, tolerance)
+        assert max_deviation(contours, simplified) <= tolerance, syllable
+        assert len(simplified) == len(contours)
+        for original, contour in zip(contours, simplified):
+            assert node_count([contour]) <= node_count([original]), syllable
+        before += node_count(contours)
+        after += node_count(simplified)
+    assert after < before
+
+
+def test_deviation_measures_a_moved_point():
+    square = [('m', 0, 0), ('l', 100, 0), ('l', 100, 100), ('l', 0, 100)]
+    moved = [('m', 0, 0), ('l', 100, 0), ('l', 103, 100), ('l', 0, 100)]
+    assert max_deviation([square], [square]) == 0
+    assert 2 < max_deviation([square], [moved]) <= 3
+
+
+def test_contour_that_cannot_be_simplified_is_unchanged(monkeypatch):
+    # A zigzag whose corners are all further from each other than the tolerance
+    zigzag = [('m', 0, 0)] + [('l', 10 * n, 10 * (n % 2)) for n in range(1, 8)]
+    assert simplify_contour(zigzag, 1.0) == zigzag
+
+    # A simplification that overshoots (here: drops a corner) is not used
+    monkeypatch.setattr(outline_simplify, '_simplify_once',
+                        lambda contour, tolerance: contour[:-1])
+    assert simplify_contour(zigzag, 1.0) is zigzag
@@ -0,0 +1,25 @@
+import pipeline_db
+
+
+def test_publishable_items(tmp_path):
+    conn = pipeline_db.connect(tmp_path / 'pipeline.sqlite')
+    pipeline_db.replace_items(conn, [
+        {'qid': f'Q{n}', 'label': f'nimi {n}', 'tok_title': ''} for n in range(1, 6)])
+    assert not pipeline_db.has_renders(conn)
+
+    pipeline_db.record_renders(conn, [(f'nimi {n}', f'nimi {n}.svg', 'hash')
+                                      for n in range(1, 5)], 'v1')
+    pipeline_db.set_publications(conn, [('Q1', 'nimi 1.svg', 'queued', 'shard-0001.txt'),
+                                        ('Q2', 'nimi 2.svg', 'has_p18', None),
+                                        ('Q3', 'nimi 3.svg', 'published', 'shard-0001.txt')])
+
+    assert pipeline_db.has_renders(conn)
+    assert pipeline_db.unrendered_count(conn) == 1
+    # Queued items are written again and P18 holders checked again; published are not
+    assert list(map(tuple, pipeline_db.iter_publishable(conn))) == [
+        ('Q1', 'nimi 1.svg'), ('Q2', 'nimi 2.svg'), ('Q4', 'nimi 4.svg')]
+
+    assert pipeline_db.mark_published(conn, ['Q1', 'Q3', 'Q9']) == 1
+    assert list(map(tuple, pipeline_db.iter_publishable(conn))) == [
+        ('Q2', 'nimi 2.svg'), ('Q4', 'nimi 4.svg')]
+    conn.close()
@@ -0,0 +1,31 @@
+import run_pipeline
+
+
+def test_fingerprint_covers_imported_helper_modules(tmp_path, monkeypatch):
+    scripts = tmp_path / 'scripts'
+    scripts.mkdir()
+    (scripts / 'stage.py').write_text('import json\nfrom helper import thing\n')
+    (scripts / 'helper.py').write_text('def thing():\n    import deep\n')
+    (scripts / 'deep.py').write_text('VALUE = 1\n')
+    (scripts / 'unrelated.py').write_text('VALUE = 1\n')
+    (tmp_path / 'input.txt').write_text('data\n')
+    monkeypatch.setattr(run_pipeline, 'SCRIPT_DIR', scripts)
+    monkeypatch.setattr(run_pipeline, 'ROOT_DIR', tmp_path)
+    run_pipeline.local_imports.cache_clear()
+    stage = {'command': ['stage.py'], 'inputs': ['input.txt']}
+
+    assert run_pipeline.local_imports(scripts / 'stage.py') == (
+        scripts / 'deep.py', scripts / 'helper.py')
+    before = run_pipeline.fingerprint(stage)
+    (scripts / 'unrelated.py').write_text('VALUE = 2\n')
+    assert run_pipeline.fingerprint(stage) == before
+    (scripts / 'deep.py').write_text('VALUE = 2\n')
+    assert run_pipeline.fingerprint(stage) != before
+    run_pipeline.local_imports.cache_clear()
+
+
+def test_real_stages_include_their_helpers():
+    run_pipeline.local_imports.cache_clear()
+    script = run_pipeline.SCRIPT_DIR / 'generate_quickstatements.py'
+    names = {path.name for path in run_pipeline.local_imports(script)}
+    assert {'generate_sitelen_kalama_pona.py', 'pipeline_db.py'} <= names